@@ -0,0 +1,150 @@
+from __future__ import annotations
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+import pytz
+from aiohttp import web
+from discord.ext import commands
+
+from constants import FR_TZ, TIME_FORMAT
+from exceptions import ModBotError
+from sharding import owns_guild
+from timequery import PhaseBoundary, parse_time_query
+
+log = logging.getLogger(__name__)
+
+
+class VoteAPI:
+    # read-only JSON / BBCode views of the vote cog's in-memory state, so spreadsheets and forum posts can poll
+    # vote counts without a command and a reply going through Discord each time; it binds to localhost only
+    def __init__(self, bot: commands.Bot, host: str = "127.0.0.1", port: int = 8080):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.app = web.Application()
+        self.app.add_routes(
+            [
+                web.get("/guilds/{guild_id}/votes", self.votes),
+                web.get("/guilds/{guild_id}/history", self.history),
+                web.get("/guilds/{guild_id}/phases", self.phases),
+            ]
+        )
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        log.info("Vote API listening on http://%s:%s", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _vote_cog(self, request: web.Request):
+        vote = self.bot.get_cog("Vote")
+        if not vote:
+            raise web.HTTPServiceUnavailable(reason="The vote extension is not loaded")
+        try:
+            guild_id = int(request.match_info["guild_id"])
+        except ValueError:
+            raise web.HTTPNotFound(reason="Unknown guild")
+        # games is a defaultdict, so unknown guilds are checked before it is indexed
+        if guild_id not in vote.games or not owns_guild(self.bot, guild_id):
+            raise web.HTTPNotFound(reason="Unknown guild")
+        return vote, guild_id
+
+    def _version(self, vote, guild_id: int) -> str:
+        # changes whenever a vote is cast, the phase changes or the roster is edited
+        game = vote.games[guild_id]
+        hot = vote.vote_history[guild_id]
+        last = hot[-1].time_utc.timestamp() if hot else 0
+        return f"{game.phase}|{len(hot)}|{last}|{game.roster_version}"
+
+    @staticmethod
+    def _not_modified(request: web.Request, *parts) -> str:
+        etag = '"' + hashlib.sha1("|".join(str(part) for part in (request.path_qs, *parts)).encode()).hexdigest() + '"'
+        if etag in request.headers.get("If-None-Match", ""):
+            raise web.HTTPNotModified(headers={"ETag": etag})
+        return etag
+
+    @staticmethod
+    def _respond(request: web.Request, etag: str, data: Dict, bbcode: str) -> web.Response:
+        if request.query.get("format") == "bbcode":
+            return web.Response(text=bbcode, headers={"ETag": etag})
+        return web.json_response(data, headers={"ETag": etag})
+
+    async def votes(self, request: web.Request) -> web.Response:
+        vote, guild_id = self._vote_cog(request)
+        etag = self._not_modified(request, self._version(vote, guild_id))
+        game = vote.games[guild_id]
+        votes = vote.votes[guild_id]
+        return self._respond(
+            request,
+            etag,
+            {"phase": str(game.phase), "votes": {target: voters for target, voters in votes.items() if voters}},
+            f"[b]Current Vote Count ({game.phase})[/b]: \n"
+            f"{vote._compose_votecount(votes, game.player_slot_map, format_bbcode=True)}",
+        )
+
+    async def history(self, request: web.Request) -> web.Response:
+        vote, guild_id = self._vote_cog(request)
+        query = parse_time_query(request.query.get("at", ""), now=datetime.now(tz=pytz.utc))
+        if not query:
+            raise web.HTTPBadRequest(
+                reason="`at` must be a time in FRT, a message link, `<duration> ago` or `end of D2`"
+            )
+        try:
+            msg_time = await vote._phase_boundary(guild_id, query) if isinstance(query, PhaseBoundary) else query
+        except ModBotError as e:
+            raise web.HTTPNotFound(reason=e.msg.replace("**", ""))
+        snapshot = await vote.get_vote_snapshot(guild_id=guild_id, msg_time=msg_time)
+        # the body says which time it was asked about, so a relative query like `30m ago` changes with every poll
+        etag = self._not_modified(
+            request, self._version(vote, guild_id), snapshot.time_utc.timestamp(), msg_time.timestamp()
+        )
+        return self._respond(
+            request,
+            etag,
+            {
+                "phase": str(snapshot.phase),
+                "as_of": msg_time.isoformat(),
+                "votes": {target: voters for target, voters in snapshot.votes.items() if voters},
+            },
+            f"[b]Historical Vote Count ({snapshot.phase}):[/b]\n"
+            f"{vote._compose_votecount(snapshot.votes, vote.games[guild_id].player_slot_map, format_bbcode=True)}\n"
+            f"[sup]vote count shown is as of {msg_time.astimezone(FR_TZ).strftime(TIME_FORMAT)}.[/sup]",
+        )
+
+    async def phases(self, request: web.Request) -> web.Response:
+        vote, guild_id = self._vote_cog(request)
+        await vote._ensure_history(guild_id)
+        index = await vote._get_archive_index(guild_id)
+        etag = self._not_modified(request, self._version(vote, guild_id), len(index))
+        summaries = [
+            {
+                "phase": f"{archive['phase']['phase']} {archive['phase']['num']}",
+                "start": pytz.utc.localize(archive["start"]).isoformat(),
+                "end": pytz.utc.localize(archive["end"]).isoformat(),
+            }
+            for archive in index
+        ]
+        game = vote.games[guild_id]
+        current = [hist.time_utc for hist in vote.vote_history[guild_id] if hist.phase == game.phase]
+        summaries.append({"phase": str(game.phase), "start": current[0].isoformat() if current else None, "end": None})
+        return self._respond(
+            request,
+            etag,
+            {"phases": summaries},
+            "\n".join(
+                f"[b]{summary['phase']}[/b]: {_format_time(summary['start'])} - {_format_time(summary['end'])}"
+                for summary in summaries
+            ),
+        )
+
+
+def _format_time(iso: Optional[str]) -> str:
+    return datetime.fromisoformat(iso).astimezone(FR_TZ).strftime(TIME_FORMAT) if iso else "now"
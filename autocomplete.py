@@ -0,0 +1,42 @@
+from __future__ import annotations
+from bisect import bisect_left
+from typing import Dict, Generic, Iterable, List, Tuple, TypeVar, Container
+
+from attr import define, Factory
+
+from constants import AUTOCOMPLETE_LIMIT
+from model import GamePhase
+
+T = TypeVar("T")
+
+
+@define
+class PrefixIndex(Generic[T]):
+    keys: List[str] = Factory(list)
+    values: List[T] = Factory(list)
+
+    @classmethod
+    def build(cls, items: Iterable[Tuple[str, T]]) -> PrefixIndex[T]:
+        ordered = sorted(((key.lower(), value) for key, value in items), key=lambda item: item[0])
+        return cls(keys=[key for key, _ in ordered], values=[value for _, value in ordered])
+
+    def search(self, prefix: str, limit: int = AUTOCOMPLETE_LIMIT, exclude: Container[str] = ()) -> List[T]:
+        prefix = prefix.lower()
+        results = []
+        for i in range(bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[i].startswith(prefix) or len(results) >= limit:
+                break
+            if self.keys[i] not in exclude:
+                results.append(self.values[i])
+        return results
+
+
+@define
+class AutocompleteIndex:
+    roster_version: int
+    phase: GamePhase
+    targets: PrefixIndex[str]
+    actions: Dict[str, PrefixIndex] = Factory(dict)
+
+    def is_current(self, roster_version: int, phase: GamePhase) -> bool:
+        return self.roster_version == roster_version and self.phase == phase
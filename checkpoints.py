@@ -0,0 +1,99 @@
+from __future__ import annotations
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+import pytz
+from attrs import define
+
+from constants import CHECKPOINT_LIMIT
+
+
+@define
+class Checkpoint:
+    id: int
+    label: str
+    time_utc: datetime
+    phase: Dict
+    # each cog's own idea of its state, keyed by cog name
+    states: Dict[str, Any]
+
+    def to_state(self) -> Dict:
+        return {
+            "id": self.id,
+            "label": self.label,
+            "time_utc": self.time_utc.timestamp(),
+            "phase": self.phase,
+            "states": self.states,
+        }
+
+    @classmethod
+    def from_state(cls, d: Dict) -> Checkpoint:
+        return cls(
+            id=d["id"],
+            label=d["label"],
+            time_utc=datetime.fromtimestamp(d["time_utc"], tz=pytz.utc),
+            phase=d["phase"],
+            states=d["states"],
+        )
+
+
+class CheckpointLog:
+    # the last few checkpoints of one guild, oldest first; every part of a cog's state that has not changed since
+    # the previous checkpoint, down to a single player or submission, is shared with it rather than kept twice, so
+    # a checkpoint only adds what actually changed to memory (the cogs still build their full state to compare)
+    def __init__(self, limit: int = CHECKPOINT_LIMIT):
+        self.checkpoints: Deque[Checkpoint] = deque(maxlen=limit)
+        self.next_id = 1
+
+    def take(self, label: str, time_utc: datetime, phase: Dict, states: Dict[str, Any]) -> Optional[Checkpoint]:
+        previous = self.checkpoints[-1] if self.checkpoints else None
+        if previous:
+            states = {name: _share(state, previous.states.get(name)) for name, state in states.items()}
+            # i.e. a mod command that only looked at the game, or `!phase next` right after its own checkpoint
+            if phase == previous.phase and states.keys() == previous.states.keys():
+                if all(state is previous.states[name] for name, state in states.items()):
+                    return None
+        checkpoint = Checkpoint(id=self.next_id, label=label, time_utc=time_utc, phase=phase, states=states)
+        self.next_id += 1
+        self.checkpoints.append(checkpoint)
+        return checkpoint
+
+    def get(self, checkpoint_id: int) -> Optional[Checkpoint]:
+        return next((checkpoint for checkpoint in self.checkpoints if checkpoint.id == checkpoint_id), None)
+
+    def at(self, time_utc: datetime) -> Optional[Checkpoint]:
+        # a checkpoint holds the state from just before it was taken, so the game as it was at a given time is in
+        # the first checkpoint taken after it
+        return next((checkpoint for checkpoint in self.checkpoints if checkpoint.time_utc > time_utc), None)
+
+    def recent(self, n: int) -> List[Checkpoint]:
+        return list(self.checkpoints)[-n:]
+
+    def to_state(self) -> Dict:
+        return {"next_id": self.next_id, "checkpoints": [checkpoint.to_state() for checkpoint in self.checkpoints]}
+
+    @classmethod
+    def from_state(cls, d: Dict) -> CheckpointLog:
+        log = cls()
+        log.next_id = d["next_id"]
+        log.checkpoints.extend(Checkpoint.from_state(checkpoint) for checkpoint in d["checkpoints"])
+        return log
+
+
+def _share(new: Any, old: Any) -> Any:
+    # `new` with every part that equals the same part of `old` replaced by that part of `old`
+    if new == old:
+        return old
+    if isinstance(new, dict) and isinstance(old, dict):
+        return {key: _share(value, old.get(key)) for key, value in new.items()}
+    if isinstance(new, list) and isinstance(old, list):
+        return [_share(value, old[i]) if i < len(old) else value for i, value in enumerate(new)]
+    return new
+
+
+def take_checkpoint(bot, guild_id: int, label: str, time_utc: datetime) -> None:
+    # called before anything that changes a game; does nothing when the game extension is not loaded
+    game = bot.cogs.get("Game")
+    if game:
+        game.take_checkpoint(guild_id, label, time_utc)
@@ -1,39 +1,44 @@
+import asyncio
 import random
-from typing import Dict, List, Callable, Optional
+from collections import defaultdict
+from copy import deepcopy
+from functools import partial
+from typing import Dict, Callable, Optional
 
 import discord
-from attr import define
 from discord import PermissionOverwrite, app_commands
 from discord.ext import commands
 from discord.ext.commands import Context, Cog
 
-from constants import Modifier, SideEffect
+from constants import Modifier, SideEffect, Priority, DASHBOARD_DEBOUNCE_SECONDS
 from embeds import Embed
 from exceptions import ModBotError
-from model import GameState, Player, Action, GamePhase
+from autocomplete import AutocompleteIndex, PrefixIndex
+from model import Action, GameState, Player, ActionSubmission
+from outbound import get_outbound
+from resolution import resolve_actions
+from sharding import owns_guild
+from snapshot import warm_started, mark_dirty
+from storage import get_storage
+from transition import PhaseTransition
 from utils import check_sensitive_info, check_is_mod, truncate_str
 
 
-@define
-class ActionSubmission:
-    action: Action
-    targets: List[Player]
-
-    def format_targets(self) -> str:
-        return ", ".join(target.fr_name for target in self.targets)
-
-
 class Actions(commands.Cog):
-    def __init__(self, bot: commands.Bot, game: GameState):
+    def __init__(self, bot: commands.Bot, games: Dict[int, GameState]):
         self.bot = bot
-        self.game = game
-        self.action_submissions: Dict[str, ActionSubmission] = {}
-        self.action_post: Optional[int] = None
+        self.games = games
+        self.action_submissions: Dict[int, Dict[str, ActionSubmission]] = defaultdict(dict)
+        self.action_posts: Dict[int, discord.PartialMessage] = {}
         self.side_effect_map: Dict[SideEffect, Callable] = {SideEffect.PEW_PEW: self.pew}
+        self.storage = get_storage()
+        self.outbound = get_outbound()
+        self._pending_submissions: Dict[int, Dict[str, dict]] = {}
+        self._dirty_dashboards: set[int] = set()
+        self._dashboard_tasks: Dict[int, asyncio.Task] = {}
+        self._autocomplete: Dict[int, AutocompleteIndex] = {}
 
-    group = app_commands.Group(name="actions", description="...")
-
-    @commands.group()
+    @commands.hybrid_group()
     async def actions(self, ctx: Context):
         if not ctx.invoked_subcommand:
             raise ModBotError(
@@ -42,67 +47,91 @@ class Actions(commands.Cog):
 
     @actions.command()
     @commands.check(check_is_mod)
-    async def list(self, ctx: Context, override_block=""):
-        check_sensitive_info(ctx, self.game.players, override_block)
-        await ctx.send(
+    async def list(self, ctx: Context, override_block: str = ""):
+        game = self.games[ctx.guild.id]
+        await check_sensitive_info(ctx, game.players, override_block)
+        await self.outbound.send(
+            ctx,
             embed=Embed.InfoEmbed(
-                title=f"{self.game.phase} Action Submissions",
-                body=self.format_actions(self.game, self.action_submissions),
-            )
+                title=f"{game.phase} Action Submissions",
+                body=self.format_actions(game, self.get_submissions(ctx.guild.id)),
+            ),
+        )
+
+    @actions.command()
+    @commands.check(check_is_mod)
+    async def resolve(self, ctx: Context, apply: str = ""):
+        game = self.games[ctx.guild.id]
+        resolution = resolve_actions(self.get_submissions(ctx.guild.id))
+        if apply == "apply":
+            resolution.apply()
+            game.touch_roster()
+            await mark_dirty(self.bot)
+            await self.storage.save_players(ctx.guild.id, *game.dump_players())
+            self.bot.dispatch("roster_update", ctx)
+        await self.outbound.send(
+            ctx,
+            embed=Embed.InfoEmbed(
+                title=f"{game.phase} Action Results",
+                body=resolution.format(),
+                footer=(
+                    "Deaths have been applied."
+                    if apply == "apply"
+                    else "Dry run; use `!actions resolve apply` to apply deaths."
+                ),
+            ),
         )
 
     @actions.command()
     @commands.check(check_is_mod)
     async def clear(self, ctx: Context):
-        self.action_post = None
-        self.action_submissions = {}
-        await ctx.send(embed=Embed.SuccessEmbed(body="Actions cleared successfully!"))
+        await self.clear_submissions(ctx.guild.id)
+        await self.outbound.send(ctx, embed=Embed.SuccessEmbed(body="Actions cleared successfully!"))
 
     @actions.command()
-    async def view(self, ctx: Context, fr_name="", override_block=""):
+    async def view(self, ctx: Context, fr_name: str = "", override_block: str = ""):
+        game = self.games[ctx.guild.id]
         if fr_name and not ctx.author.guild_permissions.administrator:
             raise ModBotError(
                 "Only mods are allowed to use `!actions view <FR name>`!\n"
                 "If you are a player, use `!actions view` to get your available actions."
             )
-        if (
-            ctx.channel.category.id != self.game.config.private_category
-            and not ctx.author.guild_permissions.administrator
-        ):
+        if ctx.channel.category.id != game.config.private_category and not ctx.author.guild_permissions.administrator:
             raise ModBotError("`!actions view` can only be used in private channels!")
-        target_player = self.game.player_from_id(ctx.author.id)
+        target_player = game.player_from_id(ctx.author.id)
         if not target_player and not fr_name:
             raise ModBotError(
                 "Only players can use `!actions view`!\n"
                 "If you are a mod, use `!actions view <FR name>` to get the actions of a player."
             )
         elif not target_player and fr_name:
-            target_player = self.game.player_from_fr(fr_name)
+            target_player = game.player_from_fr(fr_name)
             if not target_player:
                 raise ModBotError(f"{fr_name} is not a valid player!")
-            check_sensitive_info(ctx, self.game.players, override_block=override_block, ignore=[target_player])
+            await check_sensitive_info(ctx, game.players, override_block=override_block, ignore=[target_player])
         if not target_player.role_card:
             raise ModBotError(f"{target_player} has no rolecard yet! Have you `!roles rand`ed yet?")
 
-        available_actions_str = target_player.role_card.format_available_actions(self.game.phase.phase)
-        curr_action = self.action_submissions.get(target_player.fr_name)
+        available_actions_str = target_player.role_card.format_available_actions(game.phase.phase)
+        curr_action = self.get_submissions(ctx.guild.id).get(target_player.fr_name)
         if curr_action:
             curr_action_str = f"You are currently using **{curr_action.action.name}**{' on ' + curr_action.format_targets() if curr_action.targets else ''}."
         else:
             curr_action_str = ""
         embed = Embed.InfoEmbed(
             title=f"{target_player.fr_name}'s Actions",
-            body=f"{available_actions_str}\n\n" f"It is now **{self.game.phase.phase}** phase." f"\n{curr_action_str}",
+            body=f"{available_actions_str}\n\n" f"It is now **{game.phase.phase}** phase." f"\n{curr_action_str}",
         )
-        await ctx.send(embed=embed)
+        await self.outbound.send(ctx, embed=embed)
 
     @actions.command(aliases=["use", "sub"])
     async def submit(self, ctx: Context, action_name: str = "", *, targets: str = ""):
-        player = self.game.player_from_id(ctx.author.id)
+        game = self.games[ctx.guild.id]
+        player = game.player_from_id(ctx.author.id)
         if not player or not player.alive:
             raise ModBotError(f"Only (alive) players can submit actions!")
         if (
-            ctx.channel.category.id != self.game.config.private_category
+            ctx.channel.category.id != game.config.private_category
             or ctx.channel.name.lower() != player.fr_name.lower()
         ):
             raise ModBotError(f"You can only submit actions in your private channel!")
@@ -115,15 +144,15 @@ class Actions(commands.Cog):
             raise ModBotError(
                 f"Action '{action_name}' not found!\n Use `!actions view` to see the actions available to you."
             )
-        if not action.can_use_in_phase(self.game.phase.phase):
-            raise ModBotError(f"Action '{action_name}' cannot be used in {self.game.phase.phase} phase!")
+        if not action.can_use_in_phase(game.phase.phase):
+            raise ModBotError(f"Action '{action_name}' cannot be used in {game.phase.phase} phase!")
         targets = targets.split()
         if len(targets) != action.targets:
             raise ModBotError(
                 f"Action {action.name} requires {action.targets} targets, but only {len(targets)} were given!"
             )
         for target in targets:
-            target_player = self.game.player_from_fr(target)
+            target_player = game.player_from_fr(target)
             if not target_player:
                 raise ModBotError(
                     f"Action target '{target}' cannot be found! Please enter their FR name (case insensitive).\n"
@@ -136,13 +165,15 @@ class Actions(commands.Cog):
                 )
             if target_player == player and not action.self_targetable:
                 raise ModBotError(f"You cannot target yourself with this action!")
-        action_sub = ActionSubmission(action=action, targets=[self.game.player_from_fr(target) for target in targets])
+        action_sub = ActionSubmission(action=action, targets=[game.player_from_fr(target) for target in targets])
         if Modifier.LIGHTNING not in action.modifiers:
-            self.action_submissions[player.fr_name] = action_sub
-        await ctx.send(
+            self.get_submissions(ctx.guild.id)[player.fr_name] = action_sub
+            await self._persist_submission(ctx.guild.id, player.fr_name, action_sub)
+        await self.outbound.send(
+            ctx,
             embed=Embed.SuccessEmbed(
-                body=f"Action **{action.name}** submitted on target(s) {action_sub.format_targets()} for {self.game.phase}!"
-            )
+                body=f"Action **{action.name}** submitted on target(s) {action_sub.format_targets()} for {game.phase}!"
+            ),
         )
         await self.on_submit(ctx, player=player, action_sub=action_sub)
 
@@ -155,37 +186,65 @@ class Actions(commands.Cog):
                     await side_eff_callable(ctx, player=player, action_sub=action_sub)
         actions_channel = await self.get_create_actions_channel(ctx)
         if Modifier.LIGHTNING in action.modifiers:
-            await actions_channel.send(
+            await self.outbound.send(
+                actions_channel,
+                priority=Priority.HIGH,
                 embed=Embed.InfoEmbed(
                     title="Lightning Action!",
                     body=f"**{player}** has used **{action.name}**{(' on ' + action_sub.format_targets()) if targets else ''}!",
-                )
+                ),
             )
-            self.deplete_action_shots(action, player.actions)
+            self._use_shot(ctx.guild.id, player, action)
         else:
-            embed = Embed.InfoEmbed(
-                title=f"{self.game.phase} Action Submissions",
-                body=self.format_actions(self.game, self.action_submissions),
-            )
-            if not self.action_post:
-                msg = await actions_channel.send(embed=embed)
-                self.action_post = msg.id
-            else:
-                msg = await actions_channel.fetch_message(self.action_post)
-                await msg.edit(embed=embed)
+            self.schedule_dashboard_update(ctx.guild.id, actions_channel)
+
+    def schedule_dashboard_update(self, guild_id: int, actions_channel: discord.TextChannel):
+        self._dirty_dashboards.add(guild_id)
+        if guild_id not in self._dashboard_tasks:
+            self._dashboard_tasks[guild_id] = asyncio.create_task(self._flush_dashboard(guild_id, actions_channel))
+
+    async def _flush_dashboard(self, guild_id: int, actions_channel: discord.TextChannel):
+        try:
+            while guild_id in self._dirty_dashboards:
+                await asyncio.sleep(DASHBOARD_DEBOUNCE_SECONDS)
+                if guild_id not in self._dirty_dashboards:
+                    # submissions were cleared while we were waiting
+                    break
+                self._dirty_dashboards.discard(guild_id)
+                game = self.games[guild_id]
+                embed = Embed.InfoEmbed(
+                    title=f"{game.phase} Action Submissions",
+                    body=self.format_actions(game, self.get_submissions(guild_id)),
+                )
+                msg = self.action_posts.get(guild_id)
+                if msg:
+                    try:
+                        await self.outbound.edit(msg, embed=embed)
+                        continue
+                    except discord.NotFound:
+                        pass
+                msg = await self.outbound.send(actions_channel, priority=Priority.HIGH, embed=embed)
+                self.action_posts[guild_id] = actions_channel.get_partial_message(msg.id)
+                await mark_dirty(self.bot)
+                await self.storage.save_action_post(guild_id, actions_channel.id, msg.id)
+        finally:
+            self._dashboard_tasks.pop(guild_id, None)
 
     async def pew(self, ctx: Context, player: Player, action_sub: ActionSubmission):
         target = action_sub.targets[0]
         announce_channel = await self.get_create_announce_channel(ctx)
         reveals_shooter = bool(random.randint(0, 1))
-        await announce_channel.send(
+        await self.outbound.send(
+            announce_channel,
+            priority=Priority.CRITICAL,
             embed=Embed.LightningEmbed(
                 title="A shot rings out!",
                 body=f"{player if reveals_shooter else 'A player'} pew-pews {target}!\n"
                 f"{target} was **{target.flips_as}**.",
-            )
+            ),
         )
         target.alive = False
+        self.games[ctx.guild.id].touch_roster()
 
     @staticmethod
     def format_actions(game: GameState, actions: Dict[str, ActionSubmission]) -> str:
@@ -195,87 +254,213 @@ class Actions(commands.Cog):
             body += f"{player} uses **{action.action.name}**{' on ' + action.format_targets()}\n"
         return body
 
-    @staticmethod
-    def deplete_action_shots(action: Action, actions: List[Action]) -> None:
-        if action.shots is None:
-            return
-        action.shots -= 1
-        if action.shots == 0:
-            actions.remove(action)
-
     async def get_create_announce_channel(self, ctx: Context):
-        announce_channel = self.bot.get_channel(self.game.config.announce_channel)
+        game = self.games[ctx.guild.id]
+        announce_channel = self.bot.get_channel(game.config.announce_channel)
         if not announce_channel:
             perm_overwrites = {ctx.guild.default_role: PermissionOverwrite(send_messages=False)}
             announce_channel = await ctx.guild.create_text_channel(name="announcements", overwrites=perm_overwrites)
-            self.game.config.announce_channel = announce_channel.id
+            game.config.announce_channel = announce_channel.id
         return announce_channel
 
     async def get_create_actions_channel(self, ctx: Context):
-        actions_channel = self.bot.get_channel(self.game.config.actions_channel)
+        game = self.games[ctx.guild.id]
+        actions_channel = self.bot.get_channel(game.config.actions_channel)
         if not actions_channel:
             perm_overwrites = {ctx.guild.default_role: PermissionOverwrite(read_messages=False)}
             actions_channel = await ctx.guild.create_text_channel(name="action-submissions", overwrites=perm_overwrites)
-            self.game.config.actions_channel = actions_channel.id
+            game.config.actions_channel = actions_channel.id
         return actions_channel
 
-    @Cog.listener("on_phase_change")
-    async def on_phase_change(self, ctx: Context, old_phase: GamePhase, new_phase: GamePhase):
-        for fr_name, action in self.action_submissions.items():
-            player = self.game.player_from_fr(fr_name)
-            self.deplete_action_shots(action.action, player.actions)
-        self.action_post = None
-        self.action_submissions = {}
+    def get_submissions(self, guild_id: int) -> Dict[str, ActionSubmission]:
+        pending = self._pending_submissions.pop(guild_id, None)
+        if pending:
+            game = self.games[guild_id]
+            for fr_name, d in pending.items():
+                player = game.player_from_fr(fr_name)
+                action_sub = ActionSubmission.from_dict(d, player=player, game=game) if player else None
+                if action_sub:
+                    self.action_submissions[guild_id][player.fr_name] = action_sub
+        return self.action_submissions[guild_id]
+
+    async def clear_submissions(self, guild_id: int):
+        self._reset_submissions(guild_id)
+        await mark_dirty(self.bot)
+        await self.storage.clear_action_submissions(guild_id)
+
+    def _reset_submissions(self, guild_id: int):
+        self._pending_submissions.pop(guild_id, None)
+        self._dirty_dashboards.discard(guild_id)
+        self.action_posts.pop(guild_id, None)
+        self.action_submissions[guild_id] = {}
+
+    async def _persist_submission(self, guild_id: int, fr_name: str, action_sub: ActionSubmission):
+        await mark_dirty(self.bot)
+        await self.storage.save_action_submission(guild_id, fr_name, action_sub.to_dict())
+
+    def prepare_transition(self, ctx: Context, transition: PhaseTransition):
+        game = self.games[transition.guild_id]
+        submissions = self.get_submissions(transition.guild_id)
+        transition.on_failure(
+            partial(
+                self._undo_transition,
+                transition.guild_id,
+                submissions,
+                self.action_posts.get(transition.guild_id),
+                {fr_name: dict(game.player_from_fr(fr_name).role_card.shots) for fr_name in submissions},
+            )
+        )
+        for fr_name, action in submissions.items():
+            player = game.player_from_fr(fr_name)
+            self._use_shot(transition.guild_id, player, action.action)
+        if submissions:
+            transition.players = game.dump_players()
+        self._reset_submissions(transition.guild_id)
+        transition.clear_actions = True
+
+    def _undo_transition(
+        self,
+        guild_id: int,
+        submissions: Dict[str, ActionSubmission],
+        post: Optional[discord.PartialMessage],
+        shots: Dict[str, Dict[str, int]],
+    ):
+        game = self.games[guild_id]
+        for fr_name, player_shots in shots.items():
+            game.player_from_fr(fr_name).role_card.shots = player_shots
+        self._autocomplete.pop(guild_id, None)
+        self.action_submissions[guild_id] = submissions
+        if post:
+            self.action_posts[guild_id] = post
+
+    def checkpoint_state(self, guild_id: int) -> Dict:
+        return {fr_name: action_sub.to_dict() for fr_name, action_sub in self.get_submissions(guild_id).items()}
+
+    def restore_checkpoint(self, ctx: Context, transition: PhaseTransition, state: Optional[Dict]):
+        transition.on_failure(
+            partial(
+                self._undo_transition,
+                transition.guild_id,
+                self.get_submissions(transition.guild_id),
+                self.action_posts.get(transition.guild_id),
+                {},
+            )
+        )
+        self._reset_submissions(transition.guild_id)
+        if state:
+            self._pending_submissions[transition.guild_id] = deepcopy(state)
+        transition.clear_actions = True
+        transition.action_submissions = deepcopy(state)
+
+    def dump_state(self) -> Dict[int, Dict]:
+        states = {}
+        for guild_id in set(self.action_submissions) | set(self._pending_submissions) | set(self.action_posts):
+            post = self.action_posts.get(guild_id)
+            states[guild_id] = {
+                "submissions": {
+                    fr_name: action_sub.to_dict() for fr_name, action_sub in self.get_submissions(guild_id).items()
+                },
+                "post": [post.channel.id, post.id] if post else None,
+            }
+        return states
+
+    def load_state(self, guild_id: int, state: Dict):
+        self._pending_submissions[guild_id] = state.get("submissions", {})
+        if state.get("post"):
+            channel_id, msg_id = state["post"]
+            self.action_posts[guild_id] = self.bot.get_partial_messageable(channel_id).get_partial_message(msg_id)
+
+    @Cog.listener("on_ready")
+    async def _setup(self):
+        if warm_started(self.bot):
+            return
+        for guild_id, doc in (await self.storage.load_action_submissions()).items():
+            if not owns_guild(self.bot, guild_id):
+                continue
+            self.load_state(guild_id, doc)
 
     @actions.command()
     async def help(self, ctx: Context):
-        await ctx.send(
+        await self.outbound.send(
+            ctx,
             embed=Embed.InfoEmbed(
                 body="### For mods:\n"
                 "- `!actions view <FR name>`: see the actions available to a player in the current phase.\n"
                 "- `!actions list`: see all actions submitted in the current phase.\n"
+                "- `!actions resolve`: resolve all submitted actions by priority (blocks, redirects, then kills) and report the results.\n"
+                "- `!actions resolve apply`: resolve all submitted actions and apply the resulting deaths.\n"
                 "- `!actions clear`: clear all actions submitted for the current phase.\n"
                 "### For players:\n"
                 "- `!actions view`: see the actions available to you in the current phase.\n"
                 "- `!actions submit <action name> <target(s)>` or `!actions use <action name> <target(s)>`: submit action.\n"
-            )
+            ),
         )
 
-    @group.command(name="submit", description="Submit an action.")
-    async def slash_submit(
-        self, interaction: discord.Interaction, action: str, target: str, target_2: Optional[str]
-    ) -> None:
-        ctx = await self.bot.get_context(interaction)
-        targets = f" ".join(target for target in [target, target_2] if target)
-        try:
-            await self.submit(ctx, action_name=action, targets=targets)
-        except ModBotError as e:
-            await interaction.response.send_message(embed=Embed.ErrorEmbed(body=f"{e.msg}"), ephemeral=True)
+    def _get_autocomplete_index(self, guild_id: int) -> AutocompleteIndex:
+        game = self.games[guild_id]
+        index = self._autocomplete.get(guild_id)
+        if not index or not index.is_current(game.roster_version, game.phase):
+            index = AutocompleteIndex(
+                roster_version=game.roster_version,
+                phase=game.phase,
+                targets=PrefixIndex.build(
+                    (player.fr_name, app_commands.Choice(name=player.fr_name, value=player.fr_name))
+                    for player in game.players
+                    if player.alive
+                ),
+            )
+            self._autocomplete[guild_id] = index
+        return index
+
+    def _get_player_action_index(self, guild_id: int, player: Player) -> PrefixIndex:
+        index = self._get_autocomplete_index(guild_id)
+        if player.fr_name not in index.actions:
+            index.actions[player.fr_name] = PrefixIndex.build(
+                (
+                    action.name,
+                    app_commands.Choice(name=truncate_str(f"{action.name} - {action.desc}"), value=action.name),
+                )
+                for action in player.role_card.get_available_actions(index.phase.phase)
+            )
+        return index.actions[player.fr_name]
 
-    @slash_submit.autocomplete("action")
+    def _use_shot(self, guild_id: int, player: Player, action: Action):
+        player.role_card.use_shot(action)
+        # the roster version does not change, so the cached list of the player's actions is dropped here instead
+        index = self._autocomplete.get(guild_id)
+        if index:
+            index.actions.pop(player.fr_name, None)
+
+    @submit.autocomplete("action_name")
     async def _get_action_options(self, interaction: discord.Interaction, current: str):
-        player = self.game.player_from_id(interaction.user.id)
+        game = self.games[interaction.guild_id]
+        player = game.player_from_id(interaction.user.id)
         if not (player and player.role_card):
             return [app_commands.Choice(name=f"No rolecard found :(", value="invalid action")]
-        available_actions = player.role_card.get_available_actions(self.game.phase.phase)
-        if not available_actions:
+        action_index = self._get_player_action_index(interaction.guild_id, player)
+        if not action_index.keys:
             return [app_commands.Choice(name=f"No available abilities this phase :(", value="invalid action")]
-        return [
-            app_commands.Choice(name=truncate_str(f"{action.name} - {action.desc}"), value=action.name)
-            for action in available_actions
-        ]
+        return action_index.search(current)
 
-    @slash_submit.autocomplete("target")
-    @slash_submit.autocomplete("target_2")
+    @submit.autocomplete("targets")
     async def _get_target_options(self, interaction: discord.Interaction, current: str):
-        player = self.game.player_from_id(interaction.user.id)
+        game = self.games[interaction.guild_id]
+        player = game.player_from_id(interaction.user.id)
         if not (player and player.role_card):
             return [app_commands.Choice(name="No rolecard found :(", value="invalid target")]
-        excluded_players = set()
-        if not player.role_card.get_action_from_name(interaction.namespace.action).self_targetable:
-            excluded_players.add(player.fr_name)
+        # every target goes in the one option, so only the last name typed is completed
+        *chosen, last = current.split(" ") if current else [""]
+        excluded_players = {name.lower() for name in chosen}
+        action = player.role_card.get_action_from_name(interaction.namespace.action_name or "")
+        if not (action and action.self_targetable):
+            excluded_players.add(player.fr_name.lower())
         return [
-            app_commands.Choice(name=player.fr_name, value=player.fr_name)
-            for player in self.game.players
-            if player.alive and player.fr_name not in excluded_players
+            app_commands.Choice(name=" ".join([*chosen, choice.name]), value=" ".join([*chosen, choice.value]))
+            for choice in self._get_autocomplete_index(interaction.guild_id).targets.search(
+                last, exclude=excluded_players
+            )
         ]
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Actions(bot=bot, games=bot.games))
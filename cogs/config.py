@@ -0,0 +1,122 @@
+import logging
+import os
+from typing import Dict, List
+
+from discord.ext import commands, tasks
+from discord.ext.commands import Context
+
+from constants import CONFIG_WATCH_INTERVAL
+from embeds import Embed
+from exceptions import ModBotError, ConfigError
+from guild_config import load_guild_settings
+from model import GameState
+from outbound import get_outbound
+from sharding import owns_guild
+from utils import check_is_mod
+
+log = logging.getLogger(__name__)
+
+
+class Configs(commands.Cog):
+    def __init__(self, bot: commands.Bot, games: Dict[int, GameState], path: str = "config.yaml"):
+        self.bot = bot
+        self.games = games
+        self.path = path
+        self._mtime = os.stat(path).st_mtime
+        self.outbound = get_outbound()
+
+    async def cog_load(self) -> None:
+        self.watch.start()
+
+    async def cog_unload(self) -> None:
+        self.watch.cancel()
+
+    @commands.group()
+    async def config(self, ctx: Context):
+        if not ctx.invoked_subcommand:
+            raise ModBotError("Invalid command used! Use `!config help` to see available commands.")
+
+    @config.command()
+    @commands.check(check_is_mod)
+    async def reload(self, ctx: Context):
+        changes = self.reload_config().get(ctx.guild.id)
+        await self.outbound.send(
+            ctx,
+            embed=Embed.SuccessEmbed(
+                title="Config reloaded!",
+                body="\n".join(f"- `{change}`" for change in changes) if changes else "Nothing has changed.",
+            ),
+        )
+
+    @config.command()
+    @commands.check(check_is_mod)
+    async def extension(self, ctx: Context, action: str = "", name: str = ""):
+        action = action.lower()
+        if action not in ("load", "unload", "reload") or not name:
+            raise ModBotError(
+                "Invalid command used!\n\n"
+                "Examples:\n"
+                "- `!config extension load actions`\n"
+                "- `!config extension reload vote`\n"
+                "- `!config extension unload roles`"
+            )
+        if action == "unload" and name == "config":
+            raise ModBotError("The config extension cannot be unloaded, it would take this command with it!")
+        try:
+            await getattr(self.bot, f"{action}_extension")(f"cogs.{name}")
+        except commands.ExtensionError as e:
+            raise ModBotError(f"Could not {action} `{name}`: {e}")
+        # the slash versions of the extension's commands only appear or disappear once the tree is synced
+        await self.bot.tree.sync()
+        await self.outbound.send(ctx, embed=Embed.SuccessEmbed(body=f"Extension `{name}` {action}ed!"))
+
+    @config.command()
+    async def help(self, ctx: Context):
+        await self.outbound.send(
+            ctx,
+            embed=Embed.InfoEmbed(
+                body="### For mods:\n"
+                f"- `!config reload`: reload `{self.path}` and apply any changes to the running game.\n"
+                "- `!config extension <load|unload|reload> <name>`: load, unload or reload a bot module "
+                "(i.e. `vote`) without restarting. Games keep their state.\n\n"
+                f"The config file is also checked for changes every {CONFIG_WATCH_INTERVAL} seconds."
+            ),
+        )
+
+    def reload_config(self) -> Dict[int, List[str]]:
+        self._mtime = os.stat(self.path).st_mtime
+        settings = {
+            guild_id: guild_settings
+            for guild_id, guild_settings in load_guild_settings(self.path).items()
+            if owns_guild(self.bot, guild_id)
+        }
+        # everything is validated and diffed before any game is touched, and nothing below awaits,
+        # so commands never see a half-applied config
+        changes = {}
+        for guild_id, guild_settings in settings.items():
+            if guild_id in self.games:
+                changes[guild_id] = guild_settings.diff(self.games[guild_id])
+        for guild_id, guild_settings in settings.items():
+            if guild_id in self.games:
+                guild_settings.apply(self.games[guild_id])
+            else:
+                self.games[guild_id] = guild_settings.to_gamestate()
+                changes[guild_id] = ["new guild added"]
+        return changes
+
+    @tasks.loop(seconds=CONFIG_WATCH_INTERVAL)
+    async def watch(self):
+        try:
+            if os.stat(self.path).st_mtime == self._mtime:
+                return
+            changes = self.reload_config()
+        except (OSError, ConfigError) as e:
+            log.warning("Config reload failed: %s", e)
+            return
+        for guild_id, guild_changes in changes.items():
+            if guild_changes:
+                log.info("Config reloaded for guild %s: %s", guild_id, ", ".join(guild_changes))
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Configs(bot=bot, games=bot.games, path=bot.config_path))
@@ -0,0 +1,155 @@
+import asyncio
+from datetime import datetime
+from functools import partial
+from typing import Dict
+
+import attrs
+from discord.ext import commands
+from discord.ext.commands import Context
+
+from checkpoints import Checkpoint, CheckpointLog
+from embeds import Embed
+from exceptions import ModBotError
+from model import GameState, GamePhase
+from outbound import get_outbound
+from snapshot import mark_dirty
+from storage import get_storage
+from timequery import PhaseBoundary, parse_time_query
+from transition import PhaseTransition
+from utils import check_is_mod, truncate_str
+
+
+class Game(commands.Cog):
+    def __init__(self, bot: commands.Bot, games: Dict[int, GameState]):
+        self.bot = bot
+        self.games = games
+        self.storage = get_storage()
+        self.outbound = get_outbound()
+        self.logs: Dict[int, CheckpointLog] = {}
+
+    @commands.hybrid_group()
+    async def game(self, ctx: Context):
+        if not ctx.invoked_subcommand:
+            raise ModBotError("Invalid command used! Use `!game help` to see available commands.")
+
+    def take_checkpoint(self, guild_id: int, label: str, time_utc: datetime):
+        states = {
+            cog.qualified_name: cog.checkpoint_state(guild_id)
+            for cog in self.bot.cogs.values()
+            if hasattr(cog, "checkpoint_state")
+        }
+        if guild_id not in self.logs:
+            self.logs[guild_id] = CheckpointLog()
+        self.logs[guild_id].take(label, time_utc, attrs.asdict(self.games[guild_id].phase), states)
+
+    @game.command()
+    @commands.check(check_is_mod)
+    async def checkpoints(self, ctx: Context):
+        log = self.logs.get(ctx.guild.id)
+        if not log or not log.checkpoints:
+            raise ModBotError("There are no checkpoints yet! One is taken before every mod command and phase change.")
+        await self.outbound.send(
+            ctx,
+            embed=Embed.InfoEmbed(
+                title="Checkpoints",
+                body="\n".join(
+                    f"- **#{checkpoint.id}** <t:{int(checkpoint.time_utc.timestamp())}:R>: "
+                    f"{GamePhase(**checkpoint.phase)}, before `{truncate_str(checkpoint.label, 60)}`"
+                    for checkpoint in reversed(log.recent(15))
+                ),
+                footer="Use !game rollback <number> to go back to one of these.",
+            ),
+        )
+
+    @game.command()
+    @commands.check(check_is_mod)
+    async def rollback(self, ctx: Context, *, checkpoint: str = ""):
+        target = await self._find_checkpoint(ctx, checkpoint)
+        await self.restore(ctx, target)
+        await self.outbound.send(
+            ctx,
+            embed=Embed.SuccessEmbed(
+                body=f"Rolled back to checkpoint **#{target.id}**, from before `{truncate_str(target.label, 60)}`. "
+                f"It is now **{self.games[ctx.guild.id].phase}**!\n\n"
+                "Discord roles and channel permissions were not changed. Use `!game rollback` again with the "
+                "newest checkpoint to undo this."
+            ),
+        )
+
+    async def _find_checkpoint(self, ctx: Context, query: str) -> Checkpoint:
+        log = self.logs.get(ctx.guild.id)
+        if not log or not log.checkpoints:
+            raise ModBotError("There are no checkpoints to roll back to!")
+        query = query.strip().removeprefix("#")
+        # checkpoint numbers are small, message ids are snowflakes
+        if query.isdigit() and len(query) < 10:
+            checkpoint = log.get(int(query))
+            if not checkpoint:
+                raise ModBotError(f"There is no checkpoint **#{query}**! Use `!game checkpoints` to see them.")
+            return checkpoint
+        when = parse_time_query(query, now=ctx.message.created_at)
+        if isinstance(when, PhaseBoundary):
+            vote = self.bot.get_cog("Vote")
+            if not vote:
+                raise ModBotError("Phase start and end times need the vote module to be enabled!")
+            when = await vote._phase_boundary(ctx.guild.id, when)
+        if not when:
+            raise ModBotError(
+                "Give a checkpoint number, a time in FRT or a message link!\n\n"
+                "Examples:\n"
+                "- `!game rollback 12`\n"
+                "- `!game rollback 10m ago`\n"
+                "- `!game rollback 2024-01-01 00:30:00`\n"
+                "- `!game rollback end of D2`"
+            )
+        checkpoint = log.at(when)
+        if not checkpoint:
+            raise ModBotError("Nothing has changed since then!")
+        return checkpoint
+
+    async def restore(self, ctx: Context, checkpoint: Checkpoint):
+        game = self.games[ctx.guild.id]
+        transition = PhaseTransition(
+            guild_id=ctx.guild.id, old_phase=game.phase, new_phase=GamePhase(**checkpoint.phase)
+        )
+        game.phase = transition.new_phase
+        transition.on_failure(partial(setattr, game, "phase", transition.old_phase))
+        # the same pipeline as a phase change: every cog puts back its part of the checkpoint in memory, then
+        # all of it is written at once, and if that fails every cog undoes its part again
+        for cog in self.bot.cogs.values():
+            if hasattr(cog, "restore_checkpoint"):
+                cog.restore_checkpoint(ctx, transition, checkpoint.states.get(cog.qualified_name))
+        try:
+            await mark_dirty(self.bot)
+            await self.storage.commit_transition(transition)
+        except Exception:
+            transition.revert()
+            raise
+        await asyncio.gather(*(announce() for announce in transition.announcements))
+        if transition.new_phase != transition.old_phase:
+            self.bot.dispatch("phase_change", ctx, transition.old_phase, transition.new_phase)
+
+    @game.command()
+    async def help(self, ctx: Context):
+        await self.outbound.send(
+            ctx,
+            embed=Embed.InfoEmbed(
+                body="### For mods:\n"
+                "- `!game checkpoints`: list the most recent checkpoints. One is taken before every mod command "
+                "and every phase change.\n"
+                "- `!game rollback <checkpoint number>`: put the phase, players, votes and action submissions back "
+                "to how they were at that checkpoint.\n"
+                "- `!game rollback <time in FRT or message link>`: roll back to how the game was at that time "
+                "(i.e. `!game rollback 10m ago`)."
+            ),
+        )
+
+    def dump_state(self) -> Dict[int, Dict]:
+        return {guild_id: log.to_state() for guild_id, log in self.logs.items()}
+
+    def load_state(self, guild_id: int, state: Dict):
+        self.logs[guild_id] = CheckpointLog.from_state(state)
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Game(bot=bot, games=bot.games))
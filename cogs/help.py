@@ -1,23 +1,20 @@
 from discord.ext import commands
 from discord.ext.commands import Context
 
-from cogs.actions import Actions
-from cogs.phase import Phases
-from cogs.rand import Random
-from cogs.roles import Roles
-from cogs.vote import Vote
-from cogs.player import Players
 from embeds import Embed
+from exceptions import ModBotError
 
 
 class Help(commands.Cog):
-    def __init__(self, phase: Phases, player: Players, roles: Roles, vote: Vote, actions: Actions, random: Random):
-        self.phase = phase
-        self.player = player
-        self.roles = roles
-        self.vote = vote
-        self.actions = actions
-        self.random = random
+    def __init__(self, bot: commands.Bot):
+        # modules are looked up when asked for, since any of them can be reloaded or left disabled
+        self.bot = bot
+
+    async def _module_help(self, ctx: Context, cog_name: str):
+        cog = self.bot.get_cog(cog_name)
+        if not cog:
+            raise ModBotError(f"The {cog_name.lower()} module is not enabled!")
+        await cog.help(ctx)
 
     @commands.group()
     async def help(self, ctx: Context):
@@ -28,6 +25,7 @@ class Help(commands.Cog):
                     body="- **player**: (for mods) deals with matters with the playerlist.\n"
                     "- **roles**: (for mods) deal with matters of rolecards & role assignments.\n"
                     "- **phase**: (for mods) modify / switch game phases.\n"
+                    "- **game**: (for mods) roll the game back to an earlier checkpoint.\n"
                     "- **vote**: cast votes and query votecounts.\n"
                     "- **actions**: submit game actions.\n"
                     "- **random**: ask the bot to randomize things for you.\n"
@@ -37,24 +35,32 @@ class Help(commands.Cog):
 
     @help.command()
     async def player(self, ctx: Context):
-        await self.player.help(ctx)
+        await self._module_help(ctx, "Players")
 
     @help.command()
     async def roles(self, ctx: Context):
-        await self.roles.help(ctx)
+        await self._module_help(ctx, "Roles")
 
     @help.command()
     async def phase(self, ctx: Context):
-        await self.phase.help(ctx)
+        await self._module_help(ctx, "Phases")
+
+    @help.command()
+    async def game(self, ctx: Context):
+        await self._module_help(ctx, "Game")
 
     @help.command()
     async def vote(self, ctx: Context):
-        await self.vote.help(ctx)
+        await self._module_help(ctx, "Vote")
 
     @help.command()
     async def actions(self, ctx: Context):
-        await self.actions.help(ctx)
+        await self._module_help(ctx, "Actions")
 
     @help.command()
     async def random(self, ctx: Context):
-        await self.random.help(ctx)
\ No newline at end of file
+        await self._module_help(ctx, "Random")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Help(bot=bot))
@@ -1,16 +1,25 @@
-import re
-from typing import Dict
+import asyncio
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Dict, Hashable, Optional
 
 import attrs
+import pytz
 from discord.ext import commands
 from discord.ext.commands import Context, Cog
 from discord.ext.commands._types import BotT
 
-from constants import Phase
-from db_client import DBClient, get_db
+from checkpoints import take_checkpoint
+from constants import Priority, DEADLINE_REMINDERS
 from embeds import Embed
 from exceptions import ModBotError
 from model import GameState, GamePhase
+from outbound import get_outbound
+from sharding import owns_guild
+from snapshot import warm_started, mark_dirty
+from storage import get_storage
+from timers import Timers, ScheduledContext, parse_deadline
+from transition import PhaseTransition
 from utils import check_is_mod
 
 
@@ -18,26 +27,62 @@ class Phases(commands.Cog):
     def __init__(self, bot: commands.Bot, games: Dict[int, GameState]):
         self.bot: commands.Bot = bot
         self.games: Dict[int, GameState] = games
-        self.db = get_db()
+        self.storage = get_storage()
+        self.outbound = get_outbound()
+        self.timers = Timers(self._on_timer)
 
-    @commands.group(invoke_without_command=True)
+    async def cog_load(self) -> None:
+        # on_ready has already fired when the extension is reloaded at runtime
+        if self.bot.is_ready():
+            await self._load_deadlines()
+
+    async def cog_unload(self) -> None:
+        self.timers.stop()
+
+    @commands.hybrid_group(invoke_without_command=True)
     async def phase(self, ctx: Context):
         raise ModBotError("Invalid command used! Use `!vote help` to see available commands.")
 
     @phase.command()
     @commands.check(check_is_mod)
     async def next(self, ctx: Context):
-        game = self.games[ctx.guild.id]
-        old_phase = game.phase
-        game.phase = game.phase.next()
-        self.bot.dispatch("phase_change", ctx, old_phase, game.phase)
+        await ctx.defer()
+        await self.advance(ctx)
         # the success message is handled in vote cog
 
+    async def advance(self, ctx: Context):
+        game = self.games[ctx.guild.id]
+        take_checkpoint(self.bot, ctx.guild.id, f"{game.phase} ended", ctx.message.created_at)
+        transition = PhaseTransition(guild_id=ctx.guild.id, old_phase=game.phase, new_phase=game.phase.next())
+        deadline = self.timers.get((ctx.guild.id, "deadline"))
+        game.phase = transition.new_phase
+        self._schedule_deadline(ctx.guild.id, None)
+        transition.on_failure(partial(self._undo_advance, game, transition.old_phase, ctx.guild.id, deadline))
+        # every cog applies its part in memory first, then the whole transition is written at once, so a crash
+        # leaves the stored game either fully before or fully after the change; if the write fails, every cog puts
+        # its part back
+        for cog in self.bot.cogs.values():
+            if hasattr(cog, "prepare_transition"):
+                cog.prepare_transition(ctx, transition)
+        try:
+            await mark_dirty(self.bot)
+            await self.storage.commit_transition(transition)
+        except Exception:
+            transition.revert()
+            raise
+        await asyncio.gather(*(announce() for announce in transition.announcements))
+        self.bot.dispatch("phase_change", ctx, transition.old_phase, transition.new_phase)
+
+    def _undo_advance(self, game: GameState, phase: GamePhase, guild_id: int, deadline: Optional[datetime]):
+        game.phase = phase
+        self._schedule_deadline(guild_id, deadline)
+
     @phase.command()
     @commands.check(check_is_mod)
     async def set(self, ctx: Context, *, phase: str = ""):
         game = self.games[ctx.guild.id]
-        if not re.match(r"(d|day|n|night) ?(\d{1,2})", phase.lower()):
+        new_phase = GamePhase.from_str(phase)
+        if not new_phase:
             raise ModBotError(
                 "Invalid phase given!\n\n"
                 "Examples:\n"
@@ -45,35 +90,152 @@ class Phases(commands.Cog):
                 "- `!phase set Night 2\n"
                 "- `!phase set Day 5"
             )
-        game.phase = GamePhase(
-            phase=Phase.DAY if "d" in phase.lower() else Phase.NIGHT,
-            num=int("".join(c for c in phase if c.isnumeric())),
+        game.phase = new_phase
+        await self.set_deadline(ctx.guild.id, None)
+        await self.outbound.send(
+            ctx, priority=Priority.CRITICAL, embed=Embed.SuccessEmbed(body=f"It is now **{game.phase}**!")
         )
-        await ctx.send(embed=Embed.SuccessEmbed(body=f"It is now **{game.phase}**!"))
         self.bot.dispatch("phase_update", ctx)
 
+    @phase.command()
+    @commands.check(check_is_mod)
+    async def deadline(self, ctx: Context, *, when: str = ""):
+        game = self.games[ctx.guild.id]
+        if not when:
+            deadline = self.timers.get((ctx.guild.id, "deadline"))
+            await self.outbound.send(
+                ctx,
+                embed=Embed.InfoEmbed(
+                    body=(
+                        f"**{game.phase}** ends {format_deadline(deadline)}."
+                        if deadline
+                        else f"**{game.phase}** has no deadline."
+                    )
+                ),
+            )
+            return
+        if when.lower() == "clear":
+            await self.set_deadline(ctx.guild.id, None)
+            await self.outbound.send(
+                ctx, embed=Embed.SuccessEmbed(body=f"The deadline for **{game.phase}** was cleared.")
+            )
+            return
+        deadline = parse_deadline(when, now=ctx.message.created_at)
+        if not deadline:
+            raise ModBotError(
+                "Invalid deadline given! Give a time in FRT or a duration from now.\n\n"
+                "Examples:\n"
+                "- `!phase deadline 2024-01-01 03:00`\n"
+                "- `!phase deadline 1d 12h`\n"
+                "- `!phase deadline 90m`\n"
+                "- `!phase deadline clear`"
+            )
+        if deadline <= ctx.message.created_at:
+            raise ModBotError("The deadline must be in the future!")
+        await self.set_deadline(ctx.guild.id, deadline)
+        await self.outbound.send(
+            ctx,
+            embed=Embed.SuccessEmbed(body=f"**{game.phase}** will end automatically {format_deadline(deadline)}."),
+        )
+
+    async def set_deadline(self, guild_id: int, deadline: Optional[datetime]):
+        if deadline is None and self.timers.get((guild_id, "deadline")) is None:
+            return
+        self._schedule_deadline(guild_id, deadline)
+        await mark_dirty(self.bot)
+        await self.storage.save_deadline(guild_id, deadline)
+
+    def _schedule_deadline(self, guild_id: int, deadline: Optional[datetime]):
+        now = datetime.now(tz=pytz.utc)
+        for seconds in DEADLINE_REMINDERS:
+            self.timers.cancel((guild_id, "reminder", seconds))
+            if deadline and deadline - timedelta(seconds=seconds) > now:
+                self.timers.schedule((guild_id, "reminder", seconds), deadline - timedelta(seconds=seconds))
+        if deadline:
+            self.timers.schedule((guild_id, "deadline"), deadline)
+        else:
+            self.timers.cancel((guild_id, "deadline"))
+
+    async def _on_timer(self, key: Hashable, when: datetime):
+        guild_id, kind = key[0], key[1]
+        game = self.games[guild_id]
+        channel = self.bot.get_channel(game.config.vote_channel)
+        if not channel:
+            return
+        if kind == "reminder":
+            self.outbound.send(
+                channel,
+                priority=Priority.HIGH,
+                embed=Embed.InfoEmbed(
+                    body=f"**{game.phase}** ends {format_deadline(when + timedelta(seconds=key[2]))}!"
+                ),
+            )
+            return
+        await self.advance(ScheduledContext.create(self.bot, channel))
+
+    @Cog.listener("on_hammer")
+    async def on_hammer(self, ctx: Context, target: str, count: int):
+        if self.games[ctx.guild.id].rules.advance_on_hammer:
+            await self.advance(ctx)
+
     @phase.command()
     async def help(self, ctx: Context):
-        await ctx.send(
+        await self.outbound.send(
+            ctx,
             embed=Embed.InfoEmbed(
                 body="### For mods:\n"
                 "- `!phase next`: change the phase to the next phase, clear all votes, and en/disable voting.\n"
-                "- `!phase set <phase>`: set the current phase of the game."
-            )
+                "- `!phase set <phase>`: set the current phase of the game.\n"
+                "- `!phase deadline <time in FRT or duration>`: end the current phase automatically at that time.\n"
+                "- `!phase deadline clear`: remove the current phase's deadline.\n"
+                "- `!phase deadline`: show the current phase's deadline."
+            ),
         )
 
     @Cog.listener("on_ready")
     async def _setup(self):
-        phases = self.db["phases"].find()
-        async for phase in phases:
-            guild_id = phase.pop("_id")
-            self.games[guild_id].phase = GamePhase(**phase)
-        await self.bot.get_channel(1267309740891963508).send("Bot restarted!")
+        if not warm_started(self.bot):
+            for guild_id, phase in (await self.storage.load_phases()).items():
+                if not owns_guild(self.bot, guild_id):
+                    continue
+                self.load_state(guild_id, phase)
+        await self._load_deadlines()
+        restart_channel = self.bot.get_channel(1267309740891963508)
+        if restart_channel:
+            self.outbound.send(restart_channel, "Bot restarted!", priority=Priority.LOW)
 
-    async def cog_after_invoke(self, ctx: Context[BotT]) -> None:
-        guild_id = ctx.guild.id
-        await self.db["phases"].find_one_and_replace(
-            filter={"_id": guild_id},
-            replacement=attrs.asdict(self.games[guild_id].phase) | {"_id": guild_id},
-            upsert=True,
+    async def _load_deadlines(self):
+        # deadlines that passed while the bot was down fire straight away
+        for guild_id, deadline in (await self.storage.load_deadlines()).items():
+            if owns_guild(self.bot, guild_id):
+                self._schedule_deadline(guild_id, deadline)
+
+    def restore_checkpoint(self, ctx: Context, transition: PhaseTransition, state: Optional[Dict]):
+        # the phase itself is put back by the game cog; like a phase change, a rollback clears the deadline
+        transition.on_failure(
+            partial(self._schedule_deadline, transition.guild_id, self.timers.get((transition.guild_id, "deadline")))
         )
+        self._schedule_deadline(transition.guild_id, None)
+
+    def dump_state(self) -> Dict[int, Dict]:
+        return {guild_id: attrs.asdict(game.phase) for guild_id, game in self.games.items()}
+
+    def load_state(self, guild_id: int, state: Dict):
+        self.games[guild_id].phase = GamePhase(**state)
+
+    async def cog_after_invoke(self, ctx: Context[BotT]) -> None:
+        if ctx.command is not self.next:
+            await self._save_phase(ctx.guild.id)
+
+    async def _save_phase(self, guild_id: int):
+        await mark_dirty(self.bot)
+        await self.storage.save_phase(guild_id, attrs.asdict(self.games[guild_id].phase))
+
+
+def format_deadline(deadline: datetime) -> str:
+    timestamp = int(deadline.timestamp())
+    return f"<t:{timestamp}:F> (<t:{timestamp}:R>)"
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Phases(bot=bot, games=bot.games))
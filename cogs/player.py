@@ -1,18 +1,26 @@
 import re
-from typing import Dict
+from copy import deepcopy
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 
-import attrs
+import discord
 from discord import PermissionOverwrite
 from discord.ext import commands
 from discord.ext.commands import Context, Cog
 from discord.ext.commands._types import BotT
 from discord.utils import get
 
-from db_client import get_db
+from constants import PLAYER_LIST_PAGE_SIZE, PLAYER_INFO_PAGE_SIZE
 from embeds import Embed
 from exceptions import ModBotError
 from model import GameState, Player as _Player, Player, Role, RoleCard
+from outbound import get_outbound
+from sharding import owns_guild
+from snapshot import warm_started, mark_dirty
+from storage import get_storage
+from transition import PhaseTransition
 from utils import check_sensitive_info, check_is_mod
+from views import PagedListing, send_paginated
 
 
 class Players(commands.Cog):
@@ -20,9 +28,11 @@ class Players(commands.Cog):
         self.bot = bot
         self.games = games
         self.create_channels = False
-        self.db = get_db()
+        self.storage = get_storage()
+        self.outbound = get_outbound()
+        self._listings: Dict[Tuple[int, str], PagedListing] = {}
 
-    @commands.group(invoke_without_command=True)
+    @commands.hybrid_group(invoke_without_command=True)
     async def player(self, ctx: Context):
         if not ctx.invoked_subcommand:
             raise ModBotError("Invalid command used! Use `!player help` to see available commands.")
@@ -32,45 +42,70 @@ class Players(commands.Cog):
     async def channel_create(self, ctx: Context, enable: str = ""):
         if enable.lower() == "enable":
             self.create_channels = True
-            await ctx.send(embed=Embed.SuccessEmbed(body="Adding new players will now create new private channels!"))
+            await self.outbound.send(
+                ctx, embed=Embed.SuccessEmbed(body="Adding new players will now create new private channels!")
+            )
         elif enable.lower() == "disable":
             self.create_channels = False
-            await ctx.send(
-                embed=Embed.SuccessEmbed(body="Adding new players will no longer create new private channels!")
+            await self.outbound.send(
+                ctx, embed=Embed.SuccessEmbed(body="Adding new players will no longer create new private channels!")
             )
         else:
             raise ModBotError("Invalid command used! Use `!player help` to see available commands.")
 
     @player.command()
-    async def list(self, ctx: Context):
-        alive_players = ""
-        dead_players = ""
-        for player in self.games[ctx.guild.id].players:
-            player_str = f"{player} (<@{player.discord_id}>)\n"
-            if player.alive:
-                alive_players += player_str
-            else:
-                dead_players += player_str
-        await ctx.send(
-            embed=Embed.InfoEmbed(
-                title="Players",
-                body=f"**Alive Players**:\n{alive_players or 'Everyone is dead >:)'}\n"
-                f"**Dead Players**:\n{dead_players or 'Everyone is alive!'}",
-            )
-        )
+    async def list(self, ctx: Context, page: int = 1):
+        await send_paginated(ctx, self._get_player_list(ctx.guild.id), page=page - 1)
 
     @player.command()
     @commands.check(check_is_mod)
-    async def info(self, ctx: Context, fr_name: str = "", override_block: str = ""):
+    async def info(self, ctx: Context, fr_name: str = "", override_block: str = "", page: int = 1):
         game = self.games[ctx.guild.id]
-        check_sensitive_info(ctx, players=game.players, override_block=override_block)
+        await check_sensitive_info(ctx, players=game.players, override_block=override_block)
         if fr_name != "all":
             if not fr_name:
                 raise ModBotError("Invalid command!\nUse `!player info <FR name>` or `!player info all`")
             player = game.player_from_fr(fr_name, raise_err=True)
-            await ctx.send(embed=player.get_embed())
+            await self.outbound.send(ctx, embed=player.get_embed())
         else:
-            await ctx.send(embeds=[player.get_embed() for player in game.players])
+            if not game.players:
+                raise ModBotError("No players found!")
+            await send_paginated(ctx, self._get_player_info(ctx.guild.id), page=page - 1)
+
+    def _get_player_list(self, guild_id: int) -> PagedListing:
+        game = self.games[guild_id]
+        listing = self._listings.get((guild_id, "list"))
+        if not listing or listing.version != game.roster_version:
+            alive_players = [f"{player} (<@{player.discord_id}>)" for player in game.players if player.alive]
+            dead_players = [f"{player} (<@{player.discord_id}>)" for player in game.players if not player.alive]
+            lines = [
+                "**Alive Players**:",
+                *(alive_players or ["Everyone is dead >:)"]),
+                "",
+                "**Dead Players**:",
+                *(dead_players or ["Everyone is alive!"]),
+            ]
+            listing = PagedListing.from_items(
+                version=game.roster_version,
+                items=lines,
+                page_size=PLAYER_LIST_PAGE_SIZE,
+                render_page=lambda chunk: [Embed.InfoEmbed(title="Players", body="\n".join(chunk))],
+            )
+            self._listings[(guild_id, "list")] = listing
+        return listing
+
+    def _get_player_info(self, guild_id: int) -> PagedListing:
+        game = self.games[guild_id]
+        listing = self._listings.get((guild_id, "info"))
+        if not listing or listing.version != game.roster_version:
+            listing = PagedListing.from_items(
+                version=game.roster_version,
+                items=list(game.players),
+                page_size=PLAYER_INFO_PAGE_SIZE,
+                render_page=lambda chunk: [player.get_embed() for player in chunk],
+            )
+            self._listings[(guild_id, "info")] = listing
+        return listing
 
     @player.command()
     @commands.check(check_is_mod)
@@ -83,8 +118,8 @@ class Players(commands.Cog):
         if not query_player.role_card:
             raise ModBotError(f"Player {fr_name} does not have a rolecard!")
         if query_player.alive:
-            check_sensitive_info(ctx, players=game.players, override_block=override_block, ignore=[query_player])
-        await ctx.send(embed=query_player.role_card.get_rolecard(fr_name=query_player.fr_name))
+            await check_sensitive_info(ctx, players=game.players, override_block=override_block, ignore=[query_player])
+        await self.outbound.send(ctx, embed=query_player.role_card.get_rolecard(fr_name=query_player.fr_name))
 
     @player.command()
     @commands.check(check_is_mod)
@@ -103,6 +138,8 @@ class Players(commands.Cog):
         game.player_slot_map[fr_name] = new_player
         if self.create_channels:
             await self._create_player_channel(ctx=ctx, player=new_player)
+        # the listing is cached by roster version, which would otherwise only move on in cog_after_invoke
+        game.touch_roster()
         await self.list(ctx)
 
     @player.command()
@@ -125,6 +162,7 @@ class Players(commands.Cog):
         game.player_slot_map[new_player] = player_slot
         if self.create_channels:
             await self._create_player_channel(ctx=ctx, player=player_slot)
+        game.touch_roster()
         await self.list(ctx)
 
     @player.command()
@@ -134,12 +172,12 @@ class Players(commands.Cog):
         player = game.player_from_fr(fr_name, raise_err=True)
         if attr == "alive":
             player.alive = True if val.lower() == "true" else False
-            await ctx.send(embed=player.get_embed())
+            await self.outbound.send(ctx, embed=player.get_embed())
         if attr == "flips_as":
             if not player.role_card:
                 player.role_card = RoleCard()
             player.role_card.flips_as = Role.from_str(val)
-            await ctx.send(embed=player.get_embed())
+            await self.outbound.send(ctx, embed=player.get_embed())
 
     @player.command()
     @commands.check(check_is_mod)
@@ -149,7 +187,7 @@ class Players(commands.Cog):
             raise ModBotError(f"A player name must be specified!\ni.e. `!player kill <FR name>")
         player = game.player_from_fr(fr_name, raise_err=True)
         player.alive = False
-        await ctx.send(embed=player.get_embed())
+        await self.outbound.send(ctx, embed=player.get_embed())
 
     @player.command()
     @commands.check(check_is_mod)
@@ -159,6 +197,7 @@ class Players(commands.Cog):
             raise ModBotError("A player name must be specified!\ni.e. `!player delete <FR name>")
         player = game.player_from_fr(fr_name, raise_err=True)
         game.players.remove(player)
+        game.touch_roster()
         await self.list(ctx)
 
     @player.command()
@@ -170,12 +209,13 @@ class Players(commands.Cog):
         priv_category = get(ctx.guild.categories, id=game.config.private_category)
         perm_overwrites = {
             ctx.guild.default_role: PermissionOverwrite(read_messages=False),
-            ctx.guild.get_member(player.discord_id): PermissionOverwrite(read_messages=True),
+            discord.Object(id=player.discord_id): PermissionOverwrite(read_messages=True),
         }
         player_channel = await ctx.guild.create_text_channel(
             name=player.fr_name.lower(), category=priv_category, overwrites=perm_overwrites
         )
-        welcome_msg = await player_channel.send(
+        welcome_msg = await self.outbound.send(
+            player_channel,
             f"Welcome to your personal channel, **{player}**!\n"
             f"Here, you can ask the mod questions, submit your actions, request votecounts, and keep your notes about the game!\n\n"
             f"To request votecounts:\n"
@@ -185,9 +225,9 @@ class Players(commands.Cog):
             f"To submit actions:\n"
             f"- `!actions view`: see the abilities availalble to you this phase\n"
             f"- `!actions submit <action name> <action targets>`: see the abilities availalble to you this phase\n\n"
-            f"Please **do not** screenshot or copy & paste host communication and/or modbot results anywhere else, except bbcode generated from modbot's votecount feature. Good luck! :)"
+            f"Please **do not** screenshot or copy & paste host communication and/or modbot results anywhere else, except bbcode generated from modbot's votecount feature. Good luck! :)",
         )
-        await welcome_msg.pin()
+        self.outbound.pin(welcome_msg)
 
     def check_player_stats(self, fr_name: str, discord_id: int, guild_id: int):
         game = self.games[guild_id]
@@ -197,38 +237,67 @@ class Players(commands.Cog):
             raise ModBotError(f"<@{discord_id}> has already been added as a player!")
 
     async def cog_after_invoke(self, ctx: Context[BotT]) -> None:
-        player_dict = {
-            "players": [attrs.asdict(player) for player in self.games[ctx.guild.id].players],
-            "_id": ctx.guild.id,
-        }
-        await self.db["players"].find_one_and_replace(
-            filter={"_id": ctx.guild.id}, replacement=player_dict, upsert=True
-        )
-        player_slots_dict = {
-            name: attrs.asdict(player) for name, player in self.games[ctx.guild.id].player_slot_map.items()
-        }
-        player_slots_dict["_id"] = ctx.guild.id
-        await self.db["player_slots"].find_one_and_replace(
-            filter={"_id": ctx.guild.id}, replacement=player_slots_dict, upsert=True
-        )
+        self.games[ctx.guild.id].touch_roster()
+        await mark_dirty(self.bot)
+        state = self._dump_game(self.games[ctx.guild.id])
+        await self.storage.save_players(ctx.guild.id, state["players"], state["player_slots"])
+        self.bot.dispatch("roster_update", ctx)
+
+    def dump_state(self) -> Dict[int, Dict]:
+        return {guild_id: self._dump_game(game) for guild_id, game in self.games.items()}
+
+    @staticmethod
+    def _dump_game(game: GameState) -> Dict:
+        players, player_slots = game.dump_players()
+        return {"players": players, "player_slots": player_slots}
+
+    def checkpoint_state(self, guild_id: int) -> Dict:
+        return self._dump_game(self.games[guild_id])
+
+    def restore_checkpoint(self, ctx: Context, transition: PhaseTransition, state: Optional[Dict]):
+        if state is None:
+            return
+        game = self.games[transition.guild_id]
+        transition.on_failure(partial(self._undo_restore, game, game.players, game.player_slot_map))
+        # checkpoints can be restored more than once, so the players are rebuilt from a copy
+        game.players = [Player.from_dict(d) for d in deepcopy(state["players"])]
+        game.player_slot_map = {name: game.player_from_fr(fr_name) for name, fr_name in state["player_slots"].items()}
+        game.touch_roster()
+        transition.players = game.dump_players()
+
+    @staticmethod
+    def _undo_restore(game: GameState, players: List[Player], player_slot_map: Dict[str, Player]):
+        game.players = players
+        game.player_slot_map = player_slot_map
+        game.touch_roster()
+
+    def load_state(self, guild_id: int, state: Dict):
+        game = self.games[guild_id]
+        game.players = game.players or [Player.from_dict(d) for d in state["players"]]
+        game.player_slot_map = {name: game.player_from_fr(fr_name) for name, fr_name in state["player_slots"].items()}
+        game.touch_roster()
 
     @Cog.listener("on_ready")
     async def _setup(self):
-        plists = self.db["players"].find()
-        async for plist in plists:
-            guild_id = plist["_id"]
-            players = [Player.from_dict(d) for d in plist["players"]]
+        if warm_started(self.bot):
+            return
+        for guild_id, plist in (await self.storage.load_players()).items():
+            if not owns_guild(self.bot, guild_id):
+                continue
+            players = [Player.from_dict(d) for d in plist]
             self.games[guild_id].players = self.games[guild_id].players or players
-        pslotmaps = self.db["player_slots"].find()
-        async for pslotmap in pslotmaps:
-            guild_id = pslotmap.pop("_id")
+            self.games[guild_id].touch_roster()
+        for guild_id, pslotmap in (await self.storage.load_player_slots()).items():
+            if not owns_guild(self.bot, guild_id):
+                continue
             self.games[guild_id].player_slot_map = {
-                name: self.games[guild_id].player_from_fr(player["fr_name"]) for name, player in pslotmap.items()
+                name: self.games[guild_id].player_from_fr(fr_name) for name, fr_name in pslotmap.items()
             }
 
     @player.command()
     async def help(self, ctx: Context):
-        await ctx.send(
+        await self.outbound.send(
+            ctx,
             embed=Embed.InfoEmbed(
                 body="## For mods:\n"
                 "- `!player add <FR username> <@mention>`: add player to the game\n"
@@ -238,9 +307,13 @@ class Players(commands.Cog):
                 "- `!player delete <FR username>`: remove a player from the playerlist entirely.\n"
                 "- `!player rolecard <FR username>`: get a player's rolecard\n"
                 "- `!player info <FR username>`: get a player's game information\n"
-                "- `!player info all`: get all player's game information\n"
+                "- `!player info all`: get all player's game information (use the buttons or `!player info all override <page>` to flip pages)\n"
                 "- `!player channel_create <enable|disable>`: enable / disable channel creation when players are added\n"
                 "## For players:\n"
-                "- `!player list`: get list of players\n"
-            )
+                "- `!player list <page>`: get list of players (page is optional)\n"
+            ),
         )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Players(bot=bot, games=bot.games))
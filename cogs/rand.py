@@ -5,6 +5,7 @@ from discord.ext.commands import Context
 
 from embeds import Embed
 from exceptions import ModBotError
+from outbound import get_outbound
 
 
 class Random(commands.Cog):
@@ -16,27 +17,34 @@ class Random(commands.Cog):
     @random.command()
     async def choose(self, ctx: Context, *choices: str):
         choice = random.choice(choices)
-        await ctx.send(
+        await get_outbound().send(
+            ctx,
             embed=Embed.RandomEmbed(
                 body=f"Your result is: **{choice}**",
-            )
+            ),
         )
 
     @random.command()
     async def number(self, ctx: Context, lower: int, upper: int):
         choice = random.randint(lower, upper)
-        await ctx.send(
+        await get_outbound().send(
+            ctx,
             embed=Embed.RandomEmbed(
                 body=f"Your result is: **{choice}**",
-            )
+            ),
         )
 
     @random.command()
     async def help(self, ctx: Context):
-        await ctx.send(
+        await get_outbound().send(
+            ctx,
             embed=Embed.InfoEmbed(
                 body="### Random Commands:\n"
                 "- `!random choose <option 1> <option 2> <...>`: select one item from the list with equal probability.\n"
                 "- `!random number <min> <max>`: select a number between min and max (both inclusive)."
-            )
+            ),
         )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Random())
@@ -1,22 +1,26 @@
 import random
-from copy import deepcopy
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
 import discord.utils
 from discord import TextChannel
 from discord.ext import commands
 from discord.ext.commands import Context, Cog
 
+from constants import ROLE_LIST_PAGE_SIZE
 from embeds import Embed
 from exceptions import ModBotError
 from model import GameState
+from outbound import get_outbound
 from utils import check_is_mod
+from views import PagedListing, send_paginated
 
 
 class Roles(commands.Cog):
-    def __init__(self, bot: commands.Bot, game: GameState):
+    def __init__(self, bot: commands.Bot, games: Dict[int, GameState]):
         self.bot = bot
-        self.game = game
+        self.games = games
+        self._listings: Dict[int, PagedListing] = {}
+        self.outbound = get_outbound()
 
     @commands.group()
     async def roles(self, ctx: Context):
@@ -24,62 +28,79 @@ class Roles(commands.Cog):
             raise ModBotError("Invalid command used! Use `!roles help` to see available commands.")
 
     @roles.command()
-    async def list(self, ctx: Context):
-        if not self.game.rules.open_setup and not ctx.author.guild_permissions.administrator:
+    async def list(self, ctx: Context, page: int = 1):
+        game = self.games[ctx.guild.id]
+        if not game.rules.open_setup and not ctx.author.guild_permissions.administrator:
             raise ModBotError("This game is closed-setup; only mods can use this command!")
-        if not self.game.roles:
-            await ctx.send(embed=Embed.ErrorEmbed(body="No roles found!"))
-        await ctx.send(embeds=[role.get_rolecard() for role in self.game.roles])
+        if not game.roles:
+            raise ModBotError("No roles found!")
+        listing = self._listings.get(ctx.guild.id)
+        if not listing or listing.version != id(game.roles):
+            listing = PagedListing.from_items(
+                version=id(game.roles),
+                items=game.roles,
+                page_size=ROLE_LIST_PAGE_SIZE,
+                render_page=lambda chunk: [role.get_rolecard() for role in chunk],
+            )
+            self._listings[ctx.guild.id] = listing
+        await send_paginated(ctx, listing, page=page - 1)
 
     @roles.command()
     @commands.check(check_is_mod)
     async def rand(self, ctx: Context, dry_run: str = ""):
-        if len(self.game.roles) != len(self.game.players):
+        game = self.games[ctx.guild.id]
+        if len(game.roles) != len(game.players):
             raise ModBotError(
-                f"The number of players ({len(self.game.players)}) and the number of roles ({len(self.game.roles)}) must be equal!"
+                f"The number of players ({len(game.players)}) and the number of roles ({len(game.roles)}) must be equal!"
             )
 
         rolecards = []
-        rand_sequence = list(range(len(self.game.players)))
+        rand_sequence = list(range(len(game.players)))
         random.shuffle(rand_sequence)
-        for role, player_idx in zip(self.game.roles, rand_sequence):
-            target_player = self.game.players[player_idx]
+        for role, player_idx in zip(game.roles, rand_sequence):
+            target_player = game.players[player_idx]
             target_player.alive = True
-            target_player.role_card = deepcopy(role)
+            target_player.role_card = role.instantiate()
             rolecards.append(role.get_rolecard(fr_name=target_player.fr_name))
-        await ctx.send(embeds=rolecards)
+        game.touch_roster()
+        await self.outbound.send(ctx, embeds=rolecards)
         if dry_run != "dry_run":
             await self.send(ctx)
 
     @roles.command()
     @commands.check(check_is_mod)
     async def send(self, ctx: Context):
+        game = self.games[ctx.guild.id]
         failed_players = []
-        for player in self.game.players:
+        for player in game.players:
             player_channel = self.find_player_channel(ctx, name=player.fr_name.lower()) or self.find_player_channel(
                 ctx, name=player.fr_name
             )
             if not player_channel:
                 failed_players.append(player.fr_name)
                 continue
-            rc_msg = await player_channel.send(embed=player.role_card.get_rolecard(fr_name=player.fr_name))
-            await rc_msg.pin()
+            rc_msg = await self.outbound.send(
+                player_channel, embed=player.role_card.get_rolecard(fr_name=player.fr_name)
+            )
+            self.outbound.pin(rc_msg)
         if failed_players:
-            await ctx.send(
+            await self.outbound.send(
+                ctx,
                 embed=Embed.ErrorEmbed(
                     body=f"Failed to send rolecards for player(s) {', '.join(failed_players)} because their private channel(s) cannot be found :(\n\n"
                     f"If you have a channel already created, check:\n"
                     f"- is it under the private category?\n"
                     f'- is it private channel (is "read messages" for everyone off)>\n'
                     f"- is the channel name spelt correctly?"
-                )
+                ),
             )
         else:
-            await ctx.send(embed=Embed.SuccessEmbed(body=f"All rolecards sent!"))
+            await self.outbound.send(ctx, embed=Embed.SuccessEmbed(body=f"All rolecards sent!"))
         return
 
     def find_player_channel(self, ctx: Context, name: str) -> Optional[TextChannel]:
-        private_category = discord.utils.get(ctx.guild.categories, id=self.game.config.private_category)
+        game = self.games[ctx.guild.id]
+        private_category = discord.utils.get(ctx.guild.categories, id=game.config.private_category)
         if not private_category:
             return None
         player_channel = discord.utils.get(private_category.channels, name=name)
@@ -89,12 +110,17 @@ class Roles(commands.Cog):
 
     @roles.command()
     async def help(self, ctx: Context):
-        await ctx.send(
+        await self.outbound.send(
+            ctx,
             embed=Embed.InfoEmbed(
                 body="### For mods:\n"
-                "- `!roles list`: show all rolecards for this game (without player names).\n"
+                "- `!roles list <page>`: show all rolecards for this game (without player names).\n"
                 "- `!roles rand`: randomly assign players to the roles in the setup & sends out rolecards.\n\n"
                 "**P.S.** If you want to rand the roles without sending them out (i.e. if you want to check them first), do `!roles rand dry_run`. \n"
                 "You can later use `!roles send` seperately to send rolecards out."
-            )
+            ),
         )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Roles(bot=bot, games=bot.games))
@@ -1,26 +1,49 @@
 from __future__ import annotations
+import asyncio
+import tempfile
+import time
 from collections import defaultdict
 from copy import deepcopy
+from functools import partial
 from datetime import datetime
-from typing import Dict, List, Optional
-import re
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
 import attrs
-import dateutil
 import discord
 import pytz
 from attrs import define
-from dateutil.parser import ParserError
 from discord import Message, app_commands
 from discord.ext import commands
 from discord.ext.commands import Context, Cog
 
-from constants import FR_TZ, TIME_FORMAT, OK_EMOJI, Phase
-from db_client import get_db
+from constants import (
+    FR_TZ,
+    TIME_FORMAT,
+    Phase,
+    Priority,
+    SNAPSHOT_HISTORY_LIMIT,
+    HISTORY_CACHE_PHASES,
+    VOTE_USER_BUCKET,
+    VOTE_GUILD_BUCKET,
+    WARN_USER_BUCKET,
+    WARN_GUILD_BUCKET,
+    WAIT_EMOJI,
+)
 from embeds import Embed
 from exceptions import VoteError, ModBotError
+from export import iter_export, parse_export_args, write_export
+from history import PhaseCache
 from model import GameState, Player, GamePhase
-from utils import send_error_and_delete, check_is_mod
+from name_index import NameIndex
+from outbound import get_outbound
+from ratelimit import RateLimiter, take_all
+from sharding import owns_guild
+from snapshot import warm_started, mark_dirty
+from storage import get_storage
+from timequery import PhaseBoundary, parse_time_query
+from transition import PhaseTransition
+from utils import acknowledge, send_error, send_error_and_delete, check_is_mod
+from wagons import WagonTally, majority
 
 
 @define
@@ -33,6 +56,15 @@ class VoteSnapshot:
     def from_dict(cls, d):
         return cls(time_utc=pytz.utc.localize(d["time_utc"]), votes=d["votes"], phase=GamePhase(**d["phase"]))
 
+    @classmethod
+    def from_state(cls, d):
+        return cls(
+            time_utc=datetime.fromtimestamp(d["time_utc"], tz=pytz.utc), votes=d["votes"], phase=GamePhase(**d["phase"])
+        )
+
+    def to_state(self) -> Dict:
+        return {"time_utc": self.time_utc.timestamp(), "votes": self.votes, "phase": attrs.asdict(self.phase)}
+
 
 class Vote(commands.Cog):
     def __init__(self, bot: commands.Bot, games: dict[int, GameState]):
@@ -40,16 +72,41 @@ class Vote(commands.Cog):
         self.games: dict[int, GameState] = games
         self.enabled: bool = True
         self.votes: Dict[int, Dict[str, List[str]]] = defaultdict(lambda: defaultdict(list))
+        # only the current phase is kept here; closed phases are archived in storage and loaded on demand
         self.vote_history: Dict[int, List[VoteSnapshot]] = defaultdict(list)
+        self._archive_index: Dict[int, List[Dict]] = {}
+        self._cold_history: PhaseCache[List[VoteSnapshot]] = PhaseCache(HISTORY_CACHE_PHASES)
+        self._name_indexes: Dict[int, NameIndex[Player]] = {}
+        self.board_messages: Dict[int, int] = {}
+        # guilds whose in-memory history only holds the tail restored from a warm-start snapshot
+        self._history_partial: Set[int] = set()
+        self._tallies: Dict[int, WagonTally] = {}
+        self._majorities: Dict[int, Tuple[int, int]] = {}
+        # guilds where a wagon has reached majority this phase
+        self.hammered: Set[int] = set()
 
         self.ctx_menu = app_commands.ContextMenu(
             name="Get Votecount",
             callback=self.get_votecount_menu,
         )
         self.bot.tree.add_command(self.ctx_menu)
-        self.db = get_db()
-
-    @commands.group()
+        self.storage = get_storage()
+        self.outbound = get_outbound()
+        self._user_vote_limits = RateLimiter(*VOTE_USER_BUCKET)
+        self._guild_vote_limits = RateLimiter(*VOTE_GUILD_BUCKET)
+        self._user_warn_limits = RateLimiter(*WARN_USER_BUCKET)
+        self._guild_warn_limits = RateLimiter(*WARN_GUILD_BUCKET)
+        # the latest vote of each (guild, user) over the limit, applied once they have a token again
+        self._deferred_votes: Dict[Tuple[int, int], Tuple[Context, Callable[[], Awaitable]]] = {}
+        self._deferred_tasks: Dict[Tuple[int, int], asyncio.Task] = {}
+
+    async def cog_unload(self) -> None:
+        for task in self._deferred_tasks.values():
+            task.cancel()
+        # the context menu lives on the tree rather than the cog, so a reload would otherwise register it twice
+        self.bot.tree.remove_command(self.ctx_menu.name, type=self.ctx_menu.type)
+
+    @commands.hybrid_group()
     async def vote(self, ctx: Context):
         if not ctx.invoked_subcommand:
             raise ModBotError("Invalid command used! Use `!vote help` to see available commands.")
@@ -58,56 +115,126 @@ class Vote(commands.Cog):
     @commands.check(check_is_mod)
     async def enable(self, ctx: Context):
         self.enabled = True
-        await ctx.send(embed=Embed.SuccessEmbed(body="Voting is now enabled!"))
+        self.hammered.discard(ctx.guild.id)
+        await self.outbound.send(ctx, embed=Embed.SuccessEmbed(body="Voting is now enabled!"))
 
     @vote.command()
     @commands.check(check_is_mod)
     async def disable(self, ctx: Context):
         self.enabled = False
-        await ctx.send(embed=Embed.SuccessEmbed(body="Voting is now disabled!"))
+        await self.outbound.send(ctx, embed=Embed.SuccessEmbed(body="Voting is now disabled!"))
 
     @vote.command()
     @commands.check(check_is_mod)
     async def clear(self, ctx: Context):
-        self.votes[ctx.guild.id] = defaultdict(list)
-        await ctx.send(embed=Embed.SuccessEmbed(body="Votes cleared successfully!"))
+        self._set_votes(ctx.guild.id)
+        await self.outbound.send(ctx, embed=Embed.SuccessEmbed(body="Votes cleared successfully!"))
         await self.on_vote(guild_id=ctx.guild.id, msg_time=ctx.message.created_at)
 
     @vote.command(aliases=["p"])
     async def player(self, ctx: Context, player: str = ""):
+        await self._throttled(ctx, lambda: self._vote_player(ctx, player))
+
+    async def _vote_player(self, ctx: Context, player: str):
         voter = self.games[ctx.guild.id].player_from_id(discord_id=ctx.author.id)
-        target = self.games[ctx.guild.id].player_from_fr(fr_name=player)
-        self._check_vote(ctx, voter=voter, target=target, target_required=True)
-        self._remove_vote(self.votes[ctx.guild.id], voter.fr_name)
-        self.votes[ctx.guild.id][target.fr_name].append(voter.fr_name)
-        await ctx.message.add_reaction(OK_EMOJI)
+        match = self._get_name_index(ctx.guild.id).resolve(player)
+        target = match.value
+        self._check_vote(ctx, voter=voter, target=target, target_required=True, suggestions=match.suggestions)
+        self._cast_vote(ctx.guild.id, voter.fr_name, target.fr_name)
+        acknowledge(ctx, f"Voted for **{target.fr_name}**!")
         await self.on_vote(guild_id=ctx.guild.id, msg_time=ctx.message.created_at)
+        await self._check_hammer(ctx)
 
     @vote.command()
     async def unvote(self, ctx: Context):
+        await self._throttled(ctx, lambda: self._unvote(ctx))
+
+    async def _unvote(self, ctx: Context):
         voter = self.games[ctx.guild.id].player_from_id(discord_id=ctx.author.id)
         self._check_vote(ctx, voter=voter, target_required=False)
-        self._remove_vote(self.votes[ctx.guild.id], voter.fr_name)
-        await ctx.message.add_reaction(OK_EMOJI)
+        self._cast_vote(ctx.guild.id, voter.fr_name, None)
+        acknowledge(ctx, "Vote retracted!")
         await self.on_vote(guild_id=ctx.guild.id, msg_time=ctx.message.created_at)
 
     @vote.command()
     async def sleep(self, ctx: Context):
+        await self._throttled(ctx, lambda: self._vote_sleep(ctx))
+
+    async def _vote_sleep(self, ctx: Context):
         voter = self.games[ctx.guild.id].player_from_id(discord_id=ctx.author.id)
         self._check_vote(ctx, voter=voter, target_required=False)
         if not self.games[ctx.guild.id].rules.sleep_enabled:
             raise ModBotError("Sleep / no elim is not an option in this game!")
-        self._remove_vote(self.votes[ctx.guild.id], voter.fr_name)
-        self.votes[ctx.guild.id]["Sleep / No Elim"].append(voter.fr_name)
-        await ctx.message.add_reaction(OK_EMOJI)
+        self._cast_vote(ctx.guild.id, voter.fr_name, "Sleep / No Elim")
+        acknowledge(ctx, "Voted to sleep / no elim!")
         await self.on_vote(guild_id=ctx.guild.id, msg_time=ctx.message.created_at)
+        await self._check_hammer(ctx)
+
+    async def _throttled(self, ctx: Context, apply: Callable[[], Awaitable]):
+        key = (ctx.guild.id, ctx.author.id)
+        # while a vote is waiting, newer ones replace it rather than jumping ahead of it
+        if key not in self._deferred_votes and not self._vote_wait(key):
+            await apply()
+            return
+        self._deferred_votes[key] = (ctx, apply)
+        if key not in self._deferred_tasks:
+            self._deferred_tasks[key] = asyncio.create_task(self._apply_deferred(key))
+        if ctx.interaction:
+            await send_error(ctx, "You are voting too fast! Only your latest vote will count, in a few seconds.")
+        else:
+            self.outbound.add_reaction(ctx.message, WAIT_EMOJI)
+
+    def _vote_wait(self, key: Tuple[int, int]) -> float:
+        return take_all(time.monotonic(), (self._user_vote_limits, key), (self._guild_vote_limits, key[0]))
+
+    async def _apply_deferred(self, key: Tuple[int, int]):
+        # the task stays registered until nothing is left waiting, so a vote that comes in while the previous one is
+        # being applied is picked up by this loop instead of being left without a task
+        try:
+            while key in self._deferred_votes:
+                wait = self._vote_wait(key)
+                if wait:
+                    await asyncio.sleep(wait)
+                    continue
+                ctx, apply = self._deferred_votes.pop(key)
+                try:
+                    await apply()
+                except ModBotError as e:
+                    # the command has long returned, so its error handler will never see this
+                    await send_error(ctx, e.msg)
+        finally:
+            self._deferred_tasks.pop(key, None)
+
+    def _drop_deferred(self, transition: PhaseTransition):
+        # votes still waiting for a token belong to the phase that just ended; the tasks are not cancelled, since
+        # one may be in the middle of applying an earlier vote, and each stops once it finds nothing waiting
+        dropped = {
+            key: self._deferred_votes.pop(key) for key in list(self._deferred_votes) if key[0] == transition.guild_id
+        }
+        for ctx, _ in dropped.values():
+            transition.announce(
+                partial(send_error, ctx, f"**{transition.old_phase}** ended before your latest vote could be counted!")
+            )
+        transition.on_failure(partial(self._requeue_deferred, dropped))
+
+    def _requeue_deferred(self, dropped: Dict[Tuple[int, int], Tuple[Context, Callable[[], Awaitable]]]):
+        for key, deferred in dropped.items():
+            # a newer vote that came in since is the one that counts
+            self._deferred_votes.setdefault(key, deferred)
+            if key not in self._deferred_tasks:
+                self._deferred_tasks[key] = asyncio.create_task(self._apply_deferred(key))
 
     @vote.command()
     @commands.check(check_is_mod)
     async def remove(self, ctx: Context, player: str):
-        self._remove_vote(self.votes[ctx.guild.id], player)
-        await ctx.send(embed=Embed.SuccessEmbed(body="Vote successfully removed!"))
+        game = self.games[ctx.guild.id]
+        self._cast_vote(ctx.guild.id, player, None)
+        # a mod taking back the vote that made a hammer also takes back the hammer, so voting unlocks again
+        if self._get_tally(ctx.guild.id).top < self._get_majority(game, ctx.guild.id):
+            self.hammered.discard(ctx.guild.id)
+        await self.outbound.send(ctx, embed=Embed.SuccessEmbed(body="Vote successfully removed!"))
         await self.on_vote(guild_id=ctx.guild.id, msg_time=ctx.message.created_at)
+        await self._check_hammer(ctx)
 
     @vote.command()
     async def count(self, ctx: Context, format_bbcode: str = ""):
@@ -118,14 +245,16 @@ class Vote(commands.Cog):
         ):
             raise ModBotError("Vote count can only be done in game-related private channels (unless you are an admin)!")
         if format_bbcode.lower() == "bbcode":
-            await ctx.send(
-                f"```[b]Current Vote Count ({game.phase})[/b]: \n{self._compose_votecount(self.votes[ctx.guild.id], game.player_slot_map, format_bbcode=True)}```"
+            await self.outbound.send(
+                ctx,
+                f"```[b]Current Vote Count ({game.phase})[/b]: \n{self._compose_votecount(self.votes[ctx.guild.id], game.player_slot_map, format_bbcode=True)}```",
             )
         else:
-            await ctx.send(
+            await self.outbound.send(
+                ctx,
                 embed=Embed.InfoEmbed(
                     body=f"## Current Vote Count ({game.phase}):\n{self._compose_votecount(self.votes[ctx.guild.id], game.player_slot_map)}"
-                )
+                ),
             )
 
     @vote.command()
@@ -141,73 +270,52 @@ class Vote(commands.Cog):
         if msg_or_time.endswith(" bbcode"):
             msg_or_time = msg_or_time.removesuffix(" bbcode")
             format_bbcode = True
-        if msg_or_time.startswith("https://discord.com"):
-            channel_pat = re.findall(r"https://discord.com/channels/(\d+)/(\d+)/(\d+)", msg_or_time)
-            if not channel_pat:
-                raise ModBotError(
-                    "Invalid message link provided!\nTry double-checking that you linked the correct message."
-                )
-            guild_id, channel_id, msg_id = channel_pat[0]
-            try:
-                channel = ctx.bot.get_channel(int(channel_id))
-                msg = await channel.fetch_message(int(msg_id))
-            except Exception as e:
-                await send_error_and_delete(
-                    ctx.message,
-                    error_msg=f"Something went wrong! Try double-checking that you linked the correct message.\n"
-                    f"If this is not expected, report this with the following error message: \n"
-                    f"**[{type(e)}]**: {str(e)}",
-                    delay=30,
-                )
-                return
-            msg_time = msg.created_at
-        else:
-            msg_time_frt = None
-            for date_format in ["%B %d, %Y %H:%M:%S", "%Y-%m-%d %H:%M:%S"]:
-                try:
-                    msg_time_frt = datetime.strptime(msg_or_time, date_format)
-                except ValueError:
-                    pass
-            if not msg_time_frt:
-                try:
-                    msg_time_frt = dateutil.parser.parse(msg_or_time)
-                except ParserError:
-                    await send_error_and_delete(
-                        ctx.message,
-                        f"You must provide a valid time (in FRT), or link a message to get the votecount as of that point!\n\n"
-                        f"**Examples**:\n"
-                        f"- !vote history January 01, 2024 00:30:00\n "
-                        f"- !vote history 2024-01-01 00:30:00\n "
-                        f"- !vote history https://discord.com/channels/{ctx.guild.id}/{ctx.channel.id}/{ctx.message.id}\n\n"
-                        f'You can get a message link by clicking "More" on the message > "Copy Message Link".',
-                        delay=30,
-                    )
-                    return
-            msg_time_frt = FR_TZ.localize(msg_time_frt)
-            msg_time = msg_time_frt.astimezone(pytz.utc)
-        vote_snapshot = self.get_vote_snapshot(guild_id=ctx.guild.id, msg_time=msg_time)
+        query = parse_time_query(msg_or_time, now=ctx.message.created_at)
+        if not query:
+            await send_error(
+                ctx,
+                f"You must provide a valid time (in FRT), or link a message to get the votecount as of that point!\n\n"
+                f"**Examples**:\n"
+                f"- !vote history January 01, 2024 00:30:00\n "
+                f"- !vote history 2024-01-01 00:30:00\n "
+                f"- !vote history 30m ago\n "
+                f"- !vote history end of D2\n "
+                f"- !vote history https://discord.com/channels/{ctx.guild.id}/{ctx.channel.id}/{ctx.message.id}\n\n"
+                f'You can get a message link by clicking "More" on the message > "Copy Message Link".',
+                delay=30,
+            )
+            return
+        msg_time = await self._phase_boundary(ctx.guild.id, query) if isinstance(query, PhaseBoundary) else query
+        vote_snapshot = await self.get_vote_snapshot(guild_id=ctx.guild.id, msg_time=msg_time)
         vote_count_hist = vote_snapshot.votes
         if format_bbcode:
-            await ctx.send(
+            await self.outbound.send(
+                ctx,
                 "```"
                 f"[b]Historical Vote Count ({vote_snapshot.phase}):[/b]\n"
                 f"{self._compose_votecount(vote_count_hist, self.games[ctx.guild.id].player_slot_map, format_bbcode=True)}\n"
                 f"[sup]vote count shown is as of {msg_time.astimezone(FR_TZ).strftime(TIME_FORMAT)}.[/sup]"
-                f"```"
+                f"```",
             )
         else:
-            await ctx.send(
+            await self.outbound.send(
+                ctx,
                 embed=Embed.InfoEmbed(
                     body=f"## Historical Vote Count ({vote_snapshot.phase}):\n{self._compose_votecount(vote_count_hist, self.games[ctx.guild.id].player_slot_map)}",
                     footer=f"vote count shown is as of {msg_time.astimezone(FR_TZ).strftime(TIME_FORMAT)}.",
-                )
+                ),
             )
 
     @vote.command()
     @commands.check(check_is_mod)
     async def restore(self, ctx: Context):
+        # votes are replayed from the text of `!vote` messages, which slash mode can neither receive nor read;
+        # going ahead anyway would replace the stored votes with an empty history
+        if not self.bot.intents.message_content:
+            raise ModBotError("`/vote restore` only works when the bot runs with prefix commands!")
+        await ctx.defer()
         game_phase = GamePhase(Phase.DAY, num=1)
-        self.votes[ctx.guild.id] = defaultdict(list)
+        self._set_votes(ctx.guild.id)
         self.vote_history[ctx.guild.id] = [
             VoteSnapshot(time_utc=datetime(2020, 1, 1, tzinfo=pytz.utc), votes={}, phase=game_phase)
         ]
@@ -216,20 +324,69 @@ class Vote(commands.Cog):
             if msg.content.startswith("!vote p"):
                 voter = self.games[ctx.guild.id].player_from_id(discord_id=msg.author.id)
                 target_fr = msg.content.removeprefix("!vote player ").removeprefix("!vote p ")
-                target = self.games[ctx.guild.id].player_from_fr(fr_name=target_fr)
-                self._remove_vote(self.votes[ctx.guild.id], voter.fr_name)
-                self.votes[ctx.guild.id][target.fr_name].append(voter.fr_name)
+                # matched like a live vote, except that players who have died since still match by their exact name
+                target = (
+                    self.games[ctx.guild.id].player_from_fr(fr_name=target_fr)
+                    or self._get_name_index(ctx.guild.id).resolve(target_fr).value
+                )
+                if not (voter and target):
+                    continue
+                self._cast_vote(ctx.guild.id, voter.fr_name, target.fr_name)
                 self.vote_history[ctx.guild.id].append(
                     VoteSnapshot(msg.created_at, deepcopy(self.votes[ctx.guild.id]), game_phase)
                 )
             if msg.content.startswith("!phase next") and msg.author.guild_permissions.administrator:
                 game_phase = game_phase.next()
-                self.votes[ctx.guild.id] = defaultdict(list)
+                self._set_votes(ctx.guild.id)
+        self._history_partial.discard(ctx.guild.id)
+        await self._save_history(ctx.guild.id)
+        await self._archive_closed_phases(ctx.guild.id)
         await self.on_vote(ctx.guild.id, ctx.message.created_at)
         await self.count(ctx)
 
+    @vote.command()
+    @commands.check(check_is_mod)
+    async def export(self, ctx: Context, *, options: str = ""):
+        await ctx.defer()
+        phase, fmt = parse_export_args(options)
+        await self._ensure_history(ctx.guild.id)
+        archives = [GamePhase(**archive["phase"]) for archive in await self._get_archive_index(ctx.guild.id)]
+        # the export thread reads these long after this point, so it gets its own copy of anything a command can change
+        history = self._export_history(
+            ctx.guild.id,
+            [archived_phase for archived_phase in archives if not phase or archived_phase == phase],
+            list(self.vote_history[ctx.guild.id]),
+            asyncio.get_running_loop(),
+        )
+        player_slot_map = dict(self.games[ctx.guild.id].player_slot_map)
+        chunks = iter_export(
+            history,
+            fmt,
+            phase=phase,
+            compose_votecount=lambda votes: self._compose_votecount(votes, player_slot_map, format_bbcode=True),
+        )
+        # the export is generated chunk by chunk straight into a temp file, off the event loop
+        f = tempfile.TemporaryFile()
+        await asyncio.to_thread(write_export, chunks, f)
+        filename = f"votes-{str(phase or 'all').replace(' ', '').lower()}.{'txt' if fmt == 'bbcode' else fmt}"
+        await self.outbound.send(
+            ctx,
+            embed=Embed.SuccessEmbed(body=f"Vote history for **{phase or 'all phases'}** exported as {fmt}!"),
+            file=discord.File(f, filename=filename),
+        )
+
+    def _export_history(
+        self, guild_id: int, archives: List[GamePhase], current: List[VoteSnapshot], loop: asyncio.AbstractEventLoop
+    ) -> Iterator[VoteSnapshot]:
+        # runs on the export thread; each archive is only loaded on the event loop once the export reaches it, so
+        # roughly one phase is held in memory at a time
+        for archived_phase in archives:
+            load = self._load_archive(guild_id, archived_phase, cache=False)
+            yield from asyncio.run_coroutine_threadsafe(load, loop).result()
+        yield from current
+
     async def get_votecount_menu(self, interaction: discord.Interaction, message: discord.Message):
-        vote_snapshot = self.get_vote_snapshot(guild_id=interaction.guild_id, msg_time=message.created_at)
+        vote_snapshot = await self.get_vote_snapshot(guild_id=interaction.guild_id, msg_time=message.created_at)
         await interaction.response.send_message(
             embed=Embed.InfoEmbed(
                 body=f"## Historical Vote Count ({vote_snapshot.phase}):\n{self._compose_votecount(vote_snapshot.votes, self.games[interaction.guild_id].player_slot_map)}",
@@ -241,23 +398,28 @@ class Vote(commands.Cog):
 
     @vote.command()
     async def help(self, ctx: Context):
-        await ctx.send(
+        await self.outbound.send(
+            ctx,
             embed=Embed.InfoEmbed(
                 body="## For mods:\n"
                 "- `!vote enable`: enable voting\n"
                 "- `!vote disable`: disable voting\n"
                 "- `!vote clear`: clear all votes\n"
                 "- `!vote remove <FR name>`: remove the vote of a specified player.\n"
+                "- `!vote restore`: rebuild every vote from the messages in the voting channel (prefix commands only).\n"
+                "- `!vote export [phase|all] [json|csv|bbcode]`: export every vote, phase boundary and final vote count as a file (defaults to all phases in bbcode).\n"
                 "## For players:\n"
-                "- `!vote player <FR name>` or `!vote p <FR name>`: vote for a player with their FR username (case insensitive).\n"
+                "- `!vote player <FR name>` or `!vote p <FR name>`: vote for a player with their FR username (case insensitive; unique prefixes and small typos are accepted).\n"
                 "- `!vote unvote`: retract your vote.\n"
                 "- `!vote sleep`: vote to sleep / no elim.\n"
                 "- `!vote count`: get the current vote count.\n"
                 "- `!vote history <time in FRT>`: get the historical vote count as of the provided time.\n"
-                "- `!vote history <link to discord message>`: get the historical vote count as of the provided message's send time.\n\n"
+                "- `!vote history <link to discord message>`: get the historical vote count as of the provided message's send time.\n"
+                "- `!vote history <duration> ago`: get the historical vote count as of that long ago (i.e. `!vote history 1h 30m ago`).\n"
+                "- `!vote history <start|end> of <phase>`: get the vote count when a phase started or ended (i.e. `!vote history end of D2`).\n\n"
                 '> P.S. You can add an extra argument "bbcode" to `!vote history` and `!vote count` to get vote count formatted with FR bbcode! (i.e. `!vote count bbcode`, `!vote history <time> bbcode`)\n'
                 f"\n Voting is currently **{'en' if self.enabled else 'dis'}abled**.\n",
-            )
+            ),
         )
 
     @Cog.listener("on_message")
@@ -267,47 +429,210 @@ class Vote(commands.Cog):
             and not message.author.bot
             and not message.author.guild_permissions.administrator
         ):
-            if not (message.author.bot or message.content.startswith("!vote ")):
+            # without the message content intent, votes can only come in as slash commands
+            prefix = "!" if self.bot.intents.message_content else "/"
+            if not (message.author.bot or (prefix == "!" and message.content.startswith("!vote "))):
+                # someone spamming the channel only gets warned once in a while; the rest is just deleted
+                if take_all(
+                    time.monotonic(),
+                    (self._user_warn_limits, (message.guild.id, message.author.id)),
+                    (self._guild_warn_limits, message.guild.id),
+                ):
+                    self.outbound.delete(message)
+                    return
                 await send_error_and_delete(
                     message,
-                    "Only `!vote` commands should be used in the voting channel!",
+                    f"Only `{prefix}vote` commands should be used in the voting channel!",
                 )
 
-    @Cog.listener("on_phase_change")
-    async def on_phase_change(self, ctx: Context, old_phase: GamePhase, new_phase: GamePhase):
-        if new_phase.phase == Phase.DAY:
+    def prepare_transition(self, ctx: Context, transition: PhaseTransition):
+        guild_id = transition.guild_id
+        game = self.games[guild_id]
+        transition.on_failure(
+            partial(
+                self._undo_transition,
+                guild_id,
+                self.enabled,
+                self.votes[guild_id],
+                self.vote_history[guild_id],
+                guild_id in self.hammered,
+                guild_id in self._history_partial,
+            )
+        )
+        if transition.new_phase.phase == Phase.DAY:
             self.enabled = True
-        if new_phase.phase == Phase.NIGHT:
+        if transition.new_phase.phase == Phase.NIGHT:
             self.enabled = False
         embed = Embed.InfoEmbed(
-            body=f"## {old_phase} Final Vote Count:\n{self._compose_votecount(self.votes[ctx.guild.id], player_slot_map=self.games[ctx.guild.id].player_slot_map)}",
-            footer=f"It is now {new_phase}! Votes have been cleared and {'en' if self.enabled else 'dis'}abled.",
+            body=f"## {transition.old_phase} Final Vote Count:\n{self._compose_votecount(self.votes[guild_id], player_slot_map=game.player_slot_map)}",
+            footer=f"It is now {transition.new_phase}! Votes have been cleared and {'en' if self.enabled else 'dis'}abled.",
         )
-        self.votes[ctx.guild.id] = defaultdict(list)
-        await self.on_vote(guild_id=ctx.guild.id, msg_time=ctx.message.created_at)
-        await ctx.send(embed=embed)
+        self._set_votes(guild_id)
+        self.hammered.discard(guild_id)
+        self._drop_deferred(transition)
+        # the closed phase moves to cold storage, leaving only the new phase hot
+        self.vote_history[guild_id] = []
+        self._history_partial.discard(guild_id)
+        transition.archive_phase = attrs.asdict(transition.old_phase)
+        transition.votes = {}
+        transition.history_entry = attrs.asdict(self._snapshot(guild_id, ctx.message.created_at))
+        transition.announce(lambda: self._update_votecount(game=game, guild_id=guild_id))
+        transition.announce(lambda: self.outbound.send(ctx, priority=Priority.CRITICAL, embed=embed))
+
+    def _undo_transition(
+        self,
+        guild_id: int,
+        enabled: bool,
+        votes: Dict[str, List[str]],
+        history: List[VoteSnapshot],
+        hammered: bool,
+        history_partial: bool,
+    ):
+        self.enabled = enabled
+        self._set_votes(guild_id, votes)
+        self.vote_history[guild_id] = history
+        if hammered:
+            self.hammered.add(guild_id)
+        if history_partial:
+            self._history_partial.add(guild_id)
+
+    def checkpoint_state(self, guild_id: int) -> Dict:
+        return {
+            "votes": {target: list(voters) for target, voters in self.votes[guild_id].items() if voters},
+            "hammered": guild_id in self.hammered,
+        }
+
+    def restore_checkpoint(self, ctx: Context, transition: PhaseTransition, state: Optional[Dict]):
+        guild_id = transition.guild_id
+        game = self.games[guild_id]
+        transition.on_failure(
+            partial(
+                self._undo_transition,
+                guild_id,
+                self.enabled,
+                self.votes[guild_id],
+                # the restored votes are appended to this list when the phase stays the same
+                list(self.vote_history[guild_id]),
+                guild_id in self.hammered,
+                guild_id in self._history_partial,
+            )
+        )
+        self._set_votes(guild_id, deepcopy(state["votes"]) if state else None)
+        if state and state["hammered"]:
+            self.hammered.add(guild_id)
+        else:
+            self.hammered.discard(guild_id)
+        if transition.new_phase != transition.old_phase:
+            # rolling back over a phase change closes the phase the mistake opened, same as a phase change would;
+            # the restored phase's earlier history is still in its archive and is merged back when it closes
+            self.enabled = transition.new_phase.phase == Phase.DAY
+            self.vote_history[guild_id] = []
+            self._history_partial.discard(guild_id)
+            transition.archive_phase = attrs.asdict(transition.old_phase)
+        transition.votes = {target: list(voters) for target, voters in self.votes[guild_id].items()}
+        transition.history_entry = attrs.asdict(self._snapshot(guild_id, ctx.message.created_at))
+        transition.announce(lambda: self._update_votecount(game=game, guild_id=guild_id))
+
+    @Cog.listener("on_phase_change")
+    async def on_phase_change(self, ctx: Context, old_phase: GamePhase, new_phase: GamePhase):
+        self._archive_index.pop(ctx.guild.id, None)
+        self._cold_history.discard((ctx.guild.id, old_phase))
 
     @Cog.listener("on_phase_update")
     async def on_phase_update(self, ctx: Context):
         await self.on_vote(guild_id=ctx.guild.id, msg_time=ctx.message.created_at)
 
+    @Cog.listener("on_roster_update")
+    async def on_roster_update(self, ctx: Context):
+        # a death or a removed player lowers the majority, which can put a wagon that is already there over it
+        if self.enabled:
+            await self._check_hammer(ctx)
+
+    def dump_state(self) -> Dict[int, Dict]:
+        return {
+            guild_id: {
+                "votes": dict(self.votes[guild_id]),
+                "history": [hist.to_state() for hist in self.vote_history[guild_id][-SNAPSHOT_HISTORY_LIMIT:]],
+                "history_partial": guild_id in self._history_partial
+                or len(self.vote_history[guild_id]) > SNAPSHOT_HISTORY_LIMIT,
+                "board": self.board_messages.get(guild_id),
+                "hammered": guild_id in self.hammered,
+            }
+            for guild_id in set(self.votes) | set(self.vote_history)
+        }
+
+    def load_state(self, guild_id: int, state: Dict):
+        self._set_votes(guild_id, state["votes"])
+        if state.get("hammered"):
+            self.hammered.add(guild_id)
+        self.vote_history[guild_id] = [VoteSnapshot.from_state(h) for h in state["history"]]
+        if state["history_partial"]:
+            self._history_partial.add(guild_id)
+        if state["board"]:
+            self.board_messages[guild_id] = state["board"]
+
     @Cog.listener("on_ready")
     async def _setup(self):
-        votes = self.db["votes"].find()
-        async for vc in votes:
-            guild_id = vc.pop("_id")
-            self.votes[guild_id] = defaultdict(list, vc)
+        if warm_started(self.bot):
+            return
+        for guild_id, vc in (await self.storage.load_votes()).items():
+            if not owns_guild(self.bot, guild_id):
+                continue
+            self._set_votes(guild_id, vc)
             await self._update_votecount(self.games[guild_id], guild_id)
-        vote_histories = self.db["vote_history"].find()
-        async for vh in vote_histories:
-            guild_id = vh["_id"]
-            self.vote_history[guild_id] = [VoteSnapshot.from_dict(h) for h in vh["history"]]
-
-    @staticmethod
-    def _remove_vote(votes: Dict[str, List[str]], voter: str):
-        for target, voters in votes.items():
-            if voter in voters:
-                voters.remove(voter)
+        for guild_id, vh in (await self.storage.load_all_history()).items():
+            if not owns_guild(self.bot, guild_id):
+                continue
+            self.vote_history[guild_id] = [VoteSnapshot.from_dict(h) for h in vh]
+            # history written before phases were archived is moved to cold storage on first start
+            await self._archive_closed_phases(guild_id)
+
+    def _set_votes(self, guild_id: int, votes: Optional[Dict[str, List[str]]] = None):
+        self.votes[guild_id] = defaultdict(list, votes or {})
+        self._tallies.pop(guild_id, None)
+
+    def _get_tally(self, guild_id: int) -> WagonTally:
+        tally = self._tallies.get(guild_id)
+        if not tally:
+            tally = self._tallies[guild_id] = WagonTally.from_votes(self.votes[guild_id])
+        return tally
+
+    def _cast_vote(self, guild_id: int, voter: str, target: Optional[str]):
+        votes = self.votes[guild_id]
+        previous = self._get_tally(guild_id).vote(voter, target)
+        if previous is not None and voter in votes[previous]:
+            votes[previous].remove(voter)
+        if target is not None:
+            votes[target].append(voter)
+
+    def _get_majority(self, game: GameState, guild_id: int) -> int:
+        version, needed = self._majorities.get(guild_id, (None, 0))
+        if version != game.roster_version:
+            needed = majority(sum(player.alive for player in game.players))
+            self._majorities[guild_id] = (game.roster_version, needed)
+        return needed
+
+    async def _check_hammer(self, ctx: Context):
+        game = self.games[ctx.guild.id]
+        tally = self._get_tally(ctx.guild.id)
+        if tally.top < self._get_majority(game, ctx.guild.id) or ctx.guild.id in self.hammered:
+            return
+        target, count = tally.leader()
+        self.hammered.add(ctx.guild.id)
+        if game.rules.announce_hammer:
+            # a majority to sleep ends the day the same way, but no one is eliminated
+            if target == "Sleep / No Elim":
+                body = f"## Majority to sleep!\n**{count}** players voted to sleep, so no one is eliminated today."
+            else:
+                body = f"## Hammer!\n**{target}** has reached majority with **{count}** votes."
+            await self.outbound.send(
+                ctx,
+                priority=Priority.CRITICAL,
+                embed=Embed.InfoEmbed(
+                    body=body + ("\nVoting is locked until the phase changes." if game.rules.lock_on_hammer else ""),
+                ),
+            )
+        self.bot.dispatch("hammer", ctx, target, count)
 
     def _check_vote(
         self,
@@ -315,34 +640,60 @@ class Vote(commands.Cog):
         voter: Player,
         target: Optional[Player] = None,
         target_required: bool = False,
+        suggestions: Sequence[Player] = (),
     ):
         if not self.enabled:
             raise VoteError("Voting is currently disabled!")
 
+        if ctx.guild.id in self.hammered and self.games[ctx.guild.id].rules.lock_on_hammer:
+            raise VoteError("A player has been hammered; voting is locked until the phase changes!")
+
         if ctx.channel.id != self.games[ctx.guild.id].config.vote_channel:
             raise VoteError(f"Votes can only be submitted in <#{self.games[ctx.guild.id].config.vote_channel}>!")
 
         if not voter or not voter.alive:
             raise VoteError("Only (alive) players are allowed to use this command!")
 
+        if target_required and not target and suggestions:
+            raise VoteError(
+                f"Couldn't tell which player you meant! Did you mean: {', '.join(p.fr_name for p in suggestions)}?"
+            )
         if target_required and (not target or not target.alive):
             raise VoteError(f"The player you have selected is not a valid vote target!")
 
+    def _get_name_index(self, guild_id: int) -> NameIndex[Player]:
+        game = self.games[guild_id]
+        index = self._name_indexes.get(guild_id)
+        if not index or index.version != game.roster_version:
+            # only the living can be voted for, so a dead player's name never makes a prefix ambiguous or wins a typo
+            index = NameIndex.build(
+                game.roster_version, ((player.fr_name, player) for player in game.players if player.alive)
+            )
+            self._name_indexes[guild_id] = index
+        return index
+
     async def _update_votecount(self, game: GameState, guild_id: int):
         vc_embed = Embed.InfoEmbed(
             body=f"## {game.phase} Vote Count:\n{self._compose_votecount(self.votes[guild_id], self.games[guild_id].player_slot_map)}",
             footer=f"last updated at {datetime.now(tz=FR_TZ).strftime(TIME_FORMAT)}",
         )
         vc_channel = self.bot.get_channel(game.config.vc_channel)
+        if guild_id in self.board_messages:
+            try:
+                await self.outbound.edit(vc_channel.get_partial_message(self.board_messages[guild_id]), embed=vc_embed)
+                return
+            except discord.NotFound:
+                del self.board_messages[guild_id]
         vc_msg = None
         async for msg in vc_channel.history(oldest_first=True):
             if msg.author.id == self.bot.user.id:
                 vc_msg = msg
                 break
         if not vc_msg:
-            await vc_channel.send(embed=vc_embed)
+            vc_msg = await self.outbound.send(vc_channel, priority=Priority.HIGH, embed=vc_embed)
         else:
-            await vc_msg.edit(embed=vc_embed)
+            await self.outbound.edit(vc_msg, embed=vc_embed)
+        self.board_messages[guild_id] = vc_msg.id
 
     @staticmethod
     def _compose_votecount(
@@ -364,9 +715,9 @@ class Vote(commands.Cog):
                 res += f"**{target} ({count})**: {', '.join(voters)}\n"
         return res or "No votes yet!"
 
-    def get_vote_snapshot(self, guild_id: int, msg_time: datetime):
+    async def get_vote_snapshot(self, guild_id: int, msg_time: datetime):
         idx = 0
-        vote_history = self.vote_history[guild_id]
+        vote_history = await self._history_at(guild_id, msg_time)
         for vote_snapshot in vote_history:
             if vote_snapshot.time_utc > msg_time:
                 break
@@ -375,16 +726,84 @@ class Vote(commands.Cog):
             return VoteSnapshot(time_utc=msg_time, votes={}, phase=self.games[guild_id].phase)
         return vote_history[idx - 1]
 
+    async def _history_at(self, guild_id: int, msg_time: datetime) -> List[VoteSnapshot]:
+        await self._ensure_history(guild_id, msg_time)
+        hot = self.vote_history[guild_id]
+        if hot and hot[0].time_utc <= msg_time:
+            return hot
+        archived = [a for a in await self._get_archive_index(guild_id) if pytz.utc.localize(a["start"]) <= msg_time]
+        if not archived:
+            return hot
+        return await self._load_archive(guild_id, GamePhase(**archived[-1]["phase"]))
+
+    async def _phase_boundary(self, guild_id: int, boundary: PhaseBoundary) -> datetime:
+        if boundary.phase == self.games[guild_id].phase:
+            if boundary.end:
+                return datetime.now(tz=pytz.utc)
+            await self._ensure_history(guild_id)
+            current = [hist.time_utc for hist in self.vote_history[guild_id] if hist.phase == boundary.phase]
+            if current:
+                return current[0]
+        for archive in await self._get_archive_index(guild_id):
+            if GamePhase(**archive["phase"]) == boundary.phase:
+                return pytz.utc.localize(archive["end" if boundary.end else "start"])
+        raise ModBotError(f"There is no vote history for **{boundary.phase}**!")
+
+    async def _get_archive_index(self, guild_id: int) -> List[Dict]:
+        if guild_id not in self._archive_index:
+            self._archive_index[guild_id] = await self.storage.load_archive_index(guild_id)
+        return self._archive_index[guild_id]
+
+    async def _load_archive(self, guild_id: int, phase: GamePhase, cache: bool = True) -> List[VoteSnapshot]:
+        snapshots = self._cold_history.get((guild_id, phase))
+        if snapshots is None:
+            vh = await self.storage.load_archive(guild_id, attrs.asdict(phase))
+            snapshots = [VoteSnapshot.from_dict(h) for h in vh]
+            if cache:
+                self._cold_history.put((guild_id, phase), snapshots)
+        return snapshots
+
+    async def _archive_closed_phases(self, guild_id: int):
+        current = self.games[guild_id].phase
+        closed = {hist.phase for hist in self.vote_history[guild_id] if hist.phase != current}
+        for phase in closed:
+            await self.storage.archive_phase(guild_id, attrs.asdict(phase))
+            self._cold_history.discard((guild_id, phase))
+        if closed:
+            self.vote_history[guild_id] = [hist for hist in self.vote_history[guild_id] if hist.phase == current]
+            self._archive_index.pop(guild_id, None)
+
+    async def _ensure_history(self, guild_id: int, msg_time: Optional[datetime] = None):
+        vote_history = self.vote_history[guild_id]
+        if guild_id not in self._history_partial or (
+            msg_time and vote_history and vote_history[0].time_utc <= msg_time
+        ):
+            return
+        vh = await self.storage.load_history(guild_id)
+        if vh:
+            self.vote_history[guild_id] = [VoteSnapshot.from_dict(h) for h in vh]
+        self._history_partial.discard(guild_id)
+
+    async def _save_history(self, guild_id: int):
+        await mark_dirty(self.bot)
+        await self.storage.replace_history(guild_id, [attrs.asdict(hist) for hist in self.vote_history[guild_id]])
+
+    def _snapshot(self, guild_id: int, msg_time: datetime) -> VoteSnapshot:
+        vote_snapshot = VoteSnapshot(msg_time, deepcopy(self.votes[guild_id]), self.games[guild_id].phase)
+        self.vote_history[guild_id].append(vote_snapshot)
+        return vote_snapshot
+
     async def on_vote(self, guild_id: int, msg_time: datetime, update_votecount: bool = True):
         game = self.games[guild_id]
-        self.vote_history[guild_id].append(VoteSnapshot(msg_time, deepcopy(self.votes[guild_id]), game.phase))
+        vote_snapshot = self._snapshot(guild_id, msg_time)
         if update_votecount:
             await self._update_votecount(game=game, guild_id=guild_id)
-        await self.db["votes"].find_one_and_replace(
-            {"_id": guild_id}, self.votes[guild_id] | {"_id": guild_id}, upsert=True
-        )
-        await self.db["vote_history"].find_one_and_replace(
-            {"_id": guild_id},
-            {"_id": guild_id, "history": [attrs.asdict(hist) for hist in self.vote_history[guild_id]]},
-            upsert=True,
-        )
+        await mark_dirty(self.bot)
+        await self.storage.save_votes(guild_id, self.votes[guild_id])
+        # history is append-only, so only the new snapshot is sent; the in-memory list may be a partial
+        # tail restored from a warm-start snapshot and must never overwrite the full history
+        await self.storage.append_history(guild_id, attrs.asdict(vote_snapshot))
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Vote(bot=bot, games=bot.games))
@@ -6,6 +6,41 @@ FR_TZ = pytz.timezone("US/Pacific")
 TIME_FORMAT = "%-d %b %Y %H:%M:%S FRT"
 
 OK_EMOJI = "<:ok:1297854432763056140>"
+# on a prefix vote that was over the rate limit and will be counted a little later
+WAIT_EMOJI = "\u23f3"
+
+DASHBOARD_DEBOUNCE_SECONDS = 2
+CONFIG_WATCH_INTERVAL = 10
+SHARD_LEASE_TTL = 60
+SNAPSHOT_VERSION = 1
+SNAPSHOT_INTERVAL = 300
+SNAPSHOT_HISTORY_LIMIT = 500
+# closed phases of vote history kept decompressed in memory, across all guilds
+HISTORY_CACHE_PHASES = 8
+# cog modules loaded when the config does not list its own `extensions`
+DEFAULT_EXTENSIONS = ("phase", "player", "vote", "rand", "config", "game")
+# documents DBClient.select keeps in memory, and for how many seconds
+DB_CACHE_SIZE = 1024
+DB_CACHE_TTL = 60
+DB_LIST_BATCH_SIZE = 100
+AUTOCOMPLETE_LIMIT = 25
+PLAYER_LIST_PAGE_SIZE = 30
+PLAYER_INFO_PAGE_SIZE = 5
+ROLE_LIST_PAGE_SIZE = 5
+MAX_NAME_SUGGESTIONS = 5
+MAX_SUGGESTION_DISTANCE = 3
+OUTBOUND_CONCURRENCY = 4
+# (requests, seconds) token buckets in the voting channel; votes over the limit are collapsed into the user's
+# latest one, and warnings over the limit are skipped; the guild bucket only guards against a flood, a busy day with
+# everyone voting at once stays well under it
+VOTE_USER_BUCKET = (3, 10)
+VOTE_GUILD_BUCKET = (60, 10)
+WARN_USER_BUCKET = (1, 30)
+WARN_GUILD_BUCKET = (5, 10)
+# checkpoints kept per guild for `!game rollback`
+CHECKPOINT_LIMIT = 50
+# seconds before a phase deadline at which players get a reminder
+DEADLINE_REMINDERS = (3600, 600)
 
 
 class Alignment:
@@ -30,6 +65,39 @@ class SideEffect:
     PEW_PEW = "Pew Pew"
 
 
+class Priority:
+    CRITICAL = 0
+    HIGH = 1
+    NORMAL = 2
+    LOW = 3
+
+
+# requests allowed per window (in seconds) for each kind of request, per channel
+OUTBOUND_ROUTE_BUDGETS = {
+    "send": (5, 5),
+    "edit": (5, 5),
+    "reaction": (1, 0.25),
+    "pin": (5, 5),
+    "delete": (5, 1),
+}
+# low-value requests that have waited longer than this are dropped instead of sent
+OUTBOUND_MAX_AGE = {Priority.LOW: 30}
+
+
+class ActionType:
+    BLOCK = "Block"
+    REDIRECT = "Redirect"
+    KILL = "Kill"
+
+
+ACTION_PRIORITY_MAP = {
+    ActionType.BLOCK: 10,
+    ActionType.REDIRECT: 20,
+    ActionType.KILL: 50,
+}
+DEFAULT_ACTION_PRIORITY = 40
+
+
 WINCON_MAP = {
     Alignment.TOWN: "You win when all mafia members have been eliminated, and there is at least one town-aligned member alive.",
     Alignment.MAFIA: "You win when the mafia make up half of the remaining players alive, or when nothing can prevent this.",
@@ -5,3 +5,9 @@ class ModBotError(Exception):
 
 
 class VoteError(ModBotError): ...
+
+
+class ConfigError(ModBotError): ...
+
+
+class ShardError(ModBotError): ...
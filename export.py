@@ -0,0 +1,139 @@
+from __future__ import annotations
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from constants import FR_TZ, TIME_FORMAT
+from exceptions import ModBotError
+from model import GamePhase
+
+EXPORT_FORMATS = ("json", "csv", "bbcode")
+CSV_FIELDS = ("type", "time_utc", "phase", "voter", "target", "count", "voters")
+
+
+def _voter_targets(votes: Dict[str, List[str]]) -> Dict[str, str]:
+    return {voter: target for target, voters in votes.items() for voter in voters}
+
+
+def iter_events(history: Iterable, phase: Optional[GamePhase] = None) -> Iterator[Dict]:
+    # every history entry is the full vote state after a change, so individual votes are recovered by
+    # diffing neighbouring entries; only two of them are ever held at a time, and `history` may be a generator
+    prev = None
+    for snapshot in history:
+        new_phase = prev is None or snapshot.phase != prev.phase
+        if new_phase and prev is not None and (phase is None or prev.phase == phase):
+            yield _final_count(prev)
+        if phase is None or snapshot.phase == phase:
+            if new_phase:
+                yield {"type": "phase_start", "time_utc": snapshot.time_utc.isoformat(), "phase": str(snapshot.phase)}
+            before = _voter_targets(prev.votes) if prev is not None and not new_phase else {}
+            after = _voter_targets(snapshot.votes)
+            for voter in list(before) + [voter for voter in after if voter not in before]:
+                if before.get(voter) != after.get(voter):
+                    yield {
+                        "type": "vote",
+                        "time_utc": snapshot.time_utc.isoformat(),
+                        "phase": str(snapshot.phase),
+                        "voter": voter,
+                        "target": after.get(voter),
+                    }
+        prev = snapshot
+    if prev is not None and (phase is None or prev.phase == phase):
+        yield _final_count(prev)
+
+
+def _final_count(snapshot) -> Dict:
+    return {
+        "type": "final_count",
+        "time_utc": snapshot.time_utc.isoformat(),
+        "phase": str(snapshot.phase),
+        "votes": {target: list(voters) for target, voters in snapshot.votes.items() if voters},
+    }
+
+
+def iter_json(events: Iterable[Dict]) -> Iterator[str]:
+    yield "["
+    sep = "\n"
+    for event in events:
+        yield sep + json.dumps(event)
+        sep = ",\n"
+    yield "\n]\n"
+
+
+def iter_csv(events: Iterable[Dict]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for event in events:
+        if event["type"] == "final_count":
+            for target, voters in event["votes"].items():
+                writer.writerow(event | {"target": target, "count": len(voters), "voters": ";".join(voters)})
+        else:
+            writer.writerow(event)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_bbcode(events: Iterable[Dict], compose_votecount: Callable[[Dict[str, List[str]]], str]) -> Iterator[str]:
+    for event in events:
+        if event["type"] == "phase_start":
+            yield f"[size=150][b]{event['phase']}[/b][/size]\n"
+        elif event["type"] == "vote":
+            action = f"votes {event['target']}" if event["target"] else "unvotes"
+            yield f"[sup]{_frt(event['time_utc'])}[/sup] {event['voter']} {action}\n"
+        else:
+            yield (
+                f"\n[b]{event['phase']} Final Vote Count:[/b]\n"
+                f"{compose_votecount(event['votes'])}\n"
+                f"[sup]as of {_frt(event['time_utc'])}[/sup]\n\n"
+            )
+
+
+def _frt(time_utc: str) -> str:
+    return datetime.fromisoformat(time_utc).astimezone(FR_TZ).strftime(TIME_FORMAT)
+
+
+def iter_export(
+    history: Iterable,
+    fmt: str,
+    phase: Optional[GamePhase] = None,
+    compose_votecount: Callable[[Dict[str, List[str]]], str] = None,
+) -> Iterator[str]:
+    events = iter_events(history, phase)
+    if fmt == "json":
+        return iter_json(events)
+    if fmt == "csv":
+        return iter_csv(events)
+    return iter_bbcode(events, compose_votecount)
+
+
+def write_export(chunks: Iterable[str], f: io.BufferedIOBase) -> int:
+    size = 0
+    for chunk in chunks:
+        size += f.write(chunk.encode("utf-8"))
+    f.seek(0)
+    return size
+
+
+def parse_export_args(args: str) -> Tuple[Optional[GamePhase], str]:
+    words = args.split()
+    fmt = "bbcode"
+    if words and words[-1].lower() in EXPORT_FORMATS:
+        fmt = words.pop().lower()
+    phase_str = " ".join(words)
+    if not phase_str or phase_str.lower() == "all":
+        return None, fmt
+    phase = GamePhase.from_str(phase_str)
+    if not phase:
+        raise ModBotError(
+            "Invalid export options given!\n\n"
+            "Examples:\n"
+            "- `!vote export all csv`\n"
+            "- `!vote export d2 json`\n"
+            "- `!vote export Night 1 bbcode`"
+        )
+    return phase, fmt
@@ -0,0 +1,88 @@
+from __future__ import annotations
+from typing import Dict, List, Optional
+
+import attrs
+import yaml
+from attr import define, Factory
+
+from constants import DEFAULT_EXTENSIONS
+from exceptions import ConfigError
+from model import Config, Rules, Player, RoleTemplate, GameState
+
+# channels the bot creates for itself at runtime; a reload should not forget them
+RUNTIME_CHANNELS = ("announce_channel", "actions_channel")
+
+
+@define
+class GuildSettings:
+    guild_id: int
+    config: Config
+    rules: Rules = Rules()
+    players: List[Player] = Factory(list)
+    roles: Optional[List[RoleTemplate]] = None
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> GuildSettings:
+        if "guild_id" not in d or "server_config" not in d:
+            raise ConfigError("Every guild in the config needs a `guild_id` and a `server_config`!")
+        try:
+            return cls(
+                guild_id=int(d["guild_id"]),
+                config=Config(**d["server_config"]),
+                rules=Rules(**d.get("rules", {})),
+                players=[Player.from_dict(p) for p in d.get("players", [])],
+                roles=[RoleTemplate.from_dict(rc) for rc in d.get("roles", [])] or None,
+            )
+        except (TypeError, ValueError) as e:
+            raise ConfigError(f"Invalid config for guild {d['guild_id']}: {e}")
+
+    def to_gamestate(self) -> GameState:
+        return GameState(config=self.config, players=self.players, rules=self.rules, roles=self.roles)
+
+    def diff(self, game: GameState) -> List[str]:
+        changes = []
+        for name, old, new in [("server_config", game.config, self.config), ("rules", game.rules, self.rules)]:
+            for field in attrs.fields(type(old)):
+                old_val, new_val = getattr(old, field.name), getattr(new, field.name)
+                if field.name in RUNTIME_CHANNELS and new_val is None:
+                    continue
+                if old_val != new_val:
+                    changes.append(f"{name}.{field.name}: {old_val} -> {new_val}")
+        if self.roles is not None and self.roles != game.roles:
+            changes.append(f"roles: {len(game.roles or [])} -> {len(self.roles)} rolecards")
+        return changes
+
+    def apply(self, game: GameState) -> None:
+        config = attrs.evolve(
+            self.config,
+            **{name: getattr(game.config, name) for name in RUNTIME_CHANNELS if getattr(self.config, name) is None},
+        )
+        game.config, game.rules = config, self.rules
+        if self.roles is not None:
+            game.roles = self.roles
+        game.touch_roster()
+
+
+def _load_raw(path: str) -> Dict:
+    try:
+        with open(path, "r") as stream:
+            raw = yaml.safe_load(stream)
+    except (OSError, yaml.YAMLError) as e:
+        raise ConfigError(f"Could not read {path}: {e}")
+    if not isinstance(raw, dict):
+        raise ConfigError(f"{path} must contain a mapping!")
+    return raw
+
+
+def load_extensions(path: str = "config.yaml") -> List[str]:
+    extensions = _load_raw(path).get("extensions", list(DEFAULT_EXTENSIONS))
+    if not isinstance(extensions, list) or not all(isinstance(name, str) for name in extensions):
+        raise ConfigError("`extensions` must be a list of cog module names!")
+    return extensions
+
+
+def load_guild_settings(path: str = "config.yaml") -> Dict[int, GuildSettings]:
+    raw = _load_raw(path)
+    entries = raw.get("guilds") or [raw]
+    settings = [GuildSettings.from_dict(entry) for entry in entries]
+    return {s.guild_id: s for s in settings}
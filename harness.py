@@ -0,0 +1,387 @@
+"""Simulated guild load harness.
+
+Drives the Phases, Players, Vote and Actions cogs through scripted games against fake Discord objects and the
+in-memory store, and reports command latency, throughput and the Discord API calls the bot would have made.
+
+    python harness.py --players 50 --votes 5000 --days 3
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import discord
+import pytz
+from discord.ext import commands
+
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from cogs.actions import Actions
+from cogs.phase import Phases
+from cogs.player import Players
+from cogs.vote import Vote
+from constants import OUTBOUND_ROUTE_BUDGETS
+from exceptions import ModBotError
+from model import Config, GameState, RoleTemplate
+from outbound import Outbound, set_outbound
+from ratelimit import RateLimiter
+
+_snowflakes = itertools.count(1 << 60)
+
+
+def snowflake() -> int:
+    return next(_snowflakes)
+
+
+class FakeApi:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+
+    async def call(self, kind: str) -> None:
+        self.calls[kind] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeMember:
+    def __init__(self, name: str, administrator: bool = False, bot: bool = False):
+        self.id = snowflake()
+        self.name = name
+        self.bot = bot
+        self.guild_permissions = SimpleNamespace(administrator=administrator)
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+
+class FakeRole:
+    def __init__(self, role_id: int):
+        self.id = role_id
+
+
+class FakeMessage:
+    def __init__(self, api: FakeApi, channel: FakeChannel, author: FakeMember, content: str = "", **kwargs):
+        self.api = api
+        self.id = snowflake()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embeds = kwargs.get("embeds") or ([kwargs["embed"]] if kwargs.get("embed") else [])
+        self.created_at = datetime.now(tz=pytz.utc)
+
+    async def edit(self, **kwargs) -> FakeMessage:
+        await self.api.call("edit")
+        if "embed" in kwargs:
+            self.embeds = [kwargs["embed"]]
+        return self
+
+    async def add_reaction(self, emoji: str) -> None:
+        await self.api.call("add_reaction")
+
+    async def pin(self) -> None:
+        await self.api.call("pin")
+
+    async def delete(self, delay: Optional[float] = None) -> None:
+        await self.api.call("delete")
+
+    async def reply(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeChannel:
+    def __init__(self, api: FakeApi, guild: FakeGuild, name: str, category: Optional[SimpleNamespace] = None):
+        self.api = api
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.category = category
+        self.members: List[FakeMember] = []
+        self.messages: Dict[int, FakeMessage] = {}
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        await self.api.call("send")
+        msg = FakeMessage(self.api, self, self.guild.bot_member, content or "", **kwargs)
+        self.messages[msg.id] = msg
+        return msg
+
+    def get_partial_message(self, msg_id: int) -> FakeMessage:
+        return self.messages[msg_id]
+
+    async def history(self, oldest_first: bool = False, limit: Optional[int] = None):
+        await self.api.call("history")
+        messages = list(self.messages.values())
+        for msg in messages if oldest_first else reversed(messages):
+            yield msg
+
+
+class FakeGuild:
+    def __init__(self, api: FakeApi, bot_member: FakeMember):
+        self.api = api
+        self.id = snowflake()
+        self.bot_member = bot_member
+        self.default_role = FakeRole(self.id)
+        self.categories: List[SimpleNamespace] = []
+        self.channels: Dict[int, FakeChannel] = {}
+        self.members: Dict[int, FakeMember] = {}
+
+    def add_category(self) -> SimpleNamespace:
+        category = SimpleNamespace(id=snowflake())
+        self.categories.append(category)
+        return category
+
+    def add_channel(self, name: str, category: Optional[SimpleNamespace] = None) -> FakeChannel:
+        channel = FakeChannel(self.api, self, name, category)
+        self.channels[channel.id] = channel
+        return channel
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self.channels.get(channel_id)
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        return self.members.get(member_id)
+
+    async def create_text_channel(self, name: str, category=None, overwrites=None) -> FakeChannel:
+        await self.api.call("create_text_channel")
+        return self.add_channel(name, category)
+
+
+class FakeContext:
+    def __init__(
+        self, bot: FakeBot, channel: FakeChannel, author: FakeMember, content: str, command: commands.Command = None
+    ):
+        self.bot = bot
+        self.command = command
+        self.interaction = None
+        self.guild = channel.guild
+        self.channel = channel
+        self.author = author
+        self.message = FakeMessage(channel.api, channel, author, content)
+        self.invoked_subcommand = None
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+    async def defer(self, **kwargs) -> None:
+        pass
+
+
+class FakeBot:
+    def __init__(self, api: FakeApi):
+        self.api = api
+        self.user = FakeMember("modbot", bot=True)
+        self.guilds: List[FakeGuild] = []
+        self.cogs: Dict[str, commands.Cog] = {}
+        self.tree = SimpleNamespace(add_command=lambda command: None)
+        self.intents = discord.Intents.default()
+        self._listeners: Dict[str, List] = defaultdict(list)
+        self._tasks: set = set()
+
+    def add_cog(self, cog: commands.Cog) -> None:
+        self.cogs[cog.qualified_name] = cog
+        for command in cog.walk_commands():
+            command.cog = cog
+        for name, listener in cog.get_listeners():
+            self._listeners[name].append(listener)
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        for guild in self.guilds:
+            channel = guild.get_channel(channel_id)
+            if channel:
+                return channel
+        return None
+
+    def get_partial_messageable(self, channel_id: int) -> Optional[FakeChannel]:
+        return self.get_channel(channel_id)
+
+    def dispatch(self, event: str, *args: Any) -> None:
+        for listener in self._listeners[f"on_{event}"]:
+            task = asyncio.create_task(listener(*args))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def settle(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+
+class Simulation:
+    def __init__(
+        self, n_players: int, seed: int = 0, latency: float = 0.0, real_budgets: bool = False, vote_limits: bool = False
+    ):
+        self.rng = random.Random(seed)
+        self.api = FakeApi(latency)
+        budgets = OUTBOUND_ROUTE_BUDGETS if real_budgets else {kind: (1 << 30, 1) for kind in OUTBOUND_ROUTE_BUDGETS}
+        self.outbound = Outbound(budgets=budgets)
+        set_outbound(self.outbound)
+
+        self.bot = FakeBot(self.api)
+        self.guild = FakeGuild(self.api, self.bot.user)
+        self.bot.guilds.append(self.guild)
+        self.mod = FakeMember("mod", administrator=True)
+        private_category = self.guild.add_category()
+        self.private_category = private_category
+        self.vote_channel = self.guild.add_channel("voting")
+        self.vc_channel = self.guild.add_channel("vote-count")
+        self.mod_channel = self.guild.add_channel("mod-chat", private_category)
+        self.game = GameState(
+            config=Config(
+                private_category=private_category.id,
+                vote_channel=self.vote_channel.id,
+                vc_channel=self.vc_channel.id,
+            )
+        )
+        self.games = defaultdict(GameState, {self.guild.id: self.game})
+
+        self.phases = Phases(bot=self.bot, games=self.games)
+        self.players = Players(bot=self.bot, games=self.games)
+        self.vote = Vote(bot=self.bot, games=self.games)
+        if not vote_limits:
+            # scripted voters vote far faster than people do, which would otherwise measure the deferral instead
+            self.vote._user_vote_limits = RateLimiter(1 << 30, 1)
+            self.vote._guild_vote_limits = RateLimiter(1 << 30, 1)
+        self.actions = Actions(bot=self.bot, games=self.games)
+        for cog in (self.phases, self.players, self.vote, self.actions):
+            self.bot.add_cog(cog)
+
+        self.members = [FakeMember(f"Player{i:03d}") for i in range(n_players)]
+        self.player_channels: Dict[int, FakeChannel] = {}
+        for member in self.members:
+            self.guild.members[member.id] = member
+            self.player_channels[member.id] = self.guild.add_channel(member.name.lower(), private_category)
+
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+
+    async def run(self, command: commands.Command, channel: FakeChannel, author: FakeMember, *args, **kwargs) -> None:
+        content = " ".join(map(str, [f"!{command.qualified_name}", *args, *kwargs.values()]))
+        ctx = FakeContext(self.bot, channel, author, content, command)
+        start = time.perf_counter()
+        try:
+            if not all(check(ctx) for check in command.checks):
+                raise commands.CheckFailure()
+            await command.callback(command.cog, ctx, *args, **kwargs)
+            await command.cog.cog_after_invoke(ctx)
+        except (ModBotError, commands.CheckFailure) as e:
+            self.errors[type(e).__name__] += 1
+        self.latencies[command.qualified_name].append(time.perf_counter() - start)
+
+    def alive_members(self) -> List[FakeMember]:
+        alive = {player.discord_id for player in self.game.players if player.alive}
+        return [member for member in self.members if member.id in alive]
+
+    async def setup_game(self) -> None:
+        for member in self.members:
+            await self.run(self.players.add, self.mod_channel, self.mod, member.name, member.mention)
+        # what `!roles rand` would hand out
+        townie = RoleTemplate.from_dict({"role": {"alignment": "Town", "role": "Vanilla Townie"}})
+        roleblocker = RoleTemplate.from_dict(
+            {"role": {"alignment": "Town", "role": "Roleblocker"}, "actions": [{"name": "Block", "kind": "Block"}]}
+        )
+        goon = RoleTemplate.from_dict(
+            {
+                "role": {"alignment": "Mafia", "role": "Goon"},
+                "actions": [{"name": "Kill", "kind": "Kill", "modifiers": ["FACTIONAL"]}],
+            }
+        )
+        for i, player in enumerate(self.game.players):
+            template = goon if i % 10 == 0 else roleblocker if i % 10 == 1 else townie
+            player.role_card = template.instantiate()
+        self.game.touch_roster()
+
+    async def play_day(self, n_votes: int) -> None:
+        for _ in range(n_votes):
+            alive = self.alive_members()
+            voter = self.rng.choice(alive)
+            roll = self.rng.random()
+            if roll < 0.05:
+                await self.run(self.vote.unvote, self.vote_channel, voter)
+            elif roll < 0.08:
+                await self.run(self.vote.count, self.player_channels[voter.id], voter)
+            else:
+                target = self.game.player_from_id(self.rng.choice(alive).id)
+                await self.run(self.vote.player, self.vote_channel, voter, target.fr_name.lower())
+        await self.run(self.phases.next, self.mod_channel, self.mod)
+        await self.bot.settle()
+
+    async def play_night(self) -> None:
+        for member in self.alive_members():
+            player = self.game.player_from_id(member.id)
+            actions = player.role_card.get_available_actions(self.game.phase.phase)
+            if not actions:
+                continue
+            target = self.game.player_from_id(self.rng.choice(self.alive_members()).id)
+            await self.run(
+                self.actions.submit, self.player_channels[member.id], member, actions[0].name, targets=target.fr_name
+            )
+        await self.run(self.actions.resolve, self.mod_channel, self.mod, "apply")
+        await self.run(self.phases.next, self.mod_channel, self.mod)
+        await self.bot.settle()
+
+    async def drain(self) -> None:
+        await self.bot.settle()
+        if self.actions._dashboard_tasks:
+            await asyncio.gather(*self.actions._dashboard_tasks.values())
+        while self.outbound._queue or self.outbound._inflight:
+            await asyncio.sleep(0.01)
+        await self.outbound.stop()
+
+    def report(self, elapsed: float) -> str:
+        total = sum(len(samples) for samples in self.latencies.values())
+        lines = [f"{total} commands in {elapsed:.2f}s ({total / elapsed:.0f} commands/s)", ""]
+        lines.append(f"{'command':<18}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            pct = lambda p: samples[min(len(samples) - 1, int(p * len(samples)))] * 1000
+            lines.append(
+                f"{name:<18}{len(samples):>8}{statistics.median(samples) * 1000:>10.3f}"
+                f"{pct(0.95):>10.3f}{pct(0.99):>10.3f}{samples[-1] * 1000:>10.3f}"
+            )
+        lines += ["", "Simulated Discord API calls:"]
+        lines += [f"  {kind:<20}{count:>8}" for kind, count in self.api.calls.most_common()]
+        lines += [f"  {'total':<20}{sum(self.api.calls.values()):>8}", ""]
+        lines.append(f"Command errors: {dict(self.errors) or 'none'}")
+        lines.append(f"Outbound metrics: {self.outbound.metrics.summary()}")
+        return "\n".join(lines)
+
+
+async def main(args: argparse.Namespace) -> None:
+    sim = Simulation(
+        args.players,
+        seed=args.seed,
+        latency=args.api_latency / 1000,
+        real_budgets=args.real_budgets,
+        vote_limits=args.vote_limits,
+    )
+    start = time.perf_counter()
+    await sim.setup_game()
+    for _ in range(args.days):
+        if len(sim.alive_members()) < 2:
+            break
+        await sim.play_day(args.votes)
+        await sim.play_night()
+    await sim.drain()
+    print(sim.report(time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--votes", type=int, default=5000, help="votes cast per day")
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="simulated Discord API latency in ms")
+    parser.add_argument("--real-budgets", action="store_true", help="apply the real per-route rate limit budgets")
+    parser.add_argument("--vote-limits", action="store_true", help="apply the real per-user and per-guild vote limits")
+    asyncio.run(main(parser.parse_args()))
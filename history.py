@@ -0,0 +1,57 @@
+from __future__ import annotations
+import gzip
+import json
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Generic, Hashable, List, Optional, TypeVar
+
+import pytz
+
+T = TypeVar("T")
+
+
+def compress_history(entries: List[Dict]) -> bytes:
+    # entries are in storage shape, with naive UTC times
+    return gzip.compress(
+        json.dumps(
+            [entry | {"time_utc": pytz.utc.localize(entry["time_utc"]).timestamp()} for entry in entries],
+            separators=(",", ":"),
+        ).encode()
+    )
+
+
+def decompress_history(data: bytes) -> List[Dict]:
+    return [
+        entry | {"time_utc": datetime.fromtimestamp(entry["time_utc"], tz=pytz.utc).replace(tzinfo=None)}
+        for entry in json.loads(gzip.decompress(data))
+    ]
+
+
+def merge_history(archived: Optional[bytes], entries: List[Dict]) -> List[Dict]:
+    # a phase can be closed more than once, i.e. when a mod sets the phase back or `!vote restore` rebuilds the
+    # history; entries are keyed by time so a rebuilt entry replaces the archived one instead of doubling it
+    merged = {entry["time_utc"]: entry for entry in (decompress_history(archived) if archived else [])}
+    merged.update((entry["time_utc"], entry) for entry in entries)
+    return [merged[time_utc] for time_utc in sorted(merged)]
+
+
+class PhaseCache(Generic[T]):
+    # decompressed cold phases, least recently used first
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items: OrderedDict[Hashable, T] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[T]:
+        if key not in self._items:
+            return None
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key: Hashable, value: T) -> None:
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        self._items.pop(key, None)
@@ -1,75 +1,158 @@
+import asyncio
 import os
+import signal
 from collections import defaultdict
+from typing import Dict, Optional
 
 import discord
-import yaml
+from discord.app_commands import AppCommandError, CommandInvokeError, CommandTree
+from discord.app_commands import CheckFailure as AppCheckFailure
 from discord.ext import commands
 from discord.ext.commands import Context, errors
 
-from cogs.actions import Actions
-from cogs.phase import Phases
-from cogs.player import Players
-from cogs.rand import Random
-from cogs.roles import Roles
-from cogs.vote import Vote
-from cogs.help import Help
-from db_client import DBClient
+from api import VoteAPI
+from checkpoints import take_checkpoint
 from exceptions import ModBotError
-from model import GameState, Config, Rules, Player, RoleCard
-from utils import send_error_and_delete
+from guild_config import load_guild_settings, load_extensions
+from model import GameState
+from sharding import ShardPlan, ShardCoordinator
+from outbound import get_outbound
+from snapshot import WarmStart
+from storage import get_storage
+from utils import send_error, check_is_mod
 
 
-class ModBot(commands.Bot):
+class ModBot(commands.AutoShardedBot):
+    def __init__(
+        self, *args, shard_plan: ShardPlan, games: Dict[int, GameState], config_path: str = "config.yaml", **kwargs
+    ):
+        super().__init__(*args, shard_count=shard_plan.shard_count, shard_ids=shard_plan.shard_ids, **kwargs)
+        self.shard_plan = shard_plan
+        # cogs are extensions that pick these up in their setup(), so they can be (re)loaded at any time
+        self.games = games
+        self.config_path = config_path
+        # optional, and only reachable from this machine
+        api_port = os.environ.get("API_PORT")
+        self.api = VoteAPI(self, port=int(api_port)) if api_port else None
+        # in-memory state of cogs whose extension was unloaded, handed back when it is loaded again
+        self._unloaded_state: Dict[str, Dict[int, Dict]] = {}
+        self.before_invoke(self._checkpoint_mod_command)
+        self.tree.error(self.on_app_command_error)
+        self.outbound = get_outbound()
+        self.storage = get_storage()
+        self.coordinator = ShardCoordinator(plan=shard_plan, leases=self.storage.shard_leases(), on_lost=self.close)
+        self.warm_start = WarmStart(
+            bot=self,
+            storage=self.storage,
+            path=f"warm_start_{shard_plan.name}.json.gz",
+            epoch_key=f"snapshot_epoch_{shard_plan.name}",
+        )
 
     async def setup_hook(self) -> None:
         print(f"Logged in as: {self.user}")
-        await self.add_cog(phase)
-        await self.add_cog(player)
-        # await self.add_cog(roles)
-        await self.add_cog(vote)
-        # await self.add_cog(actions)
-        await self.add_cog(random)
-        # await self.add_cog(help)
+        await self.coordinator.start()
+        self.outbound.start()
+        for name in load_extensions(self.config_path):
+            await self.load_extension(f"cogs.{name}")
+        await self.warm_start.restore()
+        self.warm_start.start()
+        if self.api:
+            await self.api.start()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except NotImplementedError:
+            pass
         await self.tree.sync()
 
+    async def load_extension(self, name: str, *, package: Optional[str] = None) -> None:
+        await super().load_extension(name, package=package)
+        self._restore_state(self._resolve_name(name, package))
+
+    async def unload_extension(self, name: str, *, package: Optional[str] = None) -> None:
+        self._stash_state(self._resolve_name(name, package))
+        await super().unload_extension(name, package=package)
+
+    async def reload_extension(self, name: str, *, package: Optional[str] = None) -> None:
+        name = self._resolve_name(name, package)
+        self._stash_state(name)
+        try:
+            await super().reload_extension(name)
+        finally:
+            # a failed reload rolls back to the old module, which gets its state back just the same
+            self._restore_state(name)
+
+    def _extension_cogs(self, name: str):
+        return [cog for cog in self.cogs.values() if cog.__module__ == name and hasattr(cog, "load_state")]
+
+    def _stash_state(self, name: str) -> None:
+        for cog in self._extension_cogs(name):
+            self._unloaded_state[cog.qualified_name] = cog.dump_state()
+
+    def _restore_state(self, name: str) -> None:
+        for cog in self._extension_cogs(name):
+            for guild_id, state in self._unloaded_state.pop(cog.qualified_name, {}).items():
+                cog.load_state(guild_id, state)
+
+    async def _checkpoint_mod_command(self, ctx: Context) -> None:
+        # any mod command may change the game, so there is always a checkpoint from just before it to roll back to
+        if ctx.guild and check_is_mod in ctx.command.checks:
+            take_checkpoint(
+                self, ctx.guild.id, ctx.message.content or f"/{ctx.command.qualified_name}", ctx.message.created_at
+            )
+
     async def on_command_error(self, context: Context, exception: errors.CommandError, /) -> None:
-        if isinstance(exception, errors.CommandInvokeError) and isinstance(exception.original, ModBotError):
-            await send_error_and_delete(context.message, exception.original.msg)
+        if isinstance(exception, errors.HybridCommandError):
+            # slash invocations wrap the error raised by the command once more
+            exception = exception.original
+        if isinstance(exception, (errors.CommandInvokeError, CommandInvokeError)) and isinstance(
+            exception.original, ModBotError
+        ):
+            await send_error(context, exception.original.msg)
         elif isinstance(exception, errors.CheckFailure):
-            await send_error_and_delete(context.message, "Only mods can use this command!")
+            await send_error(context, "Only mods can use this command!")
         else:
             raise exception
 
+    async def on_app_command_error(self, interaction: discord.Interaction, error: AppCommandError, /) -> None:
+        # a hybrid command's checks run before its callback on the slash path, so a failed check goes to the tree
+        # instead of on_command_error
+        if isinstance(error, AppCheckFailure):
+            await send_error(await Context.from_interaction(interaction), "Only mods can use this command!")
+        else:
+            await CommandTree.on_error(self.tree, interaction, error)
+
+    async def close(self) -> None:
+        if self.api:
+            await self.api.stop()
+        await self.warm_start.stop()
+        await self.outbound.stop()
+        await self.coordinator.stop()
+        await self.storage.close()
+        await super().close()
 
-with open("config.yaml", "r") as stream:
-    config = yaml.safe_load(stream)
 
+# slash mode needs neither privileged intent: commands arrive as interactions instead of being parsed from
+# message content, and members are fetched one at a time when needed instead of chunked at startup
+slash_only = os.environ.get("COMMAND_MODE", "prefix").lower() == "slash"
 intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
+intents.message_content = not slash_only
+intents.members = not slash_only
+
+shard_plan = ShardPlan.from_env()
+gamestates = defaultdict(lambda: GameState())
+for guild_id, guild_settings in load_guild_settings("config.yaml").items():
+    if shard_plan.owns(guild_id):
+        gamestates[guild_id] = guild_settings.to_gamestate()
 
 bot = ModBot(
-    command_prefix="!",
+    shard_plan=shard_plan,
+    games=gamestates,
+    config_path="config.yaml",
+    command_prefix=commands.when_mentioned if slash_only else "!",
     intents=intents,
+    chunk_guilds_at_startup=not slash_only,
     activity=discord.Game("mafia >:)"),  # Use !help if stuck!"),
 )
-gamestates = defaultdict(lambda: GameState())
-gamestates[config["guild_id"]] = GameState(
-    config=Config(**config["server_config"]),
-    players=([Player.from_dict(p) for p in config.get("players", [])]),
-    rules=Rules(**config.get("rules", {})),
-    roles=[RoleCard.from_dict(rc) for rc in config.get("roles", [])] or None,
-)
-
-
-phase = Phases(bot=bot, games=gamestates)
-player = Players(bot=bot, games=gamestates)
-# roles = Roles(bot=bot, games=gamestates)
-vote = Vote(bot=bot, games=gamestates)
-# actions = Actions(bot=bot, games=gamestates)
-random = Random()
-# help = Help(phase=phase, player=player, roles=roles, vote=vote, actions=actions, random=random)
-
 bot.remove_command("help")
 token = os.environ["TOKEN"]
 bot.run(token)
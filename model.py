@@ -1,9 +1,19 @@
 from __future__ import annotations
-from typing import List, Optional, Dict
+import re
+from typing import List, Optional, Dict, Tuple, Sequence
 
+import attrs
 from attr import define, Factory, frozen
 
-from constants import Alignment, Modifier, SideEffect, WINCON_MAP, Phase
+from constants import (
+    Alignment,
+    Modifier,
+    SideEffect,
+    WINCON_MAP,
+    Phase,
+    ACTION_PRIORITY_MAP,
+    DEFAULT_ACTION_PRIORITY,
+)
 from embeds import Embed
 from exceptions import ModBotError
 
@@ -36,7 +46,7 @@ class Role:
         return f"{self.alignment or ''} {self.role or ''}".strip()
 
 
-@define
+@frozen
 class Action:
     name: str
     desc: str = ""
@@ -45,11 +55,19 @@ class Action:
     targets: int = 1
     self_targetable: bool = False
     side_effect: Optional[List[SideEffect]] = None
+    kind: Optional[str] = None
+    priority: Optional[int] = None
 
     @classmethod
     def from_dict(cls, d: Dict) -> Action:
         return cls(**d)
 
+    @property
+    def resolve_priority(self) -> int:
+        if self.priority is not None:
+            return self.priority
+        return ACTION_PRIORITY_MAP.get(self.kind, DEFAULT_ACTION_PRIORITY)
+
     def can_use_in_phase(self, phase: Phase) -> bool:
         if phase == Phase.DAY:
             return Modifier.PASSIVE not in self.modifiers and (
@@ -67,48 +85,117 @@ class Action:
         return f"**{modifiers}{' ' if modifiers else ''}{self.name}**: {self.desc}"
 
 
-@define
-class RoleCard:
+@frozen
+class RoleTemplate:
     role: Optional[Role] = None
     flips_as: Optional[Role] = None
-    actions: List[Action] = Factory(list)
+    actions: Tuple[Action, ...] = ()
+    shots: Dict[str, int] = Factory(dict)
+    phase_actions: Dict[Phase, Tuple[Action, ...]] = Factory(dict)
+    action_names: Dict[str, Action] = Factory(dict)
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> Optional[RoleTemplate]:
+        if not d:
+            return None
+        return cls.compile(
+            role=Role.from_dict(d.get("role")),
+            flips_as=Role.from_dict(d.get("flips_as")),
+            actions=[Action.from_dict(a) for a in d.get("actions", [])],
+        )
+
+    @classmethod
+    def compile(cls, role: Optional[Role], flips_as: Optional[Role], actions: List[Action]) -> RoleTemplate:
+        return cls(
+            role=role,
+            flips_as=flips_as or role,
+            actions=tuple(actions),
+            shots={action.name: action.shots for action in actions if action.shots is not None},
+            phase_actions={
+                phase: tuple(action for action in actions if action.can_use_in_phase(phase))
+                for phase in (Phase.DAY, Phase.NIGHT)
+            },
+            action_names={action.name.lower(): action for action in actions},
+        )
+
+    def instantiate(self) -> RoleCard:
+        return RoleCard(template=self)
+
+    def get_rolecard(self, fr_name: str = "PLAYER") -> Embed:
+        return format_rolecard(self.role, self.actions, fr_name=fr_name)
+
+
+@define
+class RoleCard:
+    template: RoleTemplate = RoleTemplate()
+    # shared with the template until the first shot is used
+    shots: Dict[str, int] = None
+    _flips_as: Optional[Role] = None
 
     def __attrs_post_init__(self):
-        if self.role and not self.flips_as:
-            self.flips_as = self.role
+        if self.shots is None:
+            self.shots = self.template.shots
 
     @classmethod
     def from_dict(cls, d: Dict) -> Optional[RoleCard]:
-        if not d:
-            return None
-        d["role"] = Role.from_dict(d.get("role"))
-        d["flips_as"] = Role.from_dict(d.get("flips_as"))
-        d["actions"] = [Action.from_dict(a) for a in d.get("actions", [])]
-        return cls(**d)
+        template = RoleTemplate.from_dict(d)
+        return template.instantiate() if template else None
+
+    def to_dict(self) -> Dict:
+        return {
+            "role": attrs.asdict(self.role) if self.role else None,
+            "flips_as": attrs.asdict(self.flips_as) if self.flips_as else None,
+            "actions": [attrs.asdict(action) for action in self.actions],
+        }
+
+    @property
+    def role(self) -> Optional[Role]:
+        return self.template.role
+
+    @property
+    def flips_as(self) -> Optional[Role]:
+        return self._flips_as or self.template.flips_as
+
+    @flips_as.setter
+    def flips_as(self, flips_as: Optional[Role]):
+        self._flips_as = flips_as
+
+    @property
+    def actions(self) -> List[Action]:
+        return [self._with_remaining_shots(a) for a in self.template.actions if self.shots.get(a.name) != 0]
+
+    def _with_remaining_shots(self, action: Action) -> Action:
+        if self.shots.get(action.name, action.shots) == action.shots:
+            return action
+        return attrs.evolve(action, shots=self.shots[action.name])
 
     def get_rolecard(self, fr_name: str = "PLAYER") -> Embed:
-        body = f"Welcome, **{fr_name}**! You are a **{self.role}**.\n\n"
-        if not self.actions:
-            body += "You have no abilities; your only power is your voice and your vote."
-        else:
-            body += f"You have the following abilit{'y' if len(self.actions)==1 else 'ies'} at your disposal:\n"
-            body += "\n".join(f"- {action}" for action in self.actions)
-        body += f"\n\n{WINCON_MAP[self.role.alignment]}"
-        return Embed.RoleCardEmbed(alignment=self.role.alignment, body=body)
+        return format_rolecard(self.role, self.actions, fr_name=fr_name)
 
     def get_action_from_name(self, name: str) -> Optional[Action]:
-        for action in self.actions:
-            if action.name.lower() == name.lower():
-                return action
+        action = self.template.action_names.get(name.lower())
+        if action and self.shots.get(action.name) != 0:
+            return action
+        return None
 
-    def get_available_actions(self, phase: Phase) -> List[Action]:
-        return [a for a in self.actions if a.can_use_in_phase(phase)]
+    def get_available_actions(self, phase: Phase) -> Tuple[Action, ...]:
+        actions = self.template.phase_actions.get(phase, ())
+        if self.shots is self.template.shots:
+            return actions
+        return tuple(action for action in actions if self.shots.get(action.name) != 0)
+
+    def use_shot(self, action: Action) -> None:
+        if action.name not in self.shots:
+            return
+        if self.shots is self.template.shots:
+            self.shots = dict(self.shots)
+        self.shots[action.name] -= 1
 
     def format_available_actions(self, phase: Phase) -> str:
         actions = self.get_available_actions(phase)
         if actions:
             body = "You may use the following actions this phase:\n"
-            body += "\n".join(f"- {a}" for a in actions)
+            body += "\n".join(f"- {self._with_remaining_shots(a)}" for a in actions)
             return body
 
         else:
@@ -124,8 +211,15 @@ class Player:
 
     @classmethod
     def from_dict(cls, d: Dict) -> Player:
-        d["role_card"] = RoleCard.from_dict(d.get("role_card"))
-        return cls(**d)
+        return cls(**(d | {"role_card": RoleCard.from_dict(d.get("role_card"))}))
+
+    def to_dict(self) -> Dict:
+        return {
+            "fr_name": self.fr_name,
+            "discord_id": self.discord_id,
+            "alive": self.alive,
+            "role_card": self.role_card.to_dict() if self.role_card else None,
+        }
 
     def get_embed(self) -> Embed:
         if self.role and self.role.alignment:
@@ -176,6 +270,26 @@ class Player:
         return self.role_card.actions if self.role_card else []
 
 
+@define
+class ActionSubmission:
+    action: Action
+    targets: List[Player]
+
+    @classmethod
+    def from_dict(cls, d: Dict, player: Player, game: GameState) -> Optional[ActionSubmission]:
+        action = player.role_card.get_action_from_name(d["action"]) if player.role_card else None
+        targets = [game.player_from_fr(target) for target in d["targets"]]
+        if not action or None in targets:
+            return None
+        return cls(action=action, targets=targets)
+
+    def to_dict(self) -> Dict:
+        return {"action": self.action.name, "targets": [target.fr_name for target in self.targets]}
+
+    def format_targets(self) -> str:
+        return ", ".join(target.fr_name for target in self.targets)
+
+
 @define
 class Config:
     private_category: int
@@ -193,6 +307,9 @@ class Config:
 class Rules:
     sleep_enabled: bool = True
     open_setup: bool = False
+    announce_hammer: bool = True
+    lock_on_hammer: bool = True
+    advance_on_hammer: bool = False
 
 
 @frozen
@@ -203,6 +320,13 @@ class GamePhase:
     def __str__(self):
         return f"{self.phase} {self.num}"
 
+    @classmethod
+    def from_str(cls, s: str) -> Optional[GamePhase]:
+        match = re.fullmatch(r"(d|day|n|night) ?(\d{1,2})", s.strip().lower())
+        if not match:
+            return None
+        return cls(phase=Phase.DAY if match.group(1).startswith("d") else Phase.NIGHT, num=int(match.group(2)))
+
     def next(self) -> GamePhase:
         if self.phase == Phase.DAY:
             return GamePhase(Phase.NIGHT, self.num)
@@ -215,13 +339,23 @@ class GameState:
     config: Config = Config(private_category=0, vote_channel=0, vc_channel=0)
     phase: GamePhase = GamePhase(phase=Phase.DAY, num=1)
     players: List[Player] = Factory(list)
-    roles: Optional[List[RoleCard]] = None
+    roles: Optional[List[RoleTemplate]] = None
     player_slot_map: Dict[str, Player] = None
     rules: Rules = Rules()
+    roster_version: int = 0
 
     def __attrs_post_init__(self):
         self.player_slot_map = {p.fr_name: p for p in self.players}
 
+    def touch_roster(self) -> None:
+        self.roster_version += 1
+
+    def dump_players(self) -> Tuple[List[Dict], Dict[str, str]]:
+        return (
+            [player.to_dict() for player in self.players],
+            {name: player.fr_name for name, player in self.player_slot_map.items()},
+        )
+
     def player_from_fr(self, fr_name: str, raise_err: bool = False) -> Optional[Player]:
         for player in self.players:
             if player.fr_name.lower() == fr_name.lower():
@@ -237,6 +371,17 @@ class GameState:
         return None
 
 
+def format_rolecard(role: Role, actions: Sequence[Action], fr_name: str = "PLAYER") -> Embed:
+    body = f"Welcome, **{fr_name}**! You are a **{role}**.\n\n"
+    if not actions:
+        body += "You have no abilities; your only power is your voice and your vote."
+    else:
+        body += f"You have the following abilit{'y' if len(actions)==1 else 'ies'} at your disposal:\n"
+        body += "\n".join(f"- {action}" for action in actions)
+    body += f"\n\n{WINCON_MAP[role.alignment]}"
+    return Embed.RoleCardEmbed(alignment=role.alignment, body=body)
+
+
 def field_to_name(field: str) -> str:
     acronyms = ["FR", "ID"]
     split_field = field.split("_")
@@ -0,0 +1,82 @@
+from __future__ import annotations
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Dict, Generic, Iterable, List, Optional, Tuple, TypeVar
+
+from attr import define, Factory
+
+from constants import MAX_NAME_SUGGESTIONS, MAX_SUGGESTION_DISTANCE
+
+T = TypeVar("T")
+
+
+@define
+class NameMatch(Generic[T]):
+    value: Optional[T] = None
+    suggestions: List[T] = Factory(list)
+
+
+@define
+class NameIndex(Generic[T]):
+    version: int
+    exact: Dict[str, T]
+    keys: List[str]
+    trigrams: Dict[str, List[int]]
+
+    @classmethod
+    def build(cls, version: int, items: Iterable[Tuple[str, T]]) -> NameIndex[T]:
+        exact = {name.lower(): value for name, value in items}
+        keys = sorted(exact)
+        trigrams = defaultdict(list)
+        for i, key in enumerate(keys):
+            for trigram in set(_trigrams(key)):
+                trigrams[trigram].append(i)
+        return cls(version=version, exact=exact, keys=keys, trigrams=dict(trigrams))
+
+    def resolve(self, name: str) -> NameMatch[T]:
+        name = name.lower().strip()
+        if not name:
+            return NameMatch()
+        if name in self.exact:
+            return NameMatch(value=self.exact[name])
+
+        prefixed = []
+        for i in range(bisect_left(self.keys, name), len(self.keys)):
+            if not self.keys[i].startswith(name) or len(prefixed) > MAX_NAME_SUGGESTIONS:
+                break
+            prefixed.append(self.keys[i])
+        if len(prefixed) == 1:
+            return NameMatch(value=self.exact[prefixed[0]])
+        if prefixed:
+            return NameMatch(suggestions=[self.exact[key] for key in prefixed[:MAX_NAME_SUGGESTIONS]])
+
+        shared = Counter(i for trigram in set(_trigrams(name)) for i in self.trigrams.get(trigram, ()))
+        max_distance = 1 if len(name) <= 5 else 2
+        scored = []
+        for i, _ in shared.most_common(MAX_NAME_SUGGESTIONS * 4):
+            distance = _bounded_distance(name, self.keys[i], MAX_SUGGESTION_DISTANCE)
+            if distance <= MAX_SUGGESTION_DISTANCE:
+                scored.append((distance, self.keys[i]))
+        scored.sort()
+        if scored and scored[0][0] <= max_distance and (len(scored) == 1 or scored[1][0] > scored[0][0]):
+            return NameMatch(value=self.exact[scored[0][1]])
+        return NameMatch(suggestions=[self.exact[key] for _, key in scored[:MAX_NAME_SUGGESTIONS]])
+
+
+def _trigrams(s: str) -> List[str]:
+    padded = f"  {s} "
+    return [padded[i : i + 3] for i in range(len(padded) - 2)]
+
+
+def _bounded_distance(a: str, b: str, limit: int) -> int:
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
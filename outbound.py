@@ -0,0 +1,265 @@
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import discord
+from attr import define, Factory
+
+from constants import Priority, OUTBOUND_CONCURRENCY, OUTBOUND_ROUTE_BUDGETS, OUTBOUND_MAX_AGE
+
+log = logging.getLogger(__name__)
+
+
+@define
+class RouteBudget:
+    limit: int
+    window: float
+    sent: Deque[float] = Factory(deque)
+
+    def ready_at(self, now: float) -> float:
+        while self.sent and self.sent[0] <= now - self.window:
+            self.sent.popleft()
+        return now if len(self.sent) < self.limit else self.sent[0] + self.window
+
+    def spend(self, now: float) -> None:
+        self.sent.append(now)
+
+
+@define
+class OutboundJob:
+    priority: int
+    seq: int
+    route: str
+    factory: Callable[[], Awaitable[Any]]
+    future: asyncio.Future
+    queued_at: float
+    coalesce_key: Optional[Any] = None
+    kwargs: Dict[str, Any] = Factory(dict)
+
+    def __lt__(self, other: OutboundJob) -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+@define
+class OutboundMetrics:
+    queued: Dict[int, int] = Factory(lambda: defaultdict(int))
+    sent: Dict[int, int] = Factory(lambda: defaultdict(int))
+    failed: Dict[int, int] = Factory(lambda: defaultdict(int))
+    dropped: Dict[int, int] = Factory(lambda: defaultdict(int))
+    coalesced: int = 0
+    total_wait: Dict[int, float] = Factory(lambda: defaultdict(float))
+    max_wait: Dict[int, float] = Factory(lambda: defaultdict(float))
+
+    def record_sent(self, job: OutboundJob, now: float) -> None:
+        wait = now - job.queued_at
+        self.sent[job.priority] += 1
+        self.total_wait[job.priority] += wait
+        self.max_wait[job.priority] = max(self.max_wait[job.priority], wait)
+
+    def summary(self) -> Dict[str, Dict]:
+        return {
+            name: {
+                "queued": self.queued[priority],
+                "sent": self.sent[priority],
+                "failed": self.failed[priority],
+                "dropped": self.dropped[priority],
+                "avg_wait": self.total_wait[priority] / self.sent[priority] if self.sent[priority] else 0.0,
+                "max_wait": self.max_wait[priority],
+            }
+            for name, priority in vars(Priority).items()
+            if not name.startswith("_")
+        } | {"coalesced": self.coalesced}
+
+
+class Outbound:
+    # every message send / edit / reaction / pin / delete goes through here so that, when we are being
+    # rate limited, vote boards and announcements get the budget before acknowledgements and error replies
+    def __init__(self, concurrency: int = OUTBOUND_CONCURRENCY, budgets: Dict[str, Tuple[int, float]] = None):
+        self.budgets = budgets or OUTBOUND_ROUTE_BUDGETS
+        self.metrics = OutboundMetrics()
+        self._queue: List[OutboundJob] = []
+        self._routes: Dict[str, RouteBudget] = {}
+        self._pending: Dict[Any, OutboundJob] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._inflight: set = set()
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if not self._worker:
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+        for job in self._queue:
+            job.future.cancel()
+        self._queue.clear()
+        self._pending.clear()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        log.info("Outbound request metrics: %s", self.metrics.summary())
+
+    def submit(
+        self,
+        route: str,
+        factory: Callable[[], Awaitable[Any]],
+        priority: int = Priority.NORMAL,
+        coalesce_key: Optional[Any] = None,
+        kwargs: Optional[Dict[str, Any]] = None,
+    ) -> asyncio.Future:
+        if coalesce_key is not None and coalesce_key in self._pending:
+            # a newer edit to the same message replaces the queued one; both callers get the same result
+            job = self._pending[coalesce_key]
+            job.factory = factory
+            job.kwargs = kwargs or {}
+            self.metrics.coalesced += 1
+            if priority < job.priority:
+                job.priority = priority
+                heapq.heapify(self._queue)
+            return job.future
+        future = asyncio.get_running_loop().create_future()
+        # fire-and-forget callers never look at the result, so failures are only reported through metrics
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        job = OutboundJob(
+            priority, next(self._seq), route, factory, future, time.monotonic(), coalesce_key, kwargs or {}
+        )
+        heapq.heappush(self._queue, job)
+        if coalesce_key is not None:
+            self._pending[coalesce_key] = job
+        self.metrics.queued[priority] += 1
+        self._wakeup.set()
+        if not self._worker:
+            self.start()
+        return future
+
+    def send(
+        self, channel: discord.abc.Messageable, content: Optional[str] = None, *, priority=Priority.NORMAL, **kwargs
+    ):
+        if getattr(channel, "interaction", None) is not None:
+            # interaction responses have their own rate limit and must arrive within three seconds, so they
+            # never wait behind the queue
+            task = asyncio.ensure_future(channel.send(content, **kwargs))
+            task.add_done_callback(lambda f: f.cancelled() or f.exception())
+            return task
+        channel_id = getattr(getattr(channel, "channel", channel), "id", None)
+        return self.submit(f"send:{channel_id}", lambda: channel.send(content, **kwargs), priority)
+
+    def reply(self, message: discord.Message, content: Optional[str] = None, *, priority=Priority.NORMAL, **kwargs):
+        return self.submit(f"send:{message.channel.id}", lambda: message.reply(content, **kwargs), priority)
+
+    def edit(self, message: discord.Message | discord.PartialMessage, *, priority=Priority.HIGH, **kwargs):
+        key = ("edit", message.id)
+        if key in self._pending:
+            kwargs = self._pending[key].kwargs | kwargs
+        return self.submit(
+            f"edit:{message.channel.id}", lambda: message.edit(**kwargs), priority, coalesce_key=key, kwargs=kwargs
+        )
+
+    def add_reaction(self, message: discord.Message, emoji: str, *, priority=Priority.LOW):
+        return self.submit(f"reaction:{message.channel.id}", lambda: message.add_reaction(emoji), priority)
+
+    def pin(self, message: discord.Message, *, priority=Priority.NORMAL):
+        return self.submit(f"pin:{message.channel.id}", lambda: message.pin(), priority)
+
+    def delete(self, message: discord.Message, *, delay: Optional[float] = None, priority=Priority.LOW):
+        if delay:
+            task = asyncio.create_task(self._delete_later(message, delay, priority))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            return task
+        return self.submit(
+            f"delete:{message.channel.id}", lambda: message.delete(), priority, coalesce_key=("delete", message.id)
+        )
+
+    async def _delete_later(self, message: discord.Message, delay: float, priority: int):
+        await asyncio.sleep(delay)
+        return await self.delete(message, priority=priority)
+
+    def _budget(self, route: str) -> RouteBudget:
+        if route not in self._routes:
+            limit, window = self.budgets.get(route.split(":", 1)[0], (5, 5))
+            self._routes[route] = RouteBudget(limit, window)
+        return self._routes[route]
+
+    def _next_job(self, now: float) -> Tuple[Optional[OutboundJob], Optional[float]]:
+        # the most urgent job whose route still has budget; jobs on exhausted routes stay queued in order
+        skipped, job, wake_at = [], None, None
+        while self._queue:
+            candidate = heapq.heappop(self._queue)
+            max_age = OUTBOUND_MAX_AGE.get(candidate.priority)
+            if max_age is not None and now - candidate.queued_at > max_age:
+                self._forget(candidate)
+                self.metrics.dropped[candidate.priority] += 1
+                candidate.future.cancel()
+                continue
+            ready_at = self._budget(candidate.route).ready_at(now)
+            if ready_at <= now:
+                job = candidate
+                break
+            skipped.append(candidate)
+            wake_at = ready_at if wake_at is None else min(wake_at, ready_at)
+        for candidate in skipped:
+            heapq.heappush(self._queue, candidate)
+        return job, wake_at
+
+    def _forget(self, job: OutboundJob) -> None:
+        if job.coalesce_key is not None and self._pending.get(job.coalesce_key) is job:
+            del self._pending[job.coalesce_key]
+
+    async def _run(self) -> None:
+        while True:
+            await self._slots.acquire()
+            now = time.monotonic()
+            job, wake_at = self._next_job(now)
+            if not job:
+                self._slots.release()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wake_at - now if wake_at else None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._forget(job)
+            self._budget(job.route).spend(now)
+            task = asyncio.create_task(self._execute(job))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _execute(self, job: OutboundJob) -> None:
+        try:
+            if job.future.done():
+                return
+            self.metrics.record_sent(job, time.monotonic())
+            try:
+                result = await job.factory()
+            except Exception as e:
+                self.metrics.failed[job.priority] += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+        finally:
+            self._slots.release()
+
+
+_outbound: Optional[Outbound] = None
+
+
+def get_outbound() -> Outbound:
+    global _outbound
+    if _outbound is None:
+        _outbound = Outbound()
+    return _outbound
+
+
+def set_outbound(outbound: Outbound) -> None:
+    global _outbound
+    _outbound = outbound
@@ -0,0 +1,64 @@
+from __future__ import annotations
+from typing import Dict, Hashable, Tuple
+
+from attr import define
+
+# idle buckets are only cleaned up once there are this many
+PRUNE_AT = 1024
+
+
+@define
+class TokenBucket:
+    capacity: float
+    # tokens added back per second
+    rate: float
+    tokens: float
+    updated: float
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def retry_after(self, now: float) -> float:
+        self.refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    # one bucket per key, i.e. per user or per guild; a bucket that has filled back up is the same as a new one,
+    # so those are dropped now and then instead of being kept for every user ever seen
+    def __init__(self, capacity: int, window: float):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+
+    def bucket(self, key: Hashable, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= PRUNE_AT:
+                self._prune(now)
+            bucket = self._buckets[key] = TokenBucket(self.capacity, self.rate, self.capacity, now)
+        return bucket
+
+    def take(self, key: Hashable, now: float) -> bool:
+        bucket = self.bucket(key, now)
+        if bucket.retry_after(now):
+            return False
+        bucket.tokens -= 1
+        return True
+
+    def _prune(self, now: float) -> None:
+        for key, bucket in list(self._buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self._buckets[key]
+
+
+def take_all(now: float, *limits: Tuple[RateLimiter, Hashable]) -> float:
+    # a token from every bucket or from none of them; returns how long to wait when any of them is empty
+    buckets = [limiter.bucket(key, now) for limiter, key in limits]
+    wait = max(bucket.retry_after(now) for bucket in buckets)
+    if not wait:
+        for bucket in buckets:
+            bucket.tokens -= 1
+    return wait
@@ -0,0 +1,123 @@
+from __future__ import annotations
+from typing import Dict, List, Set, Tuple
+
+from attr import define, Factory
+
+from constants import ActionType
+from model import ActionSubmission, Player
+
+
+@define
+class ResolvedAction:
+    actor: str
+    submission: ActionSubmission
+    targets: List[Player]
+    blocked: bool = False
+    redirected: bool = False
+
+    def __str__(self) -> str:
+        line = f"{self.actor} uses **{self.submission.action.name}**"
+        if self.targets:
+            line += " on " + ", ".join(target.fr_name for target in self.targets)
+        if self.blocked:
+            line += " *(blocked)*"
+        elif self.redirected:
+            line += " *(redirected)*"
+        return line
+
+
+@define
+class ActionResolution:
+    resolved: List[ResolvedAction] = Factory(list)
+    kills: List[Player] = Factory(list)
+
+    def format(self) -> str:
+        body = "\n".join(f"- {action}" for action in self.resolved) or "No actions were submitted!"
+        if self.kills:
+            body += "\n\n**Deaths**: " + ", ".join(player.fr_name for player in self.kills)
+        else:
+            body += "\n\n**Deaths**: No one died!"
+        return body
+
+    def apply(self) -> None:
+        for player in self.kills:
+            player.alive = False
+
+
+def order_submissions(submissions: Dict[str, ActionSubmission]) -> List[Tuple[str, ActionSubmission]]:
+    return sorted(submissions.items(), key=lambda item: (item[1].action.resolve_priority, item[0].lower()))
+
+
+def resolve_actions(submissions: Dict[str, ActionSubmission]) -> ActionResolution:
+    resolution = ActionResolution()
+    blocked: Set[str] = set()
+    redirects: Dict[str, Player] = {}
+    killed: Set[str] = set()
+    for actor, submission in order_submissions(submissions):
+        action = submission.action
+        targets = list(submission.targets)
+        resolved = ResolvedAction(actor=actor, submission=submission, targets=targets)
+        resolution.resolved.append(resolved)
+        if actor in blocked:
+            resolved.blocked = True
+            continue
+        if actor in redirects and targets:
+            targets[0] = redirects[actor]
+            resolved.redirected = True
+        if not targets:
+            continue
+        if action.kind == ActionType.BLOCK:
+            blocked.add(targets[0].fr_name)
+        elif action.kind == ActionType.REDIRECT and len(targets) >= 2:
+            redirects[targets[0].fr_name] = targets[1]
+        elif action.kind == ActionType.KILL:
+            target = targets[0]
+            if target.alive and target.fr_name not in killed:
+                killed.add(target.fr_name)
+                resolution.kills.append(target)
+    return resolution
+
+
+def _check_order() -> None:
+    from model import Action
+
+    def submit(kind: str, *targets: Player) -> ActionSubmission:
+        return ActionSubmission(action=Action(name=kind, kind=kind, targets=len(targets)), targets=list(targets))
+
+    a, b, c, d = (Player(fr_name=name, discord_id=i) for i, name in enumerate("abcd"))
+    # a block lands before the kill it stops, whatever order they were submitted in
+    resolution = resolve_actions({"a": submit(ActionType.KILL, c), "b": submit(ActionType.BLOCK, a)})
+    assert not resolution.kills and resolution.resolved[1].blocked
+    # a redirect moves the kill onto its second target
+    resolution = resolve_actions({"a": submit(ActionType.KILL, c), "b": submit(ActionType.REDIRECT, a, d)})
+    assert resolution.kills == [d] and resolution.resolved[1].redirected
+    # a blocked redirector redirects no one
+    resolution = resolve_actions(
+        {"a": submit(ActionType.KILL, c), "b": submit(ActionType.REDIRECT, a, d), "c": submit(ActionType.BLOCK, b)}
+    )
+    assert resolution.kills == [c]
+    # the dead stay dead only once `apply` is called
+    assert c.alive
+    resolution.apply()
+    assert not c.alive
+
+
+if __name__ == "__main__":
+    import random
+    import timeit
+
+    from model import Action
+
+    _check_order()
+    roster = [Player(fr_name=f"player{i}", discord_id=i) for i in range(100)]
+    kinds = [ActionType.BLOCK, ActionType.REDIRECT, ActionType.KILL, None]
+    subs = {}
+    for p in roster:
+        kind = random.choice(kinds)
+        n_targets = 2 if kind == ActionType.REDIRECT else 1
+        subs[p.fr_name] = ActionSubmission(
+            action=Action(name=str(kind), kind=kind, targets=n_targets), targets=random.sample(roster, n_targets)
+        )
+    runs = 1000
+    total = timeit.timeit(lambda: resolve_actions(subs), number=runs)
+    print(f"resolved {len(subs)} submissions in {total / runs * 1000:.3f}ms on average ({runs} runs)")
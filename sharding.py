@@ -0,0 +1,152 @@
+from __future__ import annotations
+import asyncio
+import logging
+import os
+import socket
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import pytz
+from attr import define, Factory
+from pymongo.errors import DuplicateKeyError
+
+from constants import SHARD_LEASE_TTL
+from exceptions import ShardError
+
+log = logging.getLogger(__name__)
+
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    return (guild_id >> 22) % shard_count
+
+
+def owns_guild(bot, guild_id: int) -> bool:
+    plan = getattr(bot, "shard_plan", None)
+    return plan is None or plan.owns(guild_id)
+
+
+@define
+class ShardPlan:
+    shard_count: Optional[int] = None
+    shard_ids: Optional[List[int]] = None
+    owner: str = Factory(lambda: f"{socket.gethostname()}:{os.getpid()}")
+
+    @classmethod
+    def from_env(cls) -> ShardPlan:
+        shard_count = os.environ.get("SHARD_COUNT")
+        shard_ids = os.environ.get("SHARD_IDS")
+        return cls(
+            shard_count=int(shard_count) if shard_count else None,
+            shard_ids=[int(i) for i in shard_ids.split(",")] if shard_ids else None,
+        )
+
+    @property
+    def partitioned(self) -> bool:
+        return bool(self.shard_count and self.shard_ids)
+
+    @property
+    def name(self) -> str:
+        return "-".join(str(i) for i in self.shard_ids) if self.partitioned else "all"
+
+    def owns(self, guild_id: int) -> bool:
+        if not self.partitioned:
+            return True
+        return shard_for_guild(guild_id, self.shard_count) in self.shard_ids
+
+
+class ShardLeases(ABC):
+    @abstractmethod
+    async def claim(self, shard_id: int, owner: str, ttl: int) -> bool: ...
+
+    @abstractmethod
+    async def release(self, shard_id: int, owner: str) -> None: ...
+
+
+class MongoShardLeases(ShardLeases):
+    def __init__(self, db):
+        self.collection = db["shard_leases"]
+
+    async def claim(self, shard_id: int, owner: str, ttl: int) -> bool:
+        now = datetime.now(tz=pytz.utc)
+        try:
+            await self.collection.find_one_and_update(
+                {"_id": shard_id, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # someone else holds an unexpired lease, so the upsert tried to create a second document
+            return False
+        return True
+
+    async def release(self, shard_id: int, owner: str) -> None:
+        await self.collection.delete_one({"_id": shard_id, "owner": owner})
+
+
+class LocalShardLeases(ShardLeases):
+    def __init__(self):
+        self.leases: Dict[int, Tuple[str, datetime]] = {}
+
+    async def claim(self, shard_id: int, owner: str, ttl: int) -> bool:
+        now = datetime.now(tz=pytz.utc)
+        holder = self.leases.get(shard_id)
+        if holder and holder[0] != owner and holder[1] > now:
+            return False
+        self.leases[shard_id] = (owner, now + timedelta(seconds=ttl))
+        return True
+
+    async def release(self, shard_id: int, owner: str) -> None:
+        if self.leases.get(shard_id, (None,))[0] == owner:
+            del self.leases[shard_id]
+
+
+class ShardCoordinator:
+    def __init__(
+        self,
+        plan: ShardPlan,
+        leases: ShardLeases,
+        on_lost: Callable[[], Awaitable],
+        ttl: int = SHARD_LEASE_TTL,
+    ):
+        self.plan = plan
+        self.leases = leases
+        # called once a lease has gone to another process, which is now serving those guilds too
+        self.on_lost = on_lost
+        self.ttl = ttl
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._step_down: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if not self.plan.partitioned:
+            return
+        for shard_id in self.plan.shard_ids:
+            if not await self.leases.claim(shard_id, self.plan.owner, self.ttl):
+                raise ShardError(f"Shard {shard_id} is already owned by another process!")
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self) -> None:
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self.plan.partitioned:
+            for shard_id in self.plan.shard_ids:
+                await self.leases.release(shard_id, self.plan.owner)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            for shard_id in self.plan.shard_ids:
+                try:
+                    claimed = await self.leases.claim(shard_id, self.plan.owner, self.ttl)
+                except Exception:
+                    # i.e. the database is unreachable for a moment; the lease holds until it expires, and if someone
+                    # else takes it over in the meantime the next claim fails
+                    log.exception("Could not renew the lease for shard %s", shard_id)
+                    continue
+                if not claimed:
+                    log.error("Lost the lease for shard %s to another process, stepping down!", shard_id)
+                    # stepping down stops this task, so it runs as a task of its own
+                    self._heartbeat_task = None
+                    self._step_down = asyncio.create_task(self.on_lost())
+                    return
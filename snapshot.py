@@ -0,0 +1,123 @@
+from __future__ import annotations
+import asyncio
+import gzip
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, Optional
+
+import pytz
+from discord.ext import commands
+
+from constants import SNAPSHOT_VERSION, SNAPSHOT_INTERVAL
+from storage import Storage
+
+log = logging.getLogger(__name__)
+
+
+class WarmStart:
+    def __init__(self, bot: commands.Bot, storage: Storage, path: str, epoch_key: str = "snapshot_epoch"):
+        self.bot = bot
+        self.storage = storage
+        self.path = path
+        self.epoch_key = epoch_key
+        self.restored = False
+        self._dirty = False
+        self._epoch_lock = asyncio.Lock()
+        self._invalidation: Optional[asyncio.Future] = None
+        self._periodic_task: Optional[asyncio.Task] = None
+
+    async def restore(self) -> bool:
+        snapshot = await asyncio.to_thread(self._read)
+        epoch = await self.storage.get_meta(self.epoch_key)
+        if not snapshot or snapshot.get("version") != SNAPSHOT_VERSION or not epoch or epoch != snapshot["epoch"]:
+            if snapshot:
+                log.warning("Warm-start snapshot is out of date; hydrating from the database instead.")
+            await self.mark_dirty()
+            return False
+        for name, cog in self.bot.cogs.items():
+            if hasattr(cog, "load_state") and name in snapshot["cogs"]:
+                for guild_id, state in snapshot["cogs"][name].items():
+                    cog.load_state(int(guild_id), state)
+        self.restored = True
+        log.info("Warm-started from snapshot taken at %s.", snapshot["created_at"])
+        return True
+
+    def start(self) -> None:
+        self._periodic_task = asyncio.create_task(self._periodic_save())
+
+    async def stop(self) -> None:
+        if self._periodic_task:
+            self._periodic_task.cancel()
+            self._periodic_task = None
+        await self.save()
+
+    async def mark_dirty(self) -> None:
+        # the first write after a snapshot invalidates it in the database *before* the write goes out,
+        # so a crash can never leave a snapshot that looks current but is missing data
+        if not self._dirty:
+            self._dirty = True
+            self._invalidation = asyncio.ensure_future(self._invalidate())
+        if self._invalidation:
+            await asyncio.shield(self._invalidation)
+
+    async def _invalidate(self) -> None:
+        async with self._epoch_lock:
+            await self.storage.set_meta(self.epoch_key, None)
+
+    async def save(self) -> None:
+        if not self._dirty:
+            return
+        self._dirty = False
+        epoch = uuid.uuid4().hex
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "epoch": epoch,
+            "created_at": datetime.now(tz=pytz.utc).isoformat(),
+            "cogs": {
+                name: {str(guild_id): state for guild_id, state in cog.dump_state().items()}
+                for name, cog in self.bot.cogs.items()
+                if hasattr(cog, "dump_state")
+            },
+        }
+        await asyncio.to_thread(self._write, snapshot)
+        async with self._epoch_lock:
+            if self._dirty:
+                # state changed while the file was being written; the next save will catch it
+                return
+            await self.storage.set_meta(self.epoch_key, epoch)
+
+    async def _periodic_save(self) -> None:
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            try:
+                await self.save()
+            except Exception:
+                self._dirty = True
+                log.exception("Failed to write warm-start snapshot")
+
+    def _read(self) -> Optional[Dict]:
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, snapshot: Dict) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+
+def warm_started(bot) -> bool:
+    warm_start = getattr(bot, "warm_start", None)
+    return bool(warm_start and warm_start.restored)
+
+
+async def mark_dirty(bot) -> None:
+    warm_start = getattr(bot, "warm_start", None)
+    if warm_start:
+        await warm_start.mark_dirty()
@@ -0,0 +1,28 @@
+import os
+from typing import Optional
+
+from storage.base import Storage
+from storage.memory import MemoryStorage
+from storage.sqlite import SQLiteStorage
+
+_storage: Optional[Storage] = None
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        backend = os.environ.get("STORAGE_BACKEND", "mongo").lower()
+        if backend == "sqlite":
+            _storage = SQLiteStorage(os.environ.get("SQLITE_PATH", "modbot.db"))
+        elif backend == "memory":
+            _storage = MemoryStorage()
+        else:
+            # imported lazily so that sqlite deployments need neither motor nor DB_PASSWORD
+            from db_client import get_db
+            from storage.mongo import MongoStorage
+
+            _storage = MongoStorage(get_db())
+    return _storage
+
+
+__all__ = ["Storage", "MemoryStorage", "SQLiteStorage", "get_storage"]
@@ -0,0 +1,105 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import attrs
+
+from sharding import ShardLeases
+from transition import PhaseTransition
+
+
+class Storage(ABC):
+    # commit_transition and close have working defaults; everything else is up to each backend
+    @abstractmethod
+    async def load_phases(self) -> Dict[int, Dict]: ...
+
+    @abstractmethod
+    async def save_phase(self, guild_id: int, phase: Dict) -> None: ...
+
+    @abstractmethod
+    async def load_deadlines(self) -> Dict[int, datetime]: ...
+
+    @abstractmethod
+    async def save_deadline(self, guild_id: int, deadline: Optional[datetime]) -> None: ...
+
+    @abstractmethod
+    async def load_players(self) -> Dict[int, List[Dict]]: ...
+
+    @abstractmethod
+    async def load_player_slots(self) -> Dict[int, Dict[str, str]]: ...
+
+    @abstractmethod
+    async def save_players(self, guild_id: int, players: List[Dict], player_slots: Dict[str, str]) -> None: ...
+
+    @abstractmethod
+    async def load_votes(self) -> Dict[int, Dict[str, List[str]]]: ...
+
+    @abstractmethod
+    async def save_votes(self, guild_id: int, votes: Dict[str, List[str]]) -> None: ...
+
+    # history entries are {"time_utc": naive UTC datetime, "votes": {...}, "phase": {...}}
+    @abstractmethod
+    async def load_all_history(self) -> Dict[int, List[Dict]]: ...
+
+    @abstractmethod
+    async def load_history(self, guild_id: int) -> List[Dict]: ...
+
+    @abstractmethod
+    async def append_history(self, guild_id: int, entry: Dict) -> None: ...
+
+    @abstractmethod
+    async def replace_history(self, guild_id: int, entries: List[Dict]) -> None: ...
+
+    # closed phases are moved out of the history into one compressed archive each;
+    # index entries are {"phase": {...}, "start": naive UTC datetime, "end": naive UTC datetime}, oldest first
+    @abstractmethod
+    async def archive_phase(self, guild_id: int, phase: Dict) -> None: ...
+
+    @abstractmethod
+    async def load_archive_index(self, guild_id: int) -> List[Dict]: ...
+
+    @abstractmethod
+    async def load_archive(self, guild_id: int, phase: Dict) -> List[Dict]: ...
+
+    # each value is {"submissions": {fr_name: submission}, "post": [channel_id, msg_id] or missing}
+    @abstractmethod
+    async def load_action_submissions(self) -> Dict[int, Dict]: ...
+
+    @abstractmethod
+    async def save_action_submission(self, guild_id: int, fr_name: str, submission: Dict) -> None: ...
+
+    @abstractmethod
+    async def save_action_post(self, guild_id: int, channel_id: int, msg_id: int) -> None: ...
+
+    @abstractmethod
+    async def clear_action_submissions(self, guild_id: int) -> None: ...
+
+    async def commit_transition(self, transition: PhaseTransition) -> None:
+        # backends that can write atomically override this; the fallback is just the individual writes in order
+        guild_id = transition.guild_id
+        await self.save_phase(guild_id, attrs.asdict(transition.new_phase))
+        await self.save_deadline(guild_id, None)
+        if transition.votes is not None:
+            await self.save_votes(guild_id, transition.votes)
+        if transition.history_entry is not None:
+            await self.append_history(guild_id, transition.history_entry)
+        if transition.archive_phase is not None:
+            await self.archive_phase(guild_id, transition.archive_phase)
+        if transition.players is not None:
+            await self.save_players(guild_id, *transition.players)
+        if transition.clear_actions:
+            await self.clear_action_submissions(guild_id)
+        for fr_name, submission in (transition.action_submissions or {}).items():
+            await self.save_action_submission(guild_id, fr_name, submission)
+
+    @abstractmethod
+    async def get_meta(self, key: str) -> Optional[Any]: ...
+
+    @abstractmethod
+    async def set_meta(self, key: str, value: Any) -> None: ...
+
+    @abstractmethod
+    def shard_leases(self) -> ShardLeases: ...
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,124 @@
+from copy import deepcopy
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytz
+
+from history import compress_history, decompress_history, merge_history
+from sharding import LocalShardLeases, ShardLeases
+from storage.base import Storage
+
+
+class MemoryStorage(Storage):
+    # everything is copied on the way in and out, so callers see the same isolation a real database gives them
+    def __init__(self):
+        self.phases: Dict[int, Dict] = {}
+        self.deadlines: Dict[int, datetime] = {}
+        self.players: Dict[int, List[Dict]] = {}
+        self.player_slots: Dict[int, Dict[str, str]] = {}
+        self.votes: Dict[int, Dict[str, List[str]]] = {}
+        self.history: Dict[int, List[Dict]] = {}
+        self.archives: Dict[Tuple[int, str, int], Dict] = {}
+        self.action_submissions: Dict[int, Dict] = {}
+        self.meta: Dict[str, Any] = {}
+        self._leases = LocalShardLeases()
+
+    async def load_phases(self) -> Dict[int, Dict]:
+        return deepcopy(self.phases)
+
+    async def save_phase(self, guild_id: int, phase: Dict) -> None:
+        self.phases[guild_id] = deepcopy(phase)
+
+    async def load_deadlines(self) -> Dict[int, datetime]:
+        return dict(self.deadlines)
+
+    async def save_deadline(self, guild_id: int, deadline: Optional[datetime]) -> None:
+        if deadline:
+            self.deadlines[guild_id] = deadline
+        else:
+            self.deadlines.pop(guild_id, None)
+
+    async def load_players(self) -> Dict[int, List[Dict]]:
+        return deepcopy(self.players)
+
+    async def load_player_slots(self) -> Dict[int, Dict[str, str]]:
+        return deepcopy(self.player_slots)
+
+    async def save_players(self, guild_id: int, players: List[Dict], player_slots: Dict[str, str]) -> None:
+        self.players[guild_id] = deepcopy(players)
+        self.player_slots[guild_id] = dict(player_slots)
+
+    async def load_votes(self) -> Dict[int, Dict[str, List[str]]]:
+        return deepcopy(self.votes)
+
+    async def save_votes(self, guild_id: int, votes: Dict[str, List[str]]) -> None:
+        self.votes[guild_id] = deepcopy(dict(votes))
+
+    @staticmethod
+    def _history_entry(entry: Dict) -> Dict:
+        entry = deepcopy(entry)
+        if entry["time_utc"].tzinfo is not None:
+            entry["time_utc"] = entry["time_utc"].astimezone(pytz.utc).replace(tzinfo=None)
+        return entry
+
+    async def load_all_history(self) -> Dict[int, List[Dict]]:
+        return deepcopy(self.history)
+
+    async def load_history(self, guild_id: int) -> List[Dict]:
+        return deepcopy(self.history.get(guild_id, []))
+
+    async def append_history(self, guild_id: int, entry: Dict) -> None:
+        self.history.setdefault(guild_id, []).append(self._history_entry(entry))
+
+    async def replace_history(self, guild_id: int, entries: List[Dict]) -> None:
+        self.history[guild_id] = [self._history_entry(entry) for entry in entries]
+
+    async def archive_phase(self, guild_id: int, phase: Dict) -> None:
+        key = (guild_id, phase["phase"], phase["num"])
+        history = self.history.get(guild_id, [])
+        entries = [entry for entry in history if entry["phase"] == phase]
+        if not entries:
+            return
+        archived = self.archives.get(key)
+        entries = merge_history(archived and archived["data"], entries)
+        self.archives[key] = {
+            "phase": dict(phase),
+            "start": entries[0]["time_utc"],
+            "end": entries[-1]["time_utc"],
+            "data": compress_history(entries),
+        }
+        self.history[guild_id] = [entry for entry in history if entry["phase"] != phase]
+
+    async def load_archive_index(self, guild_id: int) -> List[Dict]:
+        index = [
+            {k: deepcopy(v) for k, v in archive.items() if k != "data"}
+            for (archive_guild_id, _, _), archive in self.archives.items()
+            if archive_guild_id == guild_id
+        ]
+        return sorted(index, key=lambda archive: archive["start"])
+
+    async def load_archive(self, guild_id: int, phase: Dict) -> List[Dict]:
+        archive = self.archives.get((guild_id, phase["phase"], phase["num"]))
+        return decompress_history(archive["data"]) if archive else []
+
+    async def load_action_submissions(self) -> Dict[int, Dict]:
+        return deepcopy(self.action_submissions)
+
+    async def save_action_submission(self, guild_id: int, fr_name: str, submission: Dict) -> None:
+        doc = self.action_submissions.setdefault(guild_id, {"submissions": {}})
+        doc["submissions"][fr_name] = deepcopy(submission)
+
+    async def save_action_post(self, guild_id: int, channel_id: int, msg_id: int) -> None:
+        self.action_submissions.setdefault(guild_id, {"submissions": {}})["post"] = [channel_id, msg_id]
+
+    async def clear_action_submissions(self, guild_id: int) -> None:
+        self.action_submissions.pop(guild_id, None)
+
+    async def get_meta(self, key: str) -> Optional[Any]:
+        return deepcopy(self.meta.get(key))
+
+    async def set_meta(self, key: str, value: Any) -> None:
+        self.meta[key] = deepcopy(value)
+
+    def shard_leases(self) -> ShardLeases:
+        return self._leases
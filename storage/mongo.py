@@ -0,0 +1,195 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import attrs
+import motor.motor_asyncio as motor
+import pytz
+
+from history import compress_history, decompress_history, merge_history
+from sharding import MongoShardLeases, ShardLeases
+from storage.base import Storage
+from transition import PhaseTransition
+
+
+class MongoStorage(Storage):
+    def __init__(self, db: motor.AsyncIOMotorDatabase):
+        self.db = db
+
+    async def _find_all(self, collection: str) -> Dict[int, Dict]:
+        return {doc.pop("_id"): doc async for doc in self.db[collection].find()}
+
+    async def load_phases(self) -> Dict[int, Dict]:
+        return await self._find_all("phases")
+
+    async def save_phase(self, guild_id: int, phase: Dict) -> None:
+        await self.db["phases"].find_one_and_replace(
+            filter={"_id": guild_id}, replacement=phase | {"_id": guild_id}, upsert=True
+        )
+
+    async def load_deadlines(self) -> Dict[int, datetime]:
+        return {
+            guild_id: pytz.utc.localize(doc["deadline"])
+            for guild_id, doc in (await self._find_all("deadlines")).items()
+        }
+
+    async def save_deadline(self, guild_id: int, deadline: Optional[datetime]) -> None:
+        if deadline:
+            await self.db["deadlines"].update_one({"_id": guild_id}, {"$set": {"deadline": deadline}}, upsert=True)
+        else:
+            await self.db["deadlines"].delete_one({"_id": guild_id})
+
+    async def load_players(self) -> Dict[int, List[Dict]]:
+        return {guild_id: doc["players"] for guild_id, doc in (await self._find_all("players")).items()}
+
+    async def load_player_slots(self) -> Dict[int, Dict[str, str]]:
+        return {
+            guild_id: {name: player["fr_name"] for name, player in doc.items()}
+            for guild_id, doc in (await self._find_all("player_slots")).items()
+        }
+
+    async def save_players(self, guild_id: int, players: List[Dict], player_slots: Dict[str, str]) -> None:
+        await self.db["players"].find_one_and_replace(
+            filter={"_id": guild_id}, replacement={"players": players, "_id": guild_id}, upsert=True
+        )
+        await self.db["player_slots"].find_one_and_replace(
+            filter={"_id": guild_id}, replacement=self._player_slots_doc(guild_id, players, player_slots), upsert=True
+        )
+
+    @staticmethod
+    def _player_slots_doc(guild_id: int, players: List[Dict], player_slots: Dict[str, str]) -> Dict:
+        # slots keep their historical shape of a full player document per slot
+        players_by_name = {player["fr_name"]: player for player in players}
+        return {name: players_by_name.get(fr_name, {"fr_name": fr_name}) for name, fr_name in player_slots.items()} | {
+            "_id": guild_id
+        }
+
+    async def load_votes(self) -> Dict[int, Dict[str, List[str]]]:
+        return await self._find_all("votes")
+
+    async def save_votes(self, guild_id: int, votes: Dict[str, List[str]]) -> None:
+        await self.db["votes"].find_one_and_replace({"_id": guild_id}, dict(votes) | {"_id": guild_id}, upsert=True)
+
+    async def load_all_history(self) -> Dict[int, List[Dict]]:
+        return {guild_id: doc["history"] for guild_id, doc in (await self._find_all("vote_history")).items()}
+
+    async def load_history(self, guild_id: int) -> List[Dict]:
+        doc = await self.db["vote_history"].find_one({"_id": guild_id})
+        return doc["history"] if doc else []
+
+    async def append_history(self, guild_id: int, entry: Dict) -> None:
+        await self.db["vote_history"].update_one({"_id": guild_id}, {"$push": {"history": entry}}, upsert=True)
+
+    async def replace_history(self, guild_id: int, entries: List[Dict]) -> None:
+        await self.db["vote_history"].find_one_and_replace(
+            {"_id": guild_id}, {"_id": guild_id, "history": entries}, upsert=True
+        )
+
+    async def archive_phase(self, guild_id: int, phase: Dict) -> None:
+        async with await self.db.client.start_session() as session:
+            async with session.start_transaction():
+                await self._archive_phase(guild_id, phase, session)
+
+    async def _archive_phase(self, guild_id: int, phase: Dict, session: motor.AsyncIOMotorClientSession) -> None:
+        doc = await self.db["vote_history"].find_one({"_id": guild_id}, session=session)
+        entries = [entry for entry in (doc["history"] if doc else []) if entry["phase"] == phase]
+        if not entries:
+            return
+        key = {"guild_id": guild_id, "phase": phase["phase"], "num": phase["num"]}
+        archived = await self.db["vote_history_archive"].find_one(key, session=session)
+        entries = merge_history(archived and archived["data"], entries)
+        await self.db["vote_history_archive"].replace_one(
+            key,
+            key | {"start": entries[0]["time_utc"], "end": entries[-1]["time_utc"], "data": compress_history(entries)},
+            upsert=True,
+            session=session,
+        )
+        await self.db["vote_history"].update_one(
+            {"_id": guild_id},
+            {"$pull": {"history": {"phase.phase": phase["phase"], "phase.num": phase["num"]}}},
+            session=session,
+        )
+
+    async def load_archive_index(self, guild_id: int) -> List[Dict]:
+        cursor = self.db["vote_history_archive"].find({"guild_id": guild_id}, projection={"data": False}).sort("start")
+        return [
+            {"phase": {"phase": doc["phase"], "num": doc["num"]}, "start": doc["start"], "end": doc["end"]}
+            async for doc in cursor
+        ]
+
+    async def load_archive(self, guild_id: int, phase: Dict) -> List[Dict]:
+        doc = await self.db["vote_history_archive"].find_one(
+            {"guild_id": guild_id, "phase": phase["phase"], "num": phase["num"]}
+        )
+        return decompress_history(doc["data"]) if doc else []
+
+    async def load_action_submissions(self) -> Dict[int, Dict]:
+        return await self._find_all("action_submissions")
+
+    async def save_action_submission(self, guild_id: int, fr_name: str, submission: Dict) -> None:
+        await self.db["action_submissions"].update_one(
+            {"_id": guild_id}, {"$set": {f"submissions.{fr_name}": submission}}, upsert=True
+        )
+
+    async def save_action_post(self, guild_id: int, channel_id: int, msg_id: int) -> None:
+        await self.db["action_submissions"].update_one(
+            {"_id": guild_id}, {"$set": {"post": [channel_id, msg_id]}}, upsert=True
+        )
+
+    async def clear_action_submissions(self, guild_id: int) -> None:
+        await self.db["action_submissions"].delete_one({"_id": guild_id})
+
+    async def commit_transition(self, transition: PhaseTransition) -> None:
+        # multi-document transactions need a replica set, which every hosted deployment runs as
+        guild_id = transition.guild_id
+        async with await self.db.client.start_session() as session:
+            async with session.start_transaction():
+                await self.db["phases"].replace_one(
+                    {"_id": guild_id},
+                    attrs.asdict(transition.new_phase) | {"_id": guild_id},
+                    upsert=True,
+                    session=session,
+                )
+                await self.db["deadlines"].delete_one({"_id": guild_id}, session=session)
+                if transition.votes is not None:
+                    await self.db["votes"].replace_one(
+                        {"_id": guild_id}, dict(transition.votes) | {"_id": guild_id}, upsert=True, session=session
+                    )
+                if transition.history_entry is not None:
+                    await self.db["vote_history"].update_one(
+                        {"_id": guild_id},
+                        {"$push": {"history": transition.history_entry}},
+                        upsert=True,
+                        session=session,
+                    )
+                if transition.archive_phase is not None:
+                    await self._archive_phase(guild_id, transition.archive_phase, session)
+                if transition.players is not None:
+                    players, player_slots = transition.players
+                    await self.db["players"].replace_one(
+                        {"_id": guild_id}, {"players": players, "_id": guild_id}, upsert=True, session=session
+                    )
+                    await self.db["player_slots"].replace_one(
+                        {"_id": guild_id},
+                        self._player_slots_doc(guild_id, players, player_slots),
+                        upsert=True,
+                        session=session,
+                    )
+                if transition.clear_actions:
+                    await self.db["action_submissions"].delete_one({"_id": guild_id}, session=session)
+                if transition.action_submissions:
+                    await self.db["action_submissions"].update_one(
+                        {"_id": guild_id},
+                        {"$set": {"submissions": transition.action_submissions}},
+                        upsert=True,
+                        session=session,
+                    )
+
+    async def get_meta(self, key: str) -> Optional[Any]:
+        doc = await self.db["meta"].find_one({"_id": key})
+        return doc["value"] if doc else None
+
+    async def set_meta(self, key: str, value: Any) -> None:
+        await self.db["meta"].update_one({"_id": key}, {"$set": {"value": value}}, upsert=True)
+
+    def shard_leases(self) -> ShardLeases:
+        return MongoShardLeases(self.db)
@@ -0,0 +1,451 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+import pytz
+
+from history import compress_history, decompress_history, merge_history
+from sharding import ShardLeases
+from storage.base import Storage
+from transition import PhaseTransition
+
+T = TypeVar("T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS phases (
+    guild_id INTEGER PRIMARY KEY,
+    phase TEXT NOT NULL,
+    num INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deadlines (
+    guild_id INTEGER PRIMARY KEY,
+    deadline REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS players (
+    guild_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    fr_name TEXT NOT NULL,
+    discord_id INTEGER NOT NULL,
+    alive INTEGER NOT NULL,
+    role_card TEXT,
+    PRIMARY KEY (guild_id, position)
+);
+CREATE TABLE IF NOT EXISTS player_slots (
+    guild_id INTEGER NOT NULL,
+    slot TEXT NOT NULL,
+    fr_name TEXT NOT NULL,
+    PRIMARY KEY (guild_id, slot)
+);
+CREATE TABLE IF NOT EXISTS votes (
+    guild_id INTEGER NOT NULL,
+    voter TEXT NOT NULL,
+    target TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, voter)
+);
+CREATE TABLE IF NOT EXISTS vote_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    time_utc REAL NOT NULL,
+    phase TEXT NOT NULL,
+    num INTEGER NOT NULL,
+    votes TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS vote_history_guild_time ON vote_history (guild_id, time_utc);
+CREATE TABLE IF NOT EXISTS history_archive (
+    guild_id INTEGER NOT NULL,
+    phase TEXT NOT NULL,
+    num INTEGER NOT NULL,
+    start_utc REAL NOT NULL,
+    end_utc REAL NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (guild_id, phase, num)
+);
+CREATE TABLE IF NOT EXISTS action_submissions (
+    guild_id INTEGER NOT NULL,
+    fr_name TEXT NOT NULL,
+    submission TEXT NOT NULL,
+    PRIMARY KEY (guild_id, fr_name)
+);
+CREATE TABLE IF NOT EXISTS action_posts (
+    guild_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    msg_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS shard_leases (
+    shard_id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def _to_timestamp(time_utc: datetime) -> float:
+    if time_utc.tzinfo is None:
+        time_utc = pytz.utc.localize(time_utc)
+    return time_utc.timestamp()
+
+
+def _history_entry(row: sqlite3.Row) -> Dict:
+    return {
+        # naive UTC, the same shape Mongo hands back
+        "time_utc": datetime.fromtimestamp(row["time_utc"], tz=pytz.utc).replace(tzinfo=None),
+        "votes": json.loads(row["votes"]),
+        "phase": {"phase": row["phase"], "num": row["num"]},
+    }
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path: str = "modbot.db"):
+        self.path = path
+        # a single thread owns the connection, so every statement runs off the event loop and in order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, lambda: fn(self._connect()))
+
+    async def _transaction(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        def run(conn: sqlite3.Connection) -> T:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+        return await self._run(run)
+
+    async def load_phases(self) -> Dict[int, Dict]:
+        rows = await self._run(lambda conn: conn.execute("SELECT * FROM phases").fetchall())
+        return {row["guild_id"]: {"phase": row["phase"], "num": row["num"]} for row in rows}
+
+    async def save_phase(self, guild_id: int, phase: Dict) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                "INSERT OR REPLACE INTO phases (guild_id, phase, num) VALUES (?, ?, ?)",
+                (guild_id, phase["phase"], phase["num"]),
+            )
+        )
+
+    async def load_deadlines(self) -> Dict[int, datetime]:
+        rows = await self._run(lambda conn: conn.execute("SELECT * FROM deadlines").fetchall())
+        return {row["guild_id"]: datetime.fromtimestamp(row["deadline"], tz=pytz.utc) for row in rows}
+
+    async def save_deadline(self, guild_id: int, deadline: Optional[datetime]) -> None:
+        if deadline:
+            await self._run(
+                lambda conn: conn.execute(
+                    "INSERT OR REPLACE INTO deadlines (guild_id, deadline) VALUES (?, ?)",
+                    (guild_id, _to_timestamp(deadline)),
+                )
+            )
+        else:
+            await self._run(lambda conn: conn.execute("DELETE FROM deadlines WHERE guild_id = ?", (guild_id,)))
+
+    async def load_players(self) -> Dict[int, List[Dict]]:
+        rows = await self._run(
+            lambda conn: conn.execute("SELECT * FROM players ORDER BY guild_id, position").fetchall()
+        )
+        players = {}
+        for row in rows:
+            players.setdefault(row["guild_id"], []).append(
+                {
+                    "fr_name": row["fr_name"],
+                    "discord_id": row["discord_id"],
+                    "alive": bool(row["alive"]),
+                    "role_card": json.loads(row["role_card"]) if row["role_card"] else None,
+                }
+            )
+        return players
+
+    async def load_player_slots(self) -> Dict[int, Dict[str, str]]:
+        rows = await self._run(lambda conn: conn.execute("SELECT * FROM player_slots").fetchall())
+        slots = {}
+        for row in rows:
+            slots.setdefault(row["guild_id"], {})[row["slot"]] = row["fr_name"]
+        return slots
+
+    async def save_players(self, guild_id: int, players: List[Dict], player_slots: Dict[str, str]) -> None:
+        await self._transaction(lambda conn: self._write_players(conn, guild_id, players, player_slots))
+
+    @staticmethod
+    def _write_players(conn: sqlite3.Connection, guild_id: int, players: List[Dict], player_slots: Dict[str, str]):
+        conn.execute("DELETE FROM players WHERE guild_id = ?", (guild_id,))
+        conn.executemany(
+            "INSERT INTO players (guild_id, position, fr_name, discord_id, alive, role_card) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    guild_id,
+                    i,
+                    p["fr_name"],
+                    p["discord_id"],
+                    int(p["alive"]),
+                    json.dumps(p["role_card"]) if p.get("role_card") else None,
+                )
+                for i, p in enumerate(players)
+            ],
+        )
+        conn.execute("DELETE FROM player_slots WHERE guild_id = ?", (guild_id,))
+        conn.executemany(
+            "INSERT INTO player_slots (guild_id, slot, fr_name) VALUES (?, ?, ?)",
+            [(guild_id, slot, fr_name) for slot, fr_name in player_slots.items()],
+        )
+
+    async def load_votes(self) -> Dict[int, Dict[str, List[str]]]:
+        rows = await self._run(lambda conn: conn.execute("SELECT * FROM votes ORDER BY guild_id, position").fetchall())
+        votes = {}
+        for row in rows:
+            votes.setdefault(row["guild_id"], {}).setdefault(row["target"], []).append(row["voter"])
+        return votes
+
+    async def save_votes(self, guild_id: int, votes: Dict[str, List[str]]) -> None:
+        await self._transaction(lambda conn: self._write_votes(conn, guild_id, votes))
+
+    @staticmethod
+    def _write_votes(conn: sqlite3.Connection, guild_id: int, votes: Dict[str, List[str]]):
+        rows = [
+            (guild_id, voter, target, i)
+            for i, (target, voter) in enumerate((target, voter) for target, voters in votes.items() for voter in voters)
+        ]
+        conn.execute("DELETE FROM votes WHERE guild_id = ?", (guild_id,))
+        conn.executemany("INSERT INTO votes (guild_id, voter, target, position) VALUES (?, ?, ?, ?)", rows)
+
+    async def load_all_history(self) -> Dict[int, List[Dict]]:
+        rows = await self._run(lambda conn: conn.execute("SELECT * FROM vote_history ORDER BY id").fetchall())
+        history = {}
+        for row in rows:
+            history.setdefault(row["guild_id"], []).append(_history_entry(row))
+        return history
+
+    async def load_history(self, guild_id: int) -> List[Dict]:
+        rows = await self._run(
+            lambda conn: conn.execute(
+                "SELECT * FROM vote_history WHERE guild_id = ? ORDER BY id", (guild_id,)
+            ).fetchall()
+        )
+        return [_history_entry(row) for row in rows]
+
+    @staticmethod
+    def _history_row(guild_id: int, entry: Dict) -> tuple:
+        return (
+            guild_id,
+            _to_timestamp(entry["time_utc"]),
+            entry["phase"]["phase"],
+            entry["phase"]["num"],
+            json.dumps(entry["votes"]),
+        )
+
+    async def append_history(self, guild_id: int, entry: Dict) -> None:
+        row = self._history_row(guild_id, entry)
+        await self._run(
+            lambda conn: conn.execute(
+                "INSERT INTO vote_history (guild_id, time_utc, phase, num, votes) VALUES (?, ?, ?, ?, ?)", row
+            )
+        )
+
+    async def replace_history(self, guild_id: int, entries: List[Dict]) -> None:
+        rows = [self._history_row(guild_id, entry) for entry in entries]
+
+        def write(conn: sqlite3.Connection):
+            conn.execute("DELETE FROM vote_history WHERE guild_id = ?", (guild_id,))
+            conn.executemany(
+                "INSERT INTO vote_history (guild_id, time_utc, phase, num, votes) VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+        await self._transaction(write)
+
+    async def archive_phase(self, guild_id: int, phase: Dict) -> None:
+        await self._transaction(lambda conn: self._archive_phase(conn, guild_id, phase))
+
+    @staticmethod
+    def _archive_phase(conn: sqlite3.Connection, guild_id: int, phase: Dict):
+        key = (guild_id, phase["phase"], phase["num"])
+        rows = conn.execute(
+            "SELECT * FROM vote_history WHERE guild_id = ? AND phase = ? AND num = ? ORDER BY id", key
+        ).fetchall()
+        if not rows:
+            return
+        archived = conn.execute(
+            "SELECT data FROM history_archive WHERE guild_id = ? AND phase = ? AND num = ?", key
+        ).fetchone()
+        entries = merge_history(archived and archived["data"], [_history_entry(row) for row in rows])
+        conn.execute(
+            "INSERT OR REPLACE INTO history_archive (guild_id, phase, num, start_utc, end_utc, data) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                *key,
+                _to_timestamp(entries[0]["time_utc"]),
+                _to_timestamp(entries[-1]["time_utc"]),
+                compress_history(entries),
+            ),
+        )
+        conn.execute("DELETE FROM vote_history WHERE guild_id = ? AND phase = ? AND num = ?", key)
+
+    async def load_archive_index(self, guild_id: int) -> List[Dict]:
+        rows = await self._run(
+            lambda conn: conn.execute(
+                "SELECT phase, num, start_utc, end_utc FROM history_archive WHERE guild_id = ? ORDER BY start_utc",
+                (guild_id,),
+            ).fetchall()
+        )
+        return [
+            {
+                "phase": {"phase": row["phase"], "num": row["num"]},
+                "start": datetime.fromtimestamp(row["start_utc"], tz=pytz.utc).replace(tzinfo=None),
+                "end": datetime.fromtimestamp(row["end_utc"], tz=pytz.utc).replace(tzinfo=None),
+            }
+            for row in rows
+        ]
+
+    async def load_archive(self, guild_id: int, phase: Dict) -> List[Dict]:
+        row = await self._run(
+            lambda conn: conn.execute(
+                "SELECT data FROM history_archive WHERE guild_id = ? AND phase = ? AND num = ?",
+                (guild_id, phase["phase"], phase["num"]),
+            ).fetchone()
+        )
+        return decompress_history(row["data"]) if row else []
+
+    async def load_action_submissions(self) -> Dict[int, Dict]:
+        def read(conn: sqlite3.Connection):
+            return (
+                conn.execute("SELECT * FROM action_submissions").fetchall(),
+                conn.execute("SELECT * FROM action_posts").fetchall(),
+            )
+
+        submission_rows, post_rows = await self._run(read)
+        docs = {}
+        for row in submission_rows:
+            docs.setdefault(row["guild_id"], {"submissions": {}})["submissions"][row["fr_name"]] = json.loads(
+                row["submission"]
+            )
+        for row in post_rows:
+            docs.setdefault(row["guild_id"], {"submissions": {}})["post"] = [row["channel_id"], row["msg_id"]]
+        return docs
+
+    async def save_action_submission(self, guild_id: int, fr_name: str, submission: Dict) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                "INSERT OR REPLACE INTO action_submissions (guild_id, fr_name, submission) VALUES (?, ?, ?)",
+                (guild_id, fr_name, json.dumps(submission)),
+            )
+        )
+
+    async def save_action_post(self, guild_id: int, channel_id: int, msg_id: int) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                "INSERT OR REPLACE INTO action_posts (guild_id, channel_id, msg_id) VALUES (?, ?, ?)",
+                (guild_id, channel_id, msg_id),
+            )
+        )
+
+    async def clear_action_submissions(self, guild_id: int) -> None:
+        await self._transaction(lambda conn: self._clear_actions(conn, guild_id))
+
+    @staticmethod
+    def _clear_actions(conn: sqlite3.Connection, guild_id: int):
+        conn.execute("DELETE FROM action_submissions WHERE guild_id = ?", (guild_id,))
+        conn.execute("DELETE FROM action_posts WHERE guild_id = ?", (guild_id,))
+
+    async def commit_transition(self, transition: PhaseTransition) -> None:
+        guild_id = transition.guild_id
+        votes, history_row = transition.votes, None
+        if transition.history_entry is not None:
+            history_row = self._history_row(guild_id, transition.history_entry)
+
+        def write(conn: sqlite3.Connection):
+            conn.execute(
+                "INSERT OR REPLACE INTO phases (guild_id, phase, num) VALUES (?, ?, ?)",
+                (guild_id, transition.new_phase.phase, transition.new_phase.num),
+            )
+            conn.execute("DELETE FROM deadlines WHERE guild_id = ?", (guild_id,))
+            if votes is not None:
+                self._write_votes(conn, guild_id, votes)
+            if history_row is not None:
+                conn.execute(
+                    "INSERT INTO vote_history (guild_id, time_utc, phase, num, votes) VALUES (?, ?, ?, ?, ?)",
+                    history_row,
+                )
+            if transition.archive_phase is not None:
+                self._archive_phase(conn, guild_id, transition.archive_phase)
+            if transition.players is not None:
+                self._write_players(conn, guild_id, *transition.players)
+            if transition.clear_actions:
+                self._clear_actions(conn, guild_id)
+            if transition.action_submissions:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO action_submissions (guild_id, fr_name, submission) VALUES (?, ?, ?)",
+                    [
+                        (guild_id, fr_name, json.dumps(submission))
+                        for fr_name, submission in transition.action_submissions.items()
+                    ],
+                )
+
+        await self._transaction(write)
+
+    async def get_meta(self, key: str) -> Optional[Any]:
+        row = await self._run(lambda conn: conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone())
+        return json.loads(row["value"]) if row else None
+
+    async def set_meta(self, key: str, value: Any) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value))
+            )
+        )
+
+    def shard_leases(self) -> ShardLeases:
+        return SQLiteShardLeases(self)
+
+    async def close(self) -> None:
+        def close(conn: sqlite3.Connection):
+            conn.close()
+            self._conn = None
+
+        if self._conn is not None:
+            await self._run(close)
+        self._executor.shutdown(wait=True)
+
+
+class SQLiteShardLeases(ShardLeases):
+    # kept in the database itself, so processes sharing one database file see each other's claims
+    def __init__(self, storage: SQLiteStorage):
+        self.storage = storage
+
+    async def claim(self, shard_id: int, owner: str, ttl: int) -> bool:
+        def claim(conn: sqlite3.Connection) -> bool:
+            now = datetime.now(tz=pytz.utc).timestamp()
+            row = conn.execute("SELECT owner, expires_at FROM shard_leases WHERE shard_id = ?", (shard_id,)).fetchone()
+            if row and row["owner"] != owner and row["expires_at"] > now:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO shard_leases (shard_id, owner, expires_at) VALUES (?, ?, ?)",
+                (shard_id, owner, now + ttl),
+            )
+            return True
+
+        return await self.storage._transaction(claim)
+
+    async def release(self, shard_id: int, owner: str) -> None:
+        await self.storage._run(
+            lambda conn: conn.execute("DELETE FROM shard_leases WHERE shard_id = ? AND owner = ?", (shard_id, owner))
+        )
@@ -0,0 +1,67 @@
+from __future__ import annotations
+import re
+from datetime import datetime, timedelta
+from typing import Optional, Union
+
+import dateutil.parser
+import pytz
+from attrs import frozen
+from dateutil.parser import ParserError
+from discord.utils import snowflake_time
+
+from constants import FR_TZ
+from model import GamePhase
+
+# a message link, or a bare message id as copied with developer mode on
+SNOWFLAKE_PATTERN = re.compile(r"(?:https://(?:\w+\.)?discord(?:app)?\.com/channels/(?:\d+|@me)/\d+/)?(\d{15,20})")
+AGO_PATTERN = re.compile(r"(?:(\d+) ?d)? ?(?:(\d+) ?h)? ?(?:(\d+) ?m)? ?(?:(\d+) ?s)? ago")
+BOUNDARY_PATTERN = re.compile(r"(start|end) of (.+)")
+# tried before falling back to dateutil, which is far slower and guesses at anything it is given
+EXPLICIT_FORMATS = ("%B %d, %Y %H:%M:%S", "%B %d, %Y %H:%M", "%b %d, %Y %H:%M:%S", "%b %d, %Y %H:%M")
+
+
+@frozen
+class PhaseBoundary:
+    # only the vote history knows when a phase started or ended, so these are resolved by the vote cog
+    phase: GamePhase
+    end: bool
+
+
+def parse_time_query(s: str, now: datetime) -> Optional[Union[datetime, PhaseBoundary]]:
+    s = s.strip()
+    match = SNOWFLAKE_PATTERN.fullmatch(s)
+    if match:
+        # the send time is part of every message id, so there is no need to fetch the message
+        return snowflake_time(int(match.group(1)))
+    lowered = s.lower()
+    match = AGO_PATTERN.fullmatch(lowered)
+    if match and any(match.groups()):
+        days, hours, minutes, seconds = (int(g or 0) for g in match.groups())
+        return now - timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
+    match = BOUNDARY_PATTERN.fullmatch(lowered)
+    if match:
+        phase = GamePhase.from_str(match.group(2))
+        return PhaseBoundary(phase=phase, end=match.group(1) == "end") if phase else None
+    return parse_frt(s)
+
+
+def parse_frt(s: str) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(s)
+    except ValueError:
+        parsed = None
+    for date_format in EXPLICIT_FORMATS:
+        if parsed:
+            break
+        try:
+            parsed = datetime.strptime(s, date_format)
+        except ValueError:
+            pass
+    if not parsed:
+        try:
+            parsed = dateutil.parser.parse(s)
+        except (ParserError, OverflowError):
+            return None
+    if parsed.tzinfo is None:
+        parsed = FR_TZ.localize(parsed)
+    return parsed.astimezone(pytz.utc)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import dateutil.parser
+import discord
+import pytz
+from attr import define
+from dateutil.parser import ParserError
+
+from constants import FR_TZ
+
+log = logging.getLogger(__name__)
+
+DURATION_PATTERN = re.compile(r"(?:in )?(?:(\d+) ?d)? ?(?:(\d+) ?h)? ?(?:(\d+) ?m)?")
+
+
+class Timers:
+    # one heap and one task for every guild's deadlines and reminders; cancelled or rescheduled entries are
+    # left in the heap and skipped when they surface, so scheduling never has to search it
+    def __init__(self, callback: Callable[[Hashable, datetime], Awaitable[None]]):
+        self.callback = callback
+        self._heap: List[Tuple[datetime, int, Hashable]] = []
+        self._scheduled: Dict[Hashable, datetime] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._firing: set = set()
+
+    def schedule(self, key: Hashable, when: datetime) -> None:
+        self._scheduled[key] = when
+        heapq.heappush(self._heap, (when, next(self._seq), key))
+        if self._heap[0][2] == key:
+            self._wakeup.set()
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    def cancel(self, key: Hashable) -> None:
+        self._scheduled.pop(key, None)
+
+    def get(self, key: Hashable) -> Optional[datetime]:
+        return self._scheduled.get(key)
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def _pop_due(self, now: datetime) -> List[Tuple[Hashable, datetime]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            when, _, key = heapq.heappop(self._heap)
+            if self._scheduled.get(key) == when:
+                del self._scheduled[key]
+                due.append((key, when))
+        return due
+
+    async def _run(self) -> None:
+        while True:
+            now = datetime.now(tz=pytz.utc)
+            for key, when in self._pop_due(now):
+                task = asyncio.create_task(self._fire(key, when))
+                self._firing.add(task)
+                task.add_done_callback(self._firing.discard)
+            while self._heap and self._scheduled.get(self._heap[0][2]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            self._wakeup.clear()
+            timeout = (self._heap[0][0] - now).total_seconds() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, key: Hashable, when: datetime) -> None:
+        try:
+            await self.callback(key, when)
+        except Exception:
+            log.exception("Timer %s failed", key)
+
+
+def parse_deadline(s: str, now: datetime) -> Optional[datetime]:
+    s = s.strip().lower()
+    match = DURATION_PATTERN.fullmatch(s)
+    if s and match and any(match.groups()):
+        days, hours, minutes = (int(g or 0) for g in match.groups())
+        return now + timedelta(days=days, hours=hours, minutes=minutes)
+    try:
+        deadline = dateutil.parser.parse(s)
+    except (ParserError, OverflowError):
+        return None
+    if deadline.tzinfo is None:
+        deadline = FR_TZ.localize(deadline)
+    return deadline.astimezone(pytz.utc)
+
+
+@define
+class ScheduledMessage:
+    channel: discord.abc.Messageable
+    author: discord.abc.User
+    created_at: datetime
+
+    @property
+    def guild(self) -> discord.Guild:
+        return self.channel.guild
+
+
+@define
+class ScheduledContext:
+    # stands in for a command context when the bot acts on its own, i.e. when a deadline passes
+    bot: discord.Client
+    channel: discord.abc.Messageable
+    message: ScheduledMessage
+
+    @classmethod
+    def create(cls, bot: discord.Client, channel: discord.abc.Messageable) -> ScheduledContext:
+        return cls(bot=bot, channel=channel, message=ScheduledMessage(channel, bot.user, datetime.now(tz=pytz.utc)))
+
+    @property
+    def guild(self) -> discord.Guild:
+        return self.channel.guild
+
+    @property
+    def author(self) -> discord.abc.User:
+        return self.message.author
+
+    async def send(self, *args, **kwargs) -> discord.Message:
+        return await self.channel.send(*args, **kwargs)
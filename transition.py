@@ -0,0 +1,35 @@
+from __future__ import annotations
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from attrs import define, Factory
+
+from model import GamePhase
+
+
+@define
+class PhaseTransition:
+    # everything a phase change writes, gathered from every cog so storage can commit it in one go;
+    # announcements are only sent once the commit has succeeded
+    guild_id: int
+    old_phase: GamePhase
+    new_phase: GamePhase
+    votes: Optional[Dict[str, List[str]]] = None
+    history_entry: Optional[Dict] = None
+    archive_phase: Optional[Dict] = None
+    players: Optional[Tuple[List[Dict], Dict[str, str]]] = None
+    clear_actions: bool = False
+    # written after the clear, i.e. when a rollback puts back the submissions of a checkpoint
+    action_submissions: Optional[Dict[str, Dict]] = None
+    announcements: List[Callable[[], Awaitable]] = Factory(list)
+    # put back what each cog changed in memory if the commit fails, so memory never runs ahead of storage
+    undos: List[Callable[[], None]] = Factory(list)
+
+    def announce(self, factory: Callable[[], Awaitable]) -> None:
+        self.announcements.append(factory)
+
+    def on_failure(self, undo: Callable[[], None]) -> None:
+        self.undos.append(undo)
+
+    def revert(self) -> None:
+        for undo in reversed(self.undos):
+            undo()
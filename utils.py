@@ -1,32 +1,95 @@
-from typing import List
+from typing import List, Set
 
+import discord
 from discord import Message
 from discord.ext.commands import Context
 
+from constants import OK_EMOJI, Priority
 from embeds import Embed
 from exceptions import ModBotError
 from model import Player
+from outbound import get_outbound
 
 
 async def send_error_and_delete(message: Message, error_msg: str, delay: int = 10):
-    await message.delete(delay=delay)
-    await message.reply(
+    # error replies are the first thing to give way when we are rate limited, so they are never awaited
+    outbound = get_outbound()
+    outbound.delete(message, delay=delay)
+    reply = outbound.reply(
+        message,
+        priority=Priority.LOW,
         embed=Embed.ErrorEmbed(body=error_msg, footer=f"This message will be deleted in {delay} seconds."),
-        delete_after=delay,
         mention_author=False,
     )
+    reply.add_done_callback(lambda f: f.cancelled() or f.exception() or outbound.delete(f.result(), delay=delay))
 
 
-def check_sensitive_info(ctx: Context, players: List[Player], override_block: str, ignore: List[Player] = None):
+async def send_error(ctx: Context, error_msg: str, delay: int = 10):
+    if ctx.interaction:
+        # slash commands leave no message behind to clean up, so the error is only shown to whoever used it
+        get_outbound().send(ctx, embed=Embed.ErrorEmbed(body=error_msg), ephemeral=True)
+    else:
+        await send_error_and_delete(ctx.message, error_msg, delay=delay)
+
+
+def acknowledge(ctx: Context, body: str):
+    if ctx.interaction:
+        get_outbound().send(ctx, embed=Embed.SuccessEmbed(body=body), ephemeral=True)
+    else:
+        get_outbound().add_reaction(ctx.message, OK_EMOJI)
+
+
+async def check_sensitive_info(ctx: Context, players: List[Player], override_block: str, ignore: List[Player] = None):
+    if override_block == "override":
+        return
     ignore_ids = {player.discord_id for player in ignore} if ignore else set()
-    channel_members = {member.id for member in ctx.channel.members if member.id not in ignore_ids}
-    if override_block != "override" and any(player.discord_id in channel_members for player in players if player.alive):
+    alive_ids = {player.discord_id for player in players if player.alive} - ignore_ids
+    if await any_can_view(ctx.channel, alive_ids):
+        retry = (
+            f"`/{ctx.command.qualified_name}` with `override_block` set to `override`"
+            if ctx.interaction
+            else f"`{ctx.message.content} override`"
+        )
         raise ModBotError(
             "Player info contains sensitive information (and there are alive players that can see this chat)!\n"
-            f"Display it anyway? Try: `{ctx.message.content} override`",
+            f"Display it anyway? Try: {retry}",
         )
 
 
+async def any_can_view(channel: discord.abc.GuildChannel, member_ids: Set[int]) -> bool:
+    # decided from the channel's overwrites so no member cache is needed; a member is only fetched when a role
+    # could be what lets them see the channel
+    undecided = set()
+    for member_id in member_ids:
+        overwrite = channel.overwrites_for(discord.Object(id=member_id))
+        if overwrite.read_messages:
+            return True
+        if overwrite.read_messages is None:
+            undecided.add(member_id)
+    if not undecided:
+        return False
+    guild = channel.guild
+    if channel.permissions_for(guild.default_role).read_messages:
+        return True
+    role_allowed = any(
+        overwrite.read_messages
+        for target, overwrite in channel.overwrites.items()
+        if isinstance(target, discord.Role) and target != guild.default_role
+    )
+    if channel.overwrites_for(guild.default_role).read_messages is False and not role_allowed:
+        return False
+    for member_id in undecided:
+        member = guild.get_member(member_id)
+        if member is None:
+            try:
+                member = await guild.fetch_member(member_id)
+            except discord.NotFound:
+                continue
+        if channel.permissions_for(member).read_messages:
+            return True
+    return False
+
+
 def check_is_mod(ctx: Context):
     return ctx.author.guild_permissions.administrator
 
@@ -0,0 +1,77 @@
+from __future__ import annotations
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, TypeVar
+
+import discord
+from attr import define, Factory
+from discord.ext.commands import Context
+
+from embeds import Embed
+from outbound import get_outbound
+
+T = TypeVar("T")
+
+
+@define
+class PagedListing:
+    version: Hashable
+    page_count: int
+    render_page: Callable[[int], List[Embed]]
+    _pages: Dict[int, List[Embed]] = Factory(dict)
+
+    @classmethod
+    def from_items(
+        cls, version: Hashable, items: Sequence[T], page_size: int, render_page: Callable[[Sequence[T]], List[Embed]]
+    ) -> PagedListing:
+        page_count = max(1, -(-len(items) // page_size))
+        return cls(
+            version=version,
+            page_count=page_count,
+            render_page=lambda page: render_page(items[page * page_size : (page + 1) * page_size]),
+        )
+
+    def clamp(self, page: int) -> int:
+        return min(max(page, 0), self.page_count - 1)
+
+    def get_page(self, page: int) -> List[Embed]:
+        page = self.clamp(page)
+        if page not in self._pages:
+            embeds = self.render_page(page)
+            if self.page_count > 1:
+                embeds[-1].set_footer(text=f"Page {page + 1}/{self.page_count}")
+            self._pages[page] = embeds
+        return self._pages[page]
+
+
+class PaginatedView(discord.ui.View):
+    def __init__(self, listing: PagedListing, page: int = 0, author_id: Optional[int] = None, timeout: float = 300):
+        super().__init__(timeout=timeout)
+        self.listing = listing
+        self.page = listing.clamp(page)
+        self.author_id = author_id
+        self._update_buttons()
+
+    def _update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.listing.page_count - 1
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return self.author_id is None or interaction.user.id == self.author_id
+
+    async def _show(self, interaction: discord.Interaction, page: int):
+        self.page = self.listing.clamp(page)
+        self._update_buttons()
+        await interaction.response.edit_message(embeds=self.listing.get_page(self.page), view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.page - 1)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self._show(interaction, self.page + 1)
+
+
+async def send_paginated(ctx: Context, listing: PagedListing, page: int = 0):
+    page = listing.clamp(page)
+    view = PaginatedView(listing, page=page, author_id=ctx.author.id) if listing.page_count > 1 else None
+    await get_outbound().send(ctx, embeds=listing.get_page(page), view=view)
@@ -0,0 +1,53 @@
+from __future__ import annotations
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+
+class WagonTally:
+    # wagon sizes plus how many wagons have each size, so the biggest wagon is known after every vote
+    # without looking at the others; it can only ever move by one
+    def __init__(self):
+        self.sizes: Dict[str, int] = defaultdict(int)
+        self.buckets: Dict[int, int] = defaultdict(int)
+        self.voter_targets: Dict[str, str] = {}
+        self.top = 0
+
+    @classmethod
+    def from_votes(cls, votes: Dict[str, List[str]]) -> WagonTally:
+        tally = cls()
+        for target, voters in votes.items():
+            for voter in voters:
+                tally.vote(voter, target)
+        return tally
+
+    def vote(self, voter: str, target: Optional[str]) -> Optional[str]:
+        previous = self.voter_targets.pop(voter, None)
+        if previous is not None:
+            self._resize(previous, -1)
+        if target is not None:
+            self.voter_targets[voter] = target
+            self._resize(target, 1)
+        return previous
+
+    def _resize(self, target: str, delta: int) -> None:
+        size = self.sizes[target]
+        if size:
+            self.buckets[size] -= 1
+        size += delta
+        self.sizes[target] = size
+        if size:
+            self.buckets[size] += 1
+        if size > self.top:
+            self.top = size
+        elif not self.buckets[self.top]:
+            self.top -= 1
+
+    def leader(self) -> Optional[Tuple[str, int]]:
+        if not self.top:
+            return None
+        # only called once a wagon is known to be at majority
+        return next((target, size) for target, size in self.sizes.items() if size == self.top)
+
+
+def majority(alive: int) -> int:
+    return alive // 2 + 1